@@ -0,0 +1,93 @@
+"""
+Benchmark da exportação unificada sobre registros sintéticos do FormDoc.
+
+Compara a implementação antiga (pd.json_normalize por arquivo + pd.concat) com o
+StreamingExporter (CSV e, se o pyarrow estiver instalado, Parquet). Cada variante roda
+em um processo próprio para que o pico de memória (RSS) seja medido isoladamente.
+
+Uso: python benchmarks/bench_export.py --records 10000 100000
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+def legacy_unified_csv(json_dir, unified_csv_path):
+    import warnings
+    import pandas as pd
+
+    warnings.simplefilter("ignore", FutureWarning)
+
+    dataframes = []
+    for json_file in Path(json_dir).glob("*.json"):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            json_data = json.load(f)
+        dataframes.append(pd.json_normalize(json_data))
+    pd.concat(dataframes, ignore_index=True).to_csv(unified_csv_path, index=False, encoding='utf-8')
+
+def streaming_export(json_dir, output_path, fmt):
+    from export import StreamingExporter
+
+    StreamingExporter().export(json_dir, output_path, fmt=fmt)
+
+def _run(variant, json_dir, output_dir, results):
+    sys.path.insert(0, str(SRC_DIR))
+    start = time.perf_counter()
+    if variant == "legacy-csv":
+        legacy_unified_csv(json_dir, Path(output_dir) / "legacy.csv")
+    elif variant == "streaming-csv":
+        streaming_export(json_dir, Path(output_dir) / "streaming.csv", "csv")
+    else:
+        streaming_export(json_dir, Path(output_dir) / "streaming-parquet", "parquet")
+    elapsed = time.perf_counter() - start
+    results.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+def generate(json_dir, count, seed=0):
+    from synthetic import synthetic_record
+
+    rng = random.Random(seed)
+    for i in range(count):
+        with open(Path(json_dir) / f"paciente_{i:06d}.json", 'w', encoding='utf-8') as f:
+            json.dump(synthetic_record(rng=rng), f, ensure_ascii=False)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, nargs="+", default=[10000])
+    parser.add_argument("--skip-legacy", action="store_true", help="Não roda a implementação antiga")
+    args = parser.parse_args()
+
+    variants = ["streaming-csv"]
+    try:
+        import pyarrow  # noqa: F401
+        variants.append("streaming-parquet")
+    except ImportError:
+        print("pyarrow not installed; skipping Parquet")
+    if not args.skip_legacy:
+        variants.insert(0, "legacy-csv")
+
+    context = multiprocessing.get_context("spawn")
+    for count in args.records:
+        with tempfile.TemporaryDirectory() as tmp:
+            json_dir = Path(tmp) / "json"
+            json_dir.mkdir()
+            generate(json_dir, count)
+            print(f"\n{count} records")
+            for variant in variants:
+                results = context.Queue()
+                process = context.Process(target=_run, args=(variant, json_dir, tmp, results))
+                process.start()
+                elapsed, peak_mb = results.get()
+                process.join()
+                print(f"  {variant:18s} {elapsed:8.2f}s  {count / elapsed:9.0f} rec/s  peak RSS {peak_mb:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
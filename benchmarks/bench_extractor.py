@@ -0,0 +1,67 @@
+"""
+Micro-benchmark do custo por chamada de montagem do prompt, sem rede.
+
+Compara o caminho antigo de process_medical_information (templates, parser, instruções
+de formato e cliente ChatOpenAI recriados a cada documento) com MedicalExtractor, que
+monta tudo uma vez e só formata o texto extraído em cada chamada.
+
+Uso: python benchmarks/bench_extractor.py [--calls 200]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from langchain.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate, ChatPromptTemplate
+from langchain.output_parsers import PydanticOutputParser
+from langchain_openai import ChatOpenAI
+from models import FormDoc
+from process import MedicalExtractor, PREAMBLE, POSTAMBLE, SYSTEM_TEMPLATE, HUMAN_TEMPLATE, MODEL_NAME
+
+SAMPLE_TEXT = "Nome: Maria da Silva   Registro: 123456   Local: IMIP\n" * 40
+
+def legacy_request(extracted_text):
+    system_message_prompt = SystemMessagePromptTemplate.from_template(SYSTEM_TEMPLATE)
+    human_message_prompt = HumanMessagePromptTemplate.from_template(HUMAN_TEMPLATE)
+    parser = PydanticOutputParser(pydantic_object=FormDoc)
+    chat_prompt = ChatPromptTemplate.from_messages([system_message_prompt, human_message_prompt])
+    request = chat_prompt.format_prompt(
+        preamble=PREAMBLE,
+        format_instructions=parser.get_format_instructions(),
+        extracted_text=extracted_text,
+        postamble=POSTAMBLE
+    ).to_messages()
+    ChatOpenAI(model=MODEL_NAME, temperature=0.0)
+    return request
+
+def time_per_call(fn, calls):
+    fn(SAMPLE_TEXT)
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn(SAMPLE_TEXT)
+    return (time.perf_counter() - start) / calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    # O cliente não faz requisições aqui; a chave só precisa existir para a construção
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    extractor = MedicalExtractor()
+    extractor.chat
+    assert legacy_request(SAMPLE_TEXT) == extractor.build_request(SAMPLE_TEXT)
+
+    legacy = time_per_call(legacy_request, args.calls)
+    reused = time_per_call(extractor.build_request, args.calls)
+    print(f"legacy per-call overhead:    {legacy * 1000:8.3f} ms")
+    print(f"MedicalExtractor per call:   {reused * 1000:8.3f} ms")
+    print(f"speed-up:                    {legacy / reused:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
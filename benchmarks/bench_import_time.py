@@ -0,0 +1,84 @@
+"""
+Benchmark do tempo de inicialização dos comandos do main.py (python -X importtime).
+
+Roda cada comando leve (--help, status, export e extract sem PDFs) em um diretório
+temporário e relata o tempo total de importação e os módulos mais caros. Sai com código
+1 se algum comando importar um módulo pesado que não usa (langchain, pandas, pdf2image,
+...) ou se passar de --max-ms, para que regressões no tempo de inicialização sejam
+pegas no CI ou antes de um commit.
+
+Uso: python benchmarks/bench_import_time.py [--max-ms 1500] [--top 5]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+MAIN = Path(__file__).resolve().parent.parent / "src" / "main.py"
+
+# Dependências pesadas que só o estágio correspondente deve importar
+LLM_MODULES = {"langchain", "langchain_core", "langchain_openai", "openai", "tiktoken"}
+OCR_MODULES = {"pdf2image", "PIL", "unstract"}
+EXTRA_MODULES = {"pandas", "pyarrow"}
+
+COMMANDS = {
+    "--help": (["--help"], LLM_MODULES | OCR_MODULES | EXTRA_MODULES | {"sqlalchemy", "pydantic"}),
+    "status": (["status"], LLM_MODULES | OCR_MODULES | EXTRA_MODULES | {"pydantic"}),
+    "export": (["export", "--json-dir", "json", "--output", "unified.csv"],
+               LLM_MODULES | OCR_MODULES | EXTRA_MODULES | {"sqlalchemy"}),
+    "extract": (["extract", "--text-backend", "native", "--no-ocr-cache"],
+                LLM_MODULES | OCR_MODULES | EXTRA_MODULES),
+}
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+def import_times(args, cwd):
+    """Roda main.py com -X importtime; retorna {módulo: (próprio_us, cumulativo_us, profundidade)}."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    process = subprocess.run([sys.executable, "-X", "importtime", str(MAIN), *args], cwd=cwd, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        tail = "\n".join(line for line in process.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"main.py {' '.join(args)} exited with {process.returncode}:\n{tail[-2000:]}")
+    modules = {}
+    for line in process.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules[name] = (int(own), int(cumulative), len(indent))
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-ms", type=float, default=1500,
+                        help="Tempo máximo de importação por comando, em ms (padrão: 1500)")
+    parser.add_argument("--top", type=int, default=5, help="Módulos de topo mais caros a listar")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        (Path(tmp) / "json").mkdir()
+        for label, (command, forbidden) in COMMANDS.items():
+            modules = import_times(command, tmp)
+            total_ms = sum(own for own, _, _ in modules.values()) / 1000
+            loaded = sorted({name.split(".")[0] for name in modules} & forbidden)
+            print(f"{label:10s} {total_ms:7.1f} ms, {len(modules)} modules")
+            top = sorted(((cumulative, name) for name, (_, cumulative, depth) in modules.items() if depth == 1),
+                         reverse=True)[:args.top]
+            for cumulative, name in top:
+                print(f"{'':10s} {cumulative / 1000:7.1f} ms  {name}")
+            if loaded:
+                failures.append(f"{label}: imports {', '.join(loaded)}")
+            if total_ms > args.max_ms:
+                failures.append(f"{label}: {total_ms:.0f} ms > {args.max_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
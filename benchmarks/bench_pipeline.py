@@ -0,0 +1,273 @@
+"""
+Benchmark de ponta a ponta do pipeline sobre um corpus sintético de formulários preenchidos.
+
+Gera --docs formulários (PDF com camada de texto + gabarito JSON do FormDoc), roda o
+Pipeline (OCR -> LLM) com backends simulados de latência configurável e relata docs/s,
+percentis de latência por estágio, pico de memória (RSS) e acurácia por campo. O OCR
+simulado lê o texto do PDF; o LLM simulado (FakeChatModel com read_text) lê os pares
+"campo: valor" do prompt, de modo que a acurácia mede o caminho real de prompt, parse,
+validação e reparo de process.py/sections.py.
+
+Cada execução pode ser salva em benchmarks/results/ (--save) e comparada com uma execução
+de referência (--baseline arquivo.json ou latest); com --baseline, sai com código 1 se
+docs/s, latências, memória ou acurácia piorarem além da tolerância.
+
+Uso: python benchmarks/bench_pipeline.py [--docs 200] [--llm-latency 0.2] [--save] [--baseline latest]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from llm_backends import FakeChatModel
+from metrics import configure_tracing
+from pipeline import run_batch
+from process import MedicalExtractor
+from scheduler import RateLimitedScheduler
+from sections import RepairingExtractor, SectionedExtractor
+from synthetic import field_accuracy, read_text_pdf, render_form_text, synthetic_record, write_text_pdf
+from text_backends import PAGE_SEPARATOR, NativeTextBackend, TextBackend
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+# Arquivos cujas mudanças o benchmark acompanha (o hash de cada um vai no resultado)
+TRACKED_SOURCES = ["src/process.py", "src/sections.py", "src/pipeline.py", "src/utils.py", "src/models.py"]
+# Latências abaixo disto (s) são ruído demais para comparar em termos relativos
+MIN_COMPARABLE_SECONDS = 0.001
+
+class StubTextBackend(TextBackend):
+    """OCR simulado: espera latency ± jitter segundos e devolve o texto do PDF gerado por write_text_pdf."""
+    name = "stub"
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+
+    async def _extract(self, pdf_path):
+        delay = max(0.0, self.latency + (self.rng.random() * 2 - 1) * self.jitter)
+        await asyncio.sleep(delay)
+        pages = await asyncio.to_thread(read_text_pdf, pdf_path)
+        return PAGE_SEPARATOR.join(pages)
+
+def generate_corpus(corpus_dir, docs, seed=0, null_rate=0.1):
+    """
+    Grava doc_NNNNN.pdf e doc_NNNNN.json (gabarito) em corpus_dir. Um corpus já gerado com
+    os mesmos parâmetros é reaproveitado.
+
+    :return: Lista de caminhos dos PDFs.
+    """
+    corpus_dir = Path(corpus_dir)
+    manifest_path = corpus_dir / "manifest.json"
+    manifest = {"docs": docs, "seed": seed, "null_rate": null_rate}
+    pdf_paths = [corpus_dir / f"doc_{i:05d}.pdf" for i in range(docs)]
+    if manifest_path.exists() and json.loads(manifest_path.read_text(encoding='utf-8')) == manifest:
+        return pdf_paths
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    for pdf_path in pdf_paths:
+        record = synthetic_record(rng=rng, null_rate=null_rate)
+        write_text_pdf(pdf_path, render_form_text(record))
+        pdf_path.with_suffix('.json').write_text(json.dumps(record, ensure_ascii=False), encoding='utf-8')
+    manifest_path.write_text(json.dumps(manifest), encoding='utf-8')
+    return pdf_paths
+
+def make_extractor(args):
+    chat = FakeChatModel(
+        latency=args.llm_latency, latency_jitter=args.llm_jitter, error_rate=args.llm_error_rate,
+        invalid_rate=args.llm_invalid_rate, read_text=True, field_error_rate=args.field_error_rate,
+        seed=args.seed
+    )
+    scheduler = RateLimitedScheduler("LLM", max_concurrency=args.llm_concurrency * 16, max_backoff=1)
+    if args.mode == "sections":
+        return SectionedExtractor(chat=chat, scheduler=scheduler)
+    if args.mode == "full":
+        return MedicalExtractor(chat=chat, scheduler=scheduler, compact=args.compact)
+    return RepairingExtractor(chat=chat, scheduler=scheduler, compact=args.compact)
+
+def source_versions():
+    versions = {}
+    for relative in TRACKED_SOURCES:
+        path = ROOT / relative
+        if path.exists():
+            versions[relative] = hashlib.sha256(path.read_bytes()).hexdigest()[:12]
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--", *TRACKED_SOURCES], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {"commit": commit, "dirty": dirty, "sources": versions}
+
+def run_benchmark(args, pdf_paths, work_dir):
+    txt_dir = Path(work_dir) / "txt"
+    json_dir = Path(work_dir) / "json"
+    txt_dir.mkdir(parents=True, exist_ok=True)
+    json_dir.mkdir(parents=True, exist_ok=True)
+
+    tracer = configure_tracing(None)
+    if args.ocr == "native":
+        text_backend = NativeTextBackend()
+    else:
+        text_backend = StubTextBackend(args.ocr_latency, args.ocr_jitter, args.seed)
+    extractor = make_extractor(args)
+    stats = asyncio.run(run_batch(
+        pdf_paths, txt_dir, json_dir, ocr_concurrency=args.ocr_concurrency, llm_concurrency=args.llm_concurrency,
+        extract_fn=text_backend.aextract, structure_fn=extractor.aextract
+    ))
+
+    scores = []
+    for pdf_path in pdf_paths:
+        truth = json.loads(pdf_path.with_suffix('.json').read_text(encoding='utf-8'))
+        output_path = json_dir / f"{pdf_path.stem}.json"
+        predicted = json.loads(output_path.read_text(encoding='utf-8')) if output_path.exists() else {}
+        scores.append(field_accuracy(predicted, truth))
+
+    stages = {}
+    for stage in sorted(tracer.registry.histograms):
+        p50, p95, p99 = tracer.registry.percentiles(stage, (0.5, 0.95, 0.99))
+        stages[stage] = {"count": len(tracer.registry.recent[stage]), "p50": p50, "p95": p95, "p99": p99}
+    tracer.close()
+
+    return {
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "version": source_versions(),
+        "config": {key: getattr(args, key) for key in (
+            "docs", "seed", "mode", "compact", "ocr", "ocr_latency", "ocr_jitter", "llm_latency", "llm_jitter",
+            "llm_error_rate", "llm_invalid_rate", "field_error_rate", "ocr_concurrency", "llm_concurrency"
+        )},
+        "structured": stats.structured,
+        "failed": stats.failed,
+        "elapsed": stats.elapsed,
+        "docs_per_second": stats.structured / stats.elapsed if stats.elapsed else 0.0,
+        "stages": stages,
+        # ru_maxrss é em KB no Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "field_accuracy": sum(scores) / len(scores) if scores else 0.0,
+    }
+
+def print_result(result):
+    print(f"{result['structured']}/{result['config']['docs']} structured, {result['failed']} failed "
+          f"in {result['elapsed']:.2f}s: {result['docs_per_second']:.1f} docs/s")
+    print(f"field accuracy {result['field_accuracy']:.2%}, peak RSS {result['peak_rss_mb']:.0f} MB")
+    for stage, values in result["stages"].items():
+        print(f"  {stage:10s} {values['count']:6d} spans  p50 {values['p50'] * 1000:8.1f} ms  "
+              f"p95 {values['p95'] * 1000:8.1f} ms  p99 {values['p99'] * 1000:8.1f} ms")
+
+def compare(result, baseline, tolerance, accuracy_tolerance):
+    """
+    Compara com a execução de referência e imprime uma linha por métrica.
+
+    :return: Lista de regressões (texto).
+    """
+    changed = [key for key in result["config"] if result["config"][key] != baseline["config"].get(key)]
+    if changed:
+        print(f"WARNING: configuration differs from the baseline ({', '.join(changed)}); comparison is approximate")
+    sources = baseline["version"]["sources"]
+    modified = [name for name, digest in result["version"]["sources"].items() if sources.get(name) != digest]
+    print(f"baseline {baseline['timestamp']} ({baseline['version']['commit']}); "
+          f"changed since: {', '.join(modified) or 'none of the tracked sources'}")
+
+    # (nome, atual, referência, maior é melhor)
+    metrics = [
+        ("docs/s", result["docs_per_second"], baseline["docs_per_second"], True),
+        ("peak RSS MB", result["peak_rss_mb"], baseline["peak_rss_mb"], False),
+    ]
+    for stage, values in result["stages"].items():
+        reference = baseline["stages"].get(stage)
+        if reference is None:
+            continue
+        for quantile in ("p50", "p95"):
+            if reference[quantile] >= MIN_COMPARABLE_SECONDS:
+                metrics.append((f"{stage} {quantile} s", values[quantile], reference[quantile], False))
+
+    regressions = []
+    for name, current, reference, higher_is_better in metrics:
+        change = (current - reference) / reference if reference else 0.0
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(f"{name} {reference:.4g} -> {current:.4g} ({change:+.1%})")
+        print(f"  {name:24s} {reference:12.4g} -> {current:12.4g} {change:+8.1%} {flag}")
+    accuracy_drop = baseline["field_accuracy"] - result["field_accuracy"]
+    flag = "REGRESSION" if accuracy_drop > accuracy_tolerance else ""
+    if flag:
+        regressions.append(f"field accuracy {baseline['field_accuracy']:.2%} -> {result['field_accuracy']:.2%}")
+    print(f"  {'field accuracy':24s} {baseline['field_accuracy']:12.2%} -> {result['field_accuracy']:12.2%} "
+          f"{-accuracy_drop * 100:+7.2f}pp {flag}")
+    return regressions
+
+def load_baseline(value):
+    if value == "latest":
+        results = sorted(RESULTS_DIR.glob("*.json"))
+        if not results:
+            raise SystemExit(f"No saved results in {RESULTS_DIR}; run with --save first")
+        value = results[-1]
+    return json.loads(Path(value).read_text(encoding='utf-8'))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", help="Onde gerar/reaproveitar o corpus (padrão: diretório temporário)")
+    parser.add_argument("--mode", choices=["repair", "full", "sections"], default="repair")
+    parser.add_argument("--compact", action="store_true", help="Instruções de formato compactas")
+    parser.add_argument("--ocr", choices=["stub", "native"], default="stub",
+                        help="native usa o pdftotext de verdade nos PDFs gerados")
+    parser.add_argument("--ocr-latency", type=float, default=0.05)
+    parser.add_argument("--ocr-jitter", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Chamadas que falham (500)")
+    parser.add_argument("--llm-invalid-rate", type=float, default=0.0, help="Respostas com JSON truncado")
+    parser.add_argument("--field-error-rate", type=float, default=0.0, help="Valores lidos errado pelo LLM simulado")
+    parser.add_argument("--ocr-concurrency", type=int, default=4)
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--label", default="", help="Descrição gravada junto com o resultado")
+    parser.add_argument("--save", nargs="?", const="", metavar="PATH",
+                        help="Grava o resultado (padrão: benchmarks/results/<data>-<commit>.json)")
+    parser.add_argument("--baseline", metavar="PATH|latest", help="Compara com um resultado salvo")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Piora relativa tolerada em docs/s, latências e memória (padrão: 0.10)")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.005,
+                        help="Queda absoluta tolerada na acurácia por campo (padrão: 0.005)")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        pdf_paths = generate_corpus(args.corpus_dir or Path(tmp) / "corpus", args.docs, args.seed)
+        print(f"corpus: {len(pdf_paths)} PDF(s) ready in {time.perf_counter() - start:.1f}s")
+        result = run_benchmark(args, pdf_paths, Path(tmp) / "work")
+
+    print_result(result)
+    if args.save is not None:
+        save_path = Path(args.save) if args.save else (
+            RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{result['version']['commit'] or 'nogit'}.json"
+        )
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        save_path.write_text(json.dumps(result, indent=2), encoding='utf-8')
+        print(f"saved {save_path}")
+    if baseline is not None:
+        regressions = compare(result, baseline, args.tolerance, args.accuracy_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
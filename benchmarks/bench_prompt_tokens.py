@@ -0,0 +1,94 @@
+"""
+Benchmark das instruções de formato: JSON schema do PydanticOutputParser vs render_compact_schema.
+
+Relata os tokens de entrada por documento (tiktoken) de cada variante e, com --accuracy,
+estrutura um conjunto de fixtures com as duas e compara com o gabarito campo a campo
+(acurácia por campo, respostas válidas na primeira passada e tempo por documento).
+
+Fixtures: pares <nome>.txt / <nome>.json (gabarito) em --fixtures; sem --fixtures, são
+gerados --docs formulários sintéticos. A acurácia só é significativa com um LLM real
+(LLM_BACKEND=openai ou openai-compatible); com LLM_BACKEND=fake ela mede apenas o caminho.
+
+Uso: python benchmarks/bench_prompt_tokens.py [--accuracy] [--fixtures dir] [--docs 10]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from config import load_environment
+from scheduler import count_message_tokens
+from sections import RepairingExtractor
+from synthetic import field_accuracy, render_form_text, synthetic_record
+
+def load_fixtures(fixtures_dir, docs, seed):
+    if fixtures_dir:
+        pairs = []
+        for txt_path in sorted(Path(fixtures_dir).glob('*.txt')):
+            truth_path = txt_path.with_suffix('.json')
+            if truth_path.exists():
+                pairs.append((txt_path.stem, txt_path.read_text(encoding='utf-8'),
+                              json.loads(truth_path.read_text(encoding='utf-8'))))
+        return pairs
+    rng = random.Random(seed)
+    pairs = []
+    for i in range(docs):
+        record = synthetic_record(rng=rng)
+        pairs.append((f"synthetic_{i}", render_form_text(record), record))
+    return pairs
+
+async def evaluate(extractor, fixtures, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    scores = []
+
+    async def run_one(text, truth):
+        async with semaphore:
+            try:
+                predicted = await extractor.aextract(text)
+            except Exception:
+                predicted = {}
+            scores.append(field_accuracy(predicted, truth))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_one(text, truth) for _, text, truth in fixtures))
+    return sum(scores) / len(scores), (time.perf_counter() - start) / len(fixtures)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixtures", help="Diretório com pares .txt/.json")
+    parser.add_argument("--docs", type=int, default=10, help="Fixtures sintéticas, sem --fixtures")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accuracy", action="store_true", help="Estrutura as fixtures com o LLM configurado")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    load_environment()
+    fixtures = load_fixtures(args.fixtures, args.docs, args.seed)
+    if not fixtures:
+        parser.error("no fixtures found")
+    variants = {"json-schema": RepairingExtractor(), "compact": RepairingExtractor(compact=True)}
+
+    print(f"{len(fixtures)} fixture(s)")
+    baseline = None
+    for label, extractor in variants.items():
+        instructions = count_message_tokens(extractor.build_request(""), extractor.model_name)
+        per_doc = sum(count_message_tokens(extractor.build_request(text), extractor.model_name)
+                      for _, text, _ in fixtures) / len(fixtures)
+        baseline = baseline or per_doc
+        line = (f"{label:12s} prompt without text {instructions:6d} tokens, "
+                f"per document {per_doc:8.0f} tokens ({per_doc / baseline:5.1%} of json-schema)")
+        if args.accuracy:
+            accuracy, seconds = asyncio.run(evaluate(extractor, fixtures, args.concurrency))
+            stats = extractor.parse_stats
+            line += (f", field accuracy {accuracy:6.1%}, valid on first pass "
+                     f"{stats.valid}/{stats.responses}, {seconds:.2f}s/doc")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark da rasterização + pré-processamento de PDFs (requer o poppler instalado).
+
+Compara a implementação antiga (todas as páginas em memória a 400 dpi, processadas em
+sequência) com rasterizar_pdfs (uma página por vez, pool de processos). Relata
+páginas/s e pico de RSS, e confere se os PNGs gerados são idênticos byte a byte.
+
+Uso: python benchmarks/bench_rasterize.py [--docs 4] [--pages 6] [--dpi 400] [--pdf arquivo.pdf ...]
+"""
+import argparse
+import multiprocessing
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+def legacy_convert(pdf_path, output_dir, dpi):
+    from pdf2image import convert_from_path
+    from PIL import ImageEnhance, ImageFilter
+
+    paginas = convert_from_path(pdf_path, dpi=dpi)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for i, pagina in enumerate(paginas):
+        imagem = pagina.convert('L')
+        imagem = ImageEnhance.Sharpness(imagem).enhance(1.0)
+        imagem = imagem.filter(ImageFilter.DETAIL)
+        imagem = imagem.point(lambda x: 0 if x < 128 else 255, '1')
+        imagem.save(output_dir / f"pagina_{i + 1}.png", 'PNG')
+
+def _run(variant, pdfs, output_root, dpi, results):
+    sys.path.insert(0, str(SRC_DIR))
+    start = time.perf_counter()
+    if variant == "legacy":
+        for pdf_path in pdfs:
+            legacy_convert(pdf_path, Path(output_root) / variant / Path(pdf_path).stem, dpi)
+    else:
+        from utils import rasterizar_pdfs
+
+        rasterizar_pdfs([(pdf_path, Path(output_root) / variant / Path(pdf_path).stem) for pdf_path in pdfs], dpi=dpi)
+    elapsed = time.perf_counter() - start
+    peak_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    peak_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    results.put((elapsed, peak_self, peak_children))
+
+def synthetic_pdf(path, pages, seed):
+    """PDF de teste: páginas A4 com ruído e texto, salvas como imagens pelo Pillow."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    imagens = []
+    for _ in range(pages):
+        imagem = Image.effect_noise((1240, 1754), 40).convert('RGB')
+        desenho = ImageDraw.Draw(imagem)
+        for _ in range(400):
+            desenho.text((rng.randint(0, 1200), rng.randint(0, 1740)), "SIM  NÃO  123,4", fill=(0, 0, 0))
+        imagens.append(imagem)
+    imagens[0].save(path, "PDF", resolution=150, save_all=True, append_images=imagens[1:])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--docs", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--dpi", type=int, default=400)
+    parser.add_argument("--pdf", nargs="*", help="PDFs reais a usar no lugar dos sintéticos")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if args.pdf:
+            pdfs = [str(Path(p).resolve()) for p in args.pdf]
+        else:
+            pdfs = []
+            for i in range(args.docs):
+                pdf_path = tmp / f"form_{i}.pdf"
+                synthetic_pdf(pdf_path, args.pages, seed=i)
+                pdfs.append(str(pdf_path))
+
+        for variant in ("legacy", "streaming"):
+            results = context.Queue()
+            process = context.Process(target=_run, args=(variant, pdfs, tmp, args.dpi, results))
+            process.start()
+            elapsed, peak_self, peak_children = results.get()
+            process.join()
+            pages = len(list((tmp / variant).glob("*/*.png")))
+            print(f"{variant:10s} {pages} pages in {elapsed:7.2f}s  {pages / elapsed:6.2f} pages/s  "
+                  f"peak RSS {peak_self:7.1f} MB (largest worker {peak_children:7.1f} MB)")
+
+        legacy_pngs = sorted(p.relative_to(tmp / "legacy") for p in (tmp / "legacy").glob("*/*.png"))
+        identical = all(
+            (tmp / "legacy" / rel).read_bytes() == (tmp / "streaming" / rel).read_bytes()
+            for rel in legacy_pngs
+        ) and legacy_pngs == sorted(p.relative_to(tmp / "streaming") for p in (tmp / "streaming").glob("*/*.png"))
+        print(f"identical PNGs: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from config import load_environment
+from ledger import DUPLICATE
+from llm_backends import FakeLLMError, llm_backend_name, make_fake_chat_model
+from process import MODEL_NAME, clean_and_parse_response, get_default_extractor, strip_fences
+from utils import save_json
+
+ENDPOINT = "/v1/chat/completions"
+# Limite de requisições por arquivo da Batch API da OpenAI
+MAX_REQUESTS = 50000
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+def batch_line(custom_id, messages, model_name=MODEL_NAME, temperature=0.0):
+    """Uma linha do arquivo de entrada da Batch API com a mesma requisição que process_medical_information enviaria."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": {
+            "model": model_name,
+            "temperature": temperature,
+            "messages": [{"role": _ROLES[message.type], "content": message.content} for message in messages],
+        },
+    }
+
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def write_batch_file(txt_paths, output_path, extractor=None, digests=None):
+    """
+    Grava o arquivo JSONL de um job a partir dos textos extraídos; o custom_id de cada
+    requisição é o nome do arquivo de texto sem extensão.
+
+    :param digests: Dict opcional preenchido com {custom_id: SHA-256 do texto enviado}.
+    :return: Lista de custom_ids, na ordem do arquivo.
+    """
+    extractor = extractor or get_default_extractor()
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    custom_ids = []
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for txt_path in txt_paths:
+            text = Path(txt_path).read_text(encoding='utf-8')
+            messages = extractor.build_request(text)
+            line = batch_line(Path(txt_path).stem, messages, extractor.model_name, extractor.temperature)
+            if digests is not None:
+                digests[line["custom_id"]] = text_digest(text)
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            custom_ids.append(line["custom_id"])
+    return custom_ids
+
+class BatchTransport:
+    """Interface de submissão/consulta de jobs: submit -> batch_id, status -> str, results -> linhas de saída."""
+    name = "base"
+
+    def submit(self, input_path):
+        raise NotImplementedError
+
+    def status(self, batch_id):
+        raise NotImplementedError
+
+    def results(self, batch_id):
+        raise NotImplementedError
+
+class OpenAIBatchTransport(BatchTransport):
+    """Batch API da OpenAI (ou de um servidor compatível em base_url)."""
+    name = "openai"
+
+    def __init__(self, client=None, base_url=None, api_key=None):
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(base_url=base_url, api_key=api_key)
+        self.client = client
+
+    def submit(self, input_path):
+        with open(input_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint=ENDPOINT, completion_window="24h"
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+class FakeBatchTransport(BatchTransport):
+    """
+    Transporte local para testes: guarda o job em work_dir, informa "in_progress" nas
+    primeiras polls consultas e responde cada requisição com o FakeChatModel, no mesmo
+    formato do arquivo de saída da Batch API.
+    """
+    name = "fake"
+
+    def __init__(self, work_dir="scans/batch/fake", model=None, polls=1):
+        self.work_dir = Path(work_dir)
+        self.model = model or make_fake_chat_model()
+        self.polls = polls
+
+    def _state_path(self, batch_id):
+        return self.work_dir / f"{batch_id}.state.json"
+
+    def submit(self, input_path):
+        from shutil import copyfile
+
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        batch_id = f"batch_fake_{uuid.uuid4().hex[:12]}"
+        copyfile(input_path, self.work_dir / f"{batch_id}.jsonl")
+        self._state_path(batch_id).write_text(json.dumps({"polls": 0}), encoding='utf-8')
+        return batch_id
+
+    def status(self, batch_id):
+        state = json.loads(self._state_path(batch_id).read_text(encoding='utf-8'))
+        state["polls"] += 1
+        self._state_path(batch_id).write_text(json.dumps(state), encoding='utf-8')
+        return "completed" if state["polls"] > self.polls else "in_progress"
+
+    def results(self, batch_id):
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        classes = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+        with open(self.work_dir / f"{batch_id}.jsonl", encoding='utf-8') as f:
+            for line in f:
+                request = json.loads(line)
+                messages = [classes[m["role"]](content=m["content"]) for m in request["body"]["messages"]]
+                try:
+                    message = self.model._respond(messages).generations[0].message
+                except FakeLLMError as e:
+                    yield {"custom_id": request["custom_id"], "response": None,
+                           "error": {"code": str(e.status_code), "message": str(e)}}
+                    continue
+                yield {"custom_id": request["custom_id"], "error": None, "response": {
+                    "status_code": 200,
+                    "body": {
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": message.content}}],
+                        "usage": {"prompt_tokens": message.usage_metadata["input_tokens"],
+                                  "completion_tokens": message.usage_metadata["output_tokens"]},
+                    },
+                }}
+
+def make_batch_transport(batch_dir="scans/batch"):
+    """Transporte conforme LLM_BACKEND: fake usa o FakeBatchTransport; os demais, a Batch API."""
+    backend = llm_backend_name()
+    if backend == "fake":
+        return FakeBatchTransport(Path(batch_dir) / "fake")
+    if backend == "openai-compatible":
+        return OpenAIBatchTransport(base_url=os.getenv("LLM_BASE_URL"), api_key=os.getenv("LLM_API_KEY") or "not-needed")
+    return OpenAIBatchTransport()
+
+def submit_batch(txt_dir, json_dir, transport, batch_dir="scans/batch", skip_existing=True, max_requests=MAX_REQUESTS):
+    """
+    Monta e submete um job com os textos de txt_dir. O registro do job é salvo em
+    batch_dir/<batch_id>.json para que collect_batch possa recuperá-lo mais tarde.
+
+    :param skip_existing: Ignora textos que já têm JSON em json_dir.
+    :param max_requests: Máximo de requisições no job; o restante fica para o próximo.
+    :return: batch_id, ou None se não houver textos a enviar.
+    """
+    batch_dir = Path(batch_dir)
+    txt_paths = sorted(Path(txt_dir).glob('*.txt'))
+    if skip_existing:
+        txt_paths = [p for p in txt_paths if not (Path(json_dir) / f"{p.stem}.json").exists()]
+    if not txt_paths:
+        logging.info("No texts to submit.")
+        return None
+    if len(txt_paths) > max_requests:
+        logging.warning(f"{len(txt_paths)} texts pending; submitting the first {max_requests}")
+        txt_paths = txt_paths[:max_requests]
+
+    input_path = batch_dir / f"input-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+    digests = {}
+    custom_ids = write_batch_file(txt_paths, input_path, digests=digests)
+    batch_id = transport.submit(input_path)
+    # Os hashes dos textos enviados permitem a collect_batch gravar as respostas no cache do LLM
+    record = {"batch_id": batch_id, "transport": transport.name, "input_file": str(input_path),
+              "requests": len(custom_ids), "submitted_at": time.time(), "texts": digests}
+    (batch_dir / f"{batch_id}.json").write_text(json.dumps(record, indent=4), encoding='utf-8')
+    logging.info(f"Submitted batch {batch_id} with {len(custom_ids)} request(s)")
+    return batch_id
+
+def wait_for_batch(batch_id, transport, poll_interval=60, timeout=None):
+    """Consulta o status até o job terminar; retorna o status final."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        status = transport.status(batch_id)
+        if status in TERMINAL_STATUSES:
+            logging.info(f"Batch {batch_id} {status}")
+            return status
+        if deadline is not None and time.monotonic() >= deadline:
+            raise RuntimeError(f"Batch {batch_id} still {status} after {timeout}s")
+        logging.info(f"Batch {batch_id} {status}; checking again in {poll_interval}s")
+        time.sleep(poll_interval)
+
+def batch_cache_targets():
+    """
+    Caches do LLM que recebem as respostas do batch, como [(impressão_digital, DiskCache,
+    só_se_válida)]: o do modo full, que envia o mesmo prompt, e o do modo repair (o padrão de
+    main.py), este só com as respostas que passam na validação do FormDoc, que o
+    RepairingExtractor usaria sem reparo.
+    """
+    from cache import open_llm_cache
+    from process import structuring_fingerprint
+
+    targets = []
+    for mode, validated_only in (("full", False), ("repair", True)):
+        fingerprint = structuring_fingerprint(mode)
+        targets.append((fingerprint, open_llm_cache(fingerprint), validated_only))
+    return targets
+
+def first_pass_valid(response_text):
+    """Se a resposta passa na validação do RepairingExtractor sem seções a reparar."""
+    from pydantic import ValidationError
+    from models import FormDoc
+    from sections import blocking_errors
+
+    try:
+        FormDoc.model_validate_json(strip_fences(response_text))
+    except ValidationError as e:
+        return not blocking_errors(e)
+    return True
+
+def submitted_text(custom_id, txt_dir, digests):
+    """Texto enviado na requisição custom_id, ou None se o arquivo sumiu ou mudou desde a submissão."""
+    txt_path = Path(txt_dir) / f"{custom_id}.txt"
+    text = txt_path.read_text(encoding='utf-8') if txt_path.exists() else None
+    if text is None or (custom_id in digests and text_digest(text) != digests[custom_id]):
+        logging.warning(f"{custom_id}: text changed since submission; response not cached or fingerprinted")
+        return None
+    return text
+
+def cache_response(text, content, structured_data, llm_caches):
+    """Grava a resposta nos caches do LLM sob a chave que _llm_worker consultaria para o mesmo texto."""
+    from cache import llm_cache_key
+
+    cached = json.dumps(structured_data, ensure_ascii=False)
+    valid = None
+    for fingerprint, llm_cache, validated_only in llm_caches:
+        if validated_only:
+            if valid is None:
+                valid = first_pass_valid(content)
+            if not valid:
+                continue
+        llm_cache.put(llm_cache_key(text, fingerprint), cached)
+
+def collect_batch(batch_id, transport, json_dir, store=None, ledger=None, dedup=None, txt_dir="scans/txt",
+                  llm_caches=(), batch_dir="scans/batch"):
+    """
+    Distribui as respostas de um job concluído em json_dir (<custom_id>.json), passando
+    cada uma por clean_and_parse_response.
+
+    :param store: RecordStore opcional que recebe cada JSON salvo.
+    :param ledger: JobLedger opcional; o PDF de cada resposta (<custom_id>.pdf) passa a
+        structured, para que main.py não o estruture de novo.
+    :param dedup: DedupIndex opcional; o PDF passa a ser candidato a original de duplicatas,
+        com o hash do ledger e os valores do texto enviado (como no pipeline).
+    :param txt_dir: Onde estão os textos enviados, que formam a chave do cache do LLM e a
+        impressão digital do dedup.
+    :param llm_caches: Caches que recebem cada resposta, como em batch_cache_targets.
+    :param batch_dir: Onde está o registro do job, com os hashes dos textos enviados.
+    :return: (estruturados, falhas)
+    """
+    Path(json_dir).mkdir(parents=True, exist_ok=True)
+    record_path = Path(batch_dir) / f"{batch_id}.json"
+    digests = {}
+    if record_path.exists():
+        digests = json.loads(record_path.read_text(encoding='utf-8')).get("texts", {})
+    structured = failed = 0
+    input_tokens = output_tokens = 0
+    for result in transport.results(batch_id):
+        custom_id = result["custom_id"]
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            failed += 1
+            logging.error(f"Falha ao processar {custom_id}: {result.get('error') or response.get('body')}")
+            continue
+        body = response["body"]
+        usage = body.get("usage") or {}
+        input_tokens += usage.get("prompt_tokens", 0)
+        output_tokens += usage.get("completion_tokens", 0)
+        structured_data = clean_and_parse_response(body["choices"][0]["message"]["content"])
+        if structured_data is None:
+            failed += 1
+            logging.error(f"Falha ao processar {custom_id}: invalid JSON in response")
+            continue
+        json_path = Path(json_dir) / f"{custom_id}.json"
+        save_json(structured_data, json_path)
+        if store is not None:
+            store.upsert(json_path.name, structured_data, json_path.stat().st_mtime_ns)
+        text = submitted_text(custom_id, txt_dir, digests) if llm_caches or dedup is not None else None
+        pdf_name = f"{custom_id}.pdf"
+        if ledger is not None and ledger.stage_of(pdf_name) not in (None, DUPLICATE):
+            ledger.mark_structured(pdf_name, None)
+            if dedup is not None:
+                tokens, registro = dedup.fingerprint(text) if text is not None else (frozenset(), None)
+                dedup.register(pdf_name, ledger.digest_of(pdf_name), tokens, registro)
+                dedup.mark_structured(pdf_name)
+        if llm_caches and text is not None:
+            cache_response(text, body["choices"][0]["message"]["content"], structured_data, llm_caches)
+        structured += 1
+    logging.info(
+        f"Batch {batch_id}: {structured} structured, {failed} failed "
+        f"({input_tokens} input / {output_tokens} output tokens)"
+    )
+    return structured, failed
+
+def main(argv=None):
+    import argparse
+
+    load_environment()
+    parser = argparse.ArgumentParser(description="Estrutura os textos de scans/txt pela Batch API.")
+    parser.add_argument("command", choices=["run", "submit", "collect"],
+                        help="run: submete, aguarda e distribui; submit: só submete; collect: aguarda e distribui um job")
+    parser.add_argument("--batch-id", help="Job a recolher (padrão: o último submetido)")
+    parser.add_argument("--txt-dir", default="scans/txt")
+    parser.add_argument("--json-dir", default="scans/json")
+    parser.add_argument("--batch-dir", default="scans/batch")
+    parser.add_argument("--poll-interval", type=float, default=60)
+    parser.add_argument("--timeout", type=float, help="Desiste de aguardar após N segundos")
+    parser.add_argument("--all", action="store_true", help="Inclui textos que já têm JSON")
+    parser.add_argument("--no-store", action="store_true",
+                        help="Não grava os registros na tabela de consulta (STORE_PATH)")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Não grava as respostas no cache do LLM usado por main.py")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    transport = make_batch_transport(args.batch_dir)
+    batch_id = args.batch_id
+    if args.command in ("run", "submit"):
+        batch_id = submit_batch(args.txt_dir, args.json_dir, transport, args.batch_dir, skip_existing=not args.all)
+        if batch_id is None or args.command == "submit":
+            return
+    elif batch_id is None:
+        records = sorted(Path(args.batch_dir).glob('batch*.json'), key=lambda p: p.stat().st_mtime)
+        if not records:
+            parser.error("no submitted batch found; pass --batch-id")
+        batch_id = json.loads(records[-1].read_text(encoding='utf-8'))["batch_id"]
+
+    status = wait_for_batch(batch_id, transport, args.poll_interval, args.timeout)
+    if status != "completed":
+        # Jobs expirados ainda devolvem as respostas concluídas a tempo
+        logging.warning(f"Batch {batch_id} ended as {status}; collecting partial results")
+    store = ledger = dedup = None
+    if not args.no_store:
+        from store import RecordStore
+        store = RecordStore()
+    ledger_path = Path(os.getenv("LEDGER_PATH", "scans/ledger.db"))
+    if ledger_path.exists():
+        from dedup import DedupIndex
+        from ledger import JobLedger
+        ledger = JobLedger(ledger_path)
+        dedup = DedupIndex(ledger_path, load=False)
+    llm_caches = [] if args.no_llm_cache else batch_cache_targets()
+    collect_batch(batch_id, transport, args.json_dir, store=store, ledger=ledger, dedup=dedup,
+                  txt_dir=args.txt_dir, llm_caches=llm_caches, batch_dir=args.batch_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from config import get_env_int, load_environment
+
+def sha256_file(file_path, chunk_size=1024 * 1024):
+    """Calcula o SHA-256 do conteúdo de um arquivo lendo-o em blocos."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def ocr_cache_key(file_path, pages_list=None, mode="form", output_mode="layout_preserving", sha256=None):
+    """
+    Chave do cache de OCR: hash do conteúdo do PDF mais os parâmetros de extração.
+    Como o nome do arquivo não entra na chave, cópias e arquivos renomeados compartilham a entrada.
+
+    :param file_path: Caminho para o arquivo PDF.
+    :param pages_list: Páginas a extrair, como passado para extract_text_from_pdf.
+    :param mode: Modo de processamento do LLMWhisperer.
+    :param output_mode: Modo de saída do LLMWhisperer.
+    :param sha256: Hash do PDF, se já calculado (evita ler o arquivo de novo).
+    """
+    params = json.dumps(
+        {"pages_to_extract": pages_list or "", "mode": mode, "output_mode": output_mode},
+        sort_keys=True
+    )
+    digest = hashlib.sha256()
+    digest.update((sha256 or sha256_file(file_path)).encode('ascii'))
+    digest.update(params.encode('utf-8'))
+    return digest.hexdigest()
+
+def llm_cache_key(extracted_text, fingerprint):
+    """
+    Chave do cache do LLM: hash do texto extraído combinado com a impressão digital
+    da estruturação (schema, modelo e prompt; ver process.structuring_fingerprint).
+    """
+    digest = hashlib.sha256()
+    digest.update(fingerprint.encode('ascii'))
+    digest.update(extracted_text.encode('utf-8'))
+    return digest.hexdigest()
+
+class DiskCache:
+    """
+    Cache em disco endereçado por conteúdo: cada entrada é um arquivo nomeado pela chave.
+    A data de modificação do arquivo registra o último acesso e é usada na política de
+    despejo (idade máxima e tamanho máximo, removendo primeiro as menos usadas).
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, max_age_seconds=None, suffix=".txt"):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}{self.suffix}"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        if self.max_age_seconds is not None and time.time() - path.stat().st_mtime > self.max_age_seconds:
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+    def entries(self):
+        return [p for p in self.cache_dir.glob(f"*/*{self.suffix}") if p.is_file()]
+
+    def evict(self):
+        """Remove entradas expiradas e, se necessário, as menos usadas até caber em max_bytes."""
+        now = time.time()
+        removed = 0
+        entries = []
+        for path in self.entries():
+            stat = path.stat()
+            if self.max_age_seconds is not None and now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+
+        if removed:
+            logging.info(f"Evicted {removed} entries from cache {self.cache_dir}")
+        return removed
+
+    def clear(self):
+        removed = 0
+        for path in self.entries():
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def load_stats(self):
+        try:
+            with open(self.cache_dir / "stats.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"hits": 0, "misses": 0}
+
+    def flush_stats(self):
+        """Acumula os contadores desta execução em stats.json e zera os contadores em memória."""
+        totals = self.load_stats()
+        totals["hits"] += self.hits
+        totals["misses"] += self.misses
+        tmp_path = self.cache_dir / f"stats.json.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(totals, f)
+        os.replace(tmp_path, self.cache_dir / "stats.json")
+        self.hits = 0
+        self.misses = 0
+
+    def report(self, name="Cache"):
+        logging.info(
+            f"{name}: {self.hits} hits, {self.misses} misses "
+            f"({self.hit_rate():.0%} hit rate) at {self.cache_dir}"
+        )
+        self.flush_stats()
+
+def ocr_cache_root():
+    return Path(os.getenv("OCR_CACHE_DIR", "scans/cache/ocr"))
+
+def llm_cache_root():
+    return Path(os.getenv("LLM_CACHE_DIR", "scans/cache/llm"))
+
+def llm_cache_dir(fingerprint):
+    return llm_cache_root() / fingerprint[:16]
+
+def open_ocr_cache():
+    """Cache de OCR configurado pelas variáveis OCR_CACHE_*."""
+    return DiskCache(
+        ocr_cache_root(),
+        max_bytes=get_env_int("OCR_CACHE_MAX_MB", 1024) * 1024 * 1024,
+        max_age_seconds=get_env_int("OCR_CACHE_MAX_AGE_DAYS", 90) * 24 * 3600
+    )
+
+def open_llm_cache(fingerprint=None, namespace_dir=None):
+    """
+    Cache de resultados do LLM configurado pelas variáveis LLM_CACHE_*. Cada impressão
+    digital de estruturação tem seu próprio subdiretório, o que permite descartar de uma
+    vez os resultados de schemas/prompts antigos.
+    """
+    if namespace_dir is None:
+        namespace_dir = llm_cache_dir(fingerprint)
+    return DiskCache(
+        namespace_dir,
+        max_bytes=get_env_int("LLM_CACHE_MAX_MB", 512) * 1024 * 1024,
+        max_age_seconds=get_env_int("LLM_CACHE_MAX_AGE_DAYS", 365) * 24 * 3600,
+        suffix=".json"
+    )
+
+def _describe(cache, label):
+    entries = cache.entries()
+    size = sum(p.stat().st_size for p in entries)
+    totals = cache.load_stats()
+    lookups = totals["hits"] + totals["misses"]
+    rate = totals["hits"] / lookups if lookups else 0.0
+    print(f"{label}: {len(entries)} entries, {size / 1024 / 1024:.1f} MB, "
+          f"{totals['hits']} hits / {totals['misses']} misses ({rate:.0%} hit rate)")
+
+def main(argv=None):
+    import argparse
+
+    load_environment()
+    parser = argparse.ArgumentParser(description="Inspeciona e invalida os caches de OCR e do LLM.")
+    parser.add_argument("command", choices=["stats", "clear", "evict", "prune"],
+                        help="stats: estatísticas; clear: apaga tudo; evict: aplica idade/tamanho; "
+                             "prune: apaga resultados do LLM de schemas/prompts antigos")
+    parser.add_argument("--cache", choices=["ocr", "llm", "all"], default="all")
+    args = parser.parse_args(argv)
+
+    caches = []
+    if args.cache in ("ocr", "all"):
+        caches.append(("OCR", open_ocr_cache()))
+    if args.cache in ("llm", "all") and llm_cache_root().is_dir():
+        for namespace_dir in sorted(p for p in llm_cache_root().iterdir() if p.is_dir()):
+            caches.append((f"LLM {namespace_dir.name}", open_llm_cache(namespace_dir=namespace_dir)))
+
+    if args.command == "prune":
+        from process import structuring_fingerprints
+        # Mantém os namespaces de todos os modos (full, repair, sections, com e sem +compact)
+        current = {llm_cache_dir(fingerprint) for fingerprint in structuring_fingerprints()}
+        for label, cache in caches:
+            if label.startswith("LLM") and cache.cache_dir not in current:
+                shutil.rmtree(cache.cache_dir)
+                print(f"{label}: removed")
+        return
+
+    for label, cache in caches:
+        if args.command == "clear":
+            print(f"{label}: removed {cache.clear()} entries")
+        elif args.command == "evict":
+            print(f"{label}: evicted {cache.evict()} entries")
+        else:
+            _describe(cache, label)
+
+
+if __name__ == "__main__":
+    main()
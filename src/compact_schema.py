@@ -0,0 +1,143 @@
+from datetime import datetime
+from models import FormDoc
+from schema import base_type, is_model, is_optional
+
+_TYPE_NAMES = {str: "str", int: "int", float: "float", bool: "bool", datetime: "date"}
+
+HEADER = (
+    "Return a single JSON object with exactly the keys below, nested as shown.\n"
+    "Types: str, int, float, bool (true/false), date (YYYY-MM-DD); \"?\" marks keys that may be null. "
+    "Use null for any missing data. Text after // describes the key and must not be copied."
+)
+
+def _type_name(annotation):
+    name = _TYPE_NAMES.get(base_type(annotation), "str")
+    return f"{name}?" if is_optional(annotation) else name
+
+def _affixes(texts):
+    """Prefixo e sufixo comuns (por palavra) de vários textos e o trecho que difere em cada um."""
+    words = [(text or "").split() for text in texts]
+    prefix = 0
+    while all(len(w) > prefix for w in words) and len({w[prefix] for w in words}) == 1:
+        prefix += 1
+    suffix = 0
+    while all(len(w) > prefix + suffix for w in words) and len({w[-1 - suffix] for w in words}) == 1:
+        suffix += 1
+    middles = [" ".join(w[prefix:len(w) - suffix]) for w in words]
+    return " ".join(words[0][:prefix]), middles, " ".join(words[0][len(words[0]) - suffix:])
+
+def _clean(text):
+    return text.strip().rstrip("-–:").strip()
+
+def field_families(model, min_size=3):
+    """
+    Famílias de campos "<raiz>_<sufixo>" do modelo que se repetem com os mesmos sufixos,
+    o mesmo tipo e descrições que só diferem no fim (ex.: tax_infeccao / tax_sepse).
+
+    :return: Dicionário {sufixos: [raízes]} com as famílias de pelo menos min_size raízes.
+    """
+    stems = {}
+    for name in model.model_fields:
+        stem, _, suffix = name.rpartition("_")
+        if stem:
+            stems.setdefault(stem, {})[suffix] = name
+    families = {}
+    for stem, members in stems.items():
+        if len(members) < 2:
+            continue
+        fields = [model.model_fields[name] for name in members.values()]
+        if len({field.annotation for field in fields}) != 1:
+            continue
+        prefix, _, _ = _affixes([field.description for field in fields])
+        longest = max(len((field.description or "").split()) for field in fields)
+        if len(prefix.split()) * 2 < longest:
+            continue
+        families.setdefault(tuple(members), []).append(stem)
+    return {suffixes: stems for suffixes, stems in families.items() if len(stems) >= min_size}
+
+def _render_fields(model, indent):
+    pad = "  " * indent
+    lines = []
+    families = field_families(model)
+    family_of = {f"{stem}_{suffix}": suffixes
+                 for suffixes, stems in families.items() for stem in stems for suffix in suffixes}
+    rendered = set()
+    for name, field in model.model_fields.items():
+        if name in rendered:
+            continue
+        suffixes = family_of.get(name)
+        if suffixes is not None:
+            stems = families[suffixes]
+            _, labels, _ = _affixes([model.model_fields[f"{stems[0]}_{s}"].description for s in suffixes])
+            keys = " and ".join(f"<key>_{suffix} ({label})" for suffix, label in zip(suffixes, labels))
+            lines.append(f"{pad}each key below appears as {keys}:")
+            for stem in stems:
+                members = [model.model_fields[f"{stem}_{suffix}"] for suffix in suffixes]
+                prefix, _, _ = _affixes([member.description for member in members])
+                lines.append(f"{pad}  {stem}: {_type_name(members[0].annotation)}  // {_clean(prefix)}")
+                rendered.update(f"{stem}_{suffix}" for suffix in suffixes)
+            continue
+        kind = base_type(field.annotation)
+        if is_model(kind):
+            lines.append(f"{pad}{name}: {{  // {field.description or name}")
+            lines.extend(_render_fields(kind, indent + 1))
+            lines.append(f"{pad}}}")
+        else:
+            lines.append(f"{pad}{name}: {_type_name(field.annotation)}  // {field.description or name}")
+        rendered.add(name)
+    return lines
+
+def _signature(model):
+    return tuple((name, field.annotation) for name, field in model.model_fields.items())
+
+def render_compact_schema(model=FormDoc):
+    """
+    Instruções de formato compactas para o prompt: uma linha por campo (nome, tipo e
+    descrição), sem os defaults, títulos e $defs do JSON schema do PydanticOutputParser.
+    Famílias de campos repetidos (ex.: os pares *_infeccao / *_sepse) são descritas uma
+    única vez, e seções com os mesmos campos (ex.: EscoresInfec / EscoresSepse) também.
+    """
+    lines = [HEADER, ""]
+    mirrors = {}
+    for name, field in model.model_fields.items():
+        kind = base_type(field.annotation)
+        if is_model(kind):
+            mirrors.setdefault(_signature(kind), []).append(name)
+
+    rendered = set()
+    for name, field in model.model_fields.items():
+        if name in rendered:
+            continue
+        kind = base_type(field.annotation)
+        if not is_model(kind):
+            lines.append(f"{name}: {_type_name(field.annotation)}  // {field.description or name}")
+            continue
+        group = mirrors[_signature(kind)]
+        rendered.update(group)
+        if len(group) == 1:
+            lines.append(f"{name}: {{  // {field.description or name}")
+            lines.extend(_render_fields(kind, 1))
+            lines.append("}")
+            continue
+        _, labels, suffix = _affixes([model.model_fields[member].description for member in group])
+        keys = ", ".join(f"{member} ({label})" if label else member for member, label in zip(group, labels))
+        lines.append(f"{keys}: each an object with these same keys {{  // {suffix}")
+        descriptions = {}
+        for member in group:
+            for field_name, member_field in base_type(model.model_fields[member].annotation).model_fields.items():
+                descriptions.setdefault(field_name, []).append(member_field.description)
+        for field_name, member_field in kind.model_fields.items():
+            prefix, _, _ = _affixes(descriptions[field_name])
+            lines.append(f"  {field_name}: {_type_name(member_field.annotation)}  // {_clean(prefix) or member_field.description}")
+        lines.append("}")
+    return "\n".join(lines)
+
+def instruction_tokens(model_name="gpt-4o-mini"):
+    """Tokens das instruções de formato do PydanticOutputParser e das compactas."""
+    from langchain.output_parsers import PydanticOutputParser
+    from scheduler import count_tokens
+
+    return {
+        "pydantic": count_tokens(PydanticOutputParser(pydantic_object=FormDoc).get_format_instructions(), model_name),
+        "compact": count_tokens(render_compact_schema(FormDoc), model_name),
+    }
@@ -3,10 +3,11 @@ import os
 from datetime import datetime
 from dotenv import load_dotenv
 
-def configure_logging():
+def configure_logging(suffix=""):
     log_dir = 'logs'
     os.makedirs(log_dir, exist_ok=True)
-    log_filename = datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".log"
+    # O sufixo separa os logs de processos iniciados no mesmo segundo (ex.: shards)
+    log_filename = datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + suffix + ".log"
     log_filepath = os.path.join(log_dir, log_filename)
 
     logging.basicConfig(
@@ -23,3 +24,13 @@ def configure_logging():
 
 def load_environment():
     load_dotenv()
+
+def get_env_int(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logging.warning(f"Invalid integer for {name}: {value!r}; using {default}")
+        return default
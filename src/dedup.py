@@ -0,0 +1,223 @@
+import logging
+import re
+from functools import lru_cache
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import create_engine, select, String, Text
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, Session
+from ledger import DUPLICATE, FAILED, PENDING, STRUCTURED
+
+# Motivos de uma ligação: bytes do PDF idênticos, texto quase igual, ou texto parecido com o mesmo registro
+EXACT = "exact"
+TEXT = "text"
+REGISTRO = "registro"
+
+_TOKEN = re.compile(r"\w+")
+_REGISTRO = re.compile(r"\bregistro\b[^\w\n]*([^\n]{1,40})", re.IGNORECASE)
+
+def _digit_tokens(text):
+    return {token for token in _TOKEN.findall(text.lower()) if any(c.isdigit() for c in token)}
+
+@lru_cache(maxsize=None)
+def label_tokens(model=None):
+    """
+    Termos com dígitos dos nomes e descrições dos campos do FormDoc (telefone1, 1500g, 24, 30s):
+    são impressos em todas as fichas e não distinguem uma paciente da outra.
+    """
+    from models import FormDoc
+    from schema import base_type, is_model
+
+    tokens = set()
+    for name, field in (model or FormDoc).model_fields.items():
+        for label in (name, name.replace('_', ' '), field.description or ""):
+            tokens |= _digit_tokens(label)
+        kind = base_type(field.annotation)
+        if is_model(kind):
+            tokens |= label_tokens(kind)
+    return frozenset(tokens)
+
+def value_tokens(text):
+    """
+    Termos do texto que contêm algum dígito (datas, exames, registro, telefones), sem os que
+    aparecem nos rótulos da ficha: só os valores preenchidos distinguem uma paciente da outra.
+    """
+    return frozenset(_digit_tokens(text) - label_tokens())
+
+def extract_registro(text):
+    """Número de registro da primeira linha "Registro: ..." do texto, normalizado, ou None."""
+    match = _REGISTRO.search(text)
+    if match is None:
+        return None
+    registro = re.sub(r"\W", "", match.group(1)).upper()
+    return registro or None
+
+class Base(DeclarativeBase):
+    pass
+
+class Fingerprint(Base):
+    __tablename__ = "fingerprints"
+
+    pdf_name: Mapped[str] = mapped_column(String, primary_key=True)
+    sha256: Mapped[Optional[str]] = mapped_column(String(64), index=True)
+    registro: Mapped[Optional[str]] = mapped_column(String, index=True)
+    tokens: Mapped[Optional[str]] = mapped_column(Text)
+    status: Mapped[str] = mapped_column(String(16), default=PENDING, index=True)
+    duplicate_of: Mapped[Optional[str]] = mapped_column(String)
+    reason: Mapped[Optional[str]] = mapped_column(String(16))
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
+
+class DedupIndex:
+    """
+    Índice de impressões digitais dos documentos, para ligar cópias (reescaneamentos, páginas
+    avulsas, o mesmo formulário vindo de outra unidade) ao resultado já existente em vez de
+    pagar OCR e LLM de novo. Um PDF é duplicata de outro quando os bytes são idênticos (antes
+    do OCR) ou quando quase todos os valores do seu texto aparecem no texto do outro (antes do
+    LLM); com o mesmo registro, o limiar é mais baixo. O registro sozinho nunca liga dois
+    documentos, pois a mesma paciente pode ter mais de uma internação.
+
+    :param db_path: Arquivo SQLite (o mesmo do JobLedger, em uma tabela própria).
+    :param threshold: Fração mínima dos valores do documento presente no original.
+    :param registro_threshold: Fração mínima quando os dois têm o mesmo registro.
+    :param min_tokens: Documentos com menos valores (já sem os termos dos rótulos) que isso
+        não são comparados pelo texto.
+    :param load: Se False, não carrega os candidatos em memória (só para consultar as ligações).
+    """
+
+    def __init__(self, db_path, threshold=0.8, registro_threshold=0.6, min_tokens=20, load=True):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(self.engine)
+        self.threshold = threshold
+        self.registro_threshold = registro_threshold
+        self.min_tokens = min_tokens
+        self.linked = Counter()
+        self.ocr_avoided = 0
+        self.llm_avoided = 0
+
+        # Candidatos a original: os estruturados em execuções anteriores e os registrados nesta
+        self.status = {}
+        self.by_sha = {}
+        self.shas = {}
+        self.tokens = {}
+        self.registros = {}
+        self.postings = defaultdict(set)
+        if not load:
+            return
+        with Session(self.engine) as session:
+            for row in session.scalars(select(Fingerprint).where(Fingerprint.status == STRUCTURED)):
+                # Impressões gravadas antes de os termos dos rótulos serem descartados
+                tokens = frozenset(row.tokens.split()) - label_tokens() if row.tokens else frozenset()
+                self._index(row.pdf_name, STRUCTURED, row.sha256, tokens, row.registro)
+
+    def _index(self, pdf_name, status, sha256, tokens, registro):
+        self._forget(pdf_name)
+        self.status[pdf_name] = status
+        if sha256:
+            self.by_sha.setdefault(sha256, pdf_name)
+            self.shas[pdf_name] = sha256
+        self.tokens[pdf_name] = tokens
+        self.registros[pdf_name] = registro
+        for token in tokens:
+            self.postings[token].add(pdf_name)
+
+    def _forget(self, pdf_name):
+        if pdf_name not in self.status:
+            return
+        del self.status[pdf_name]
+        sha256 = self.shas.pop(pdf_name, None)
+        if sha256 is not None and self.by_sha.get(sha256) == pdf_name:
+            del self.by_sha[sha256]
+        for token in self.tokens.pop(pdf_name, ()):
+            self.postings[token].discard(pdf_name)
+        self.registros.pop(pdf_name, None)
+
+    def _candidate(self, pdf_name, other, include_pending):
+        return other != pdf_name and (self.status.get(other) == STRUCTURED or include_pending)
+
+    def fingerprint(self, text):
+        """(valores, registro) do texto extraído de um documento."""
+        return value_tokens(text), extract_registro(text)
+
+    def status_of(self, pdf_name):
+        return self.status.get(pdf_name)
+
+    def find_exact(self, pdf_name, sha256, include_pending=False):
+        """Documento já conhecido com os mesmos bytes, ou None."""
+        other = self.by_sha.get(sha256)
+        if other is not None and self._candidate(pdf_name, other, include_pending):
+            return other
+        return None
+
+    def find_similar(self, pdf_name, tokens, registro, include_pending=False):
+        """
+        Documento conhecido que contém quase todos os valores de tokens.
+
+        :param include_pending: Considera também os documentos registrados nesta execução que
+            ainda não foram estruturados (o chamador espera o resultado deles).
+        :return: (nome_do_original, motivo) ou (None, None).
+        """
+        if len(tokens) < self.min_tokens:
+            return None, None
+        overlaps = Counter()
+        for token in tokens:
+            overlaps.update(self.postings.get(token, ()))
+        best, best_reason, best_score = None, None, 0.0
+        for other, overlap in overlaps.items():
+            if not self._candidate(pdf_name, other, include_pending):
+                continue
+            score = overlap / len(tokens)
+            same_registro = registro is not None and self.registros.get(other) == registro
+            if score >= (self.registro_threshold if same_registro else self.threshold) and score > best_score:
+                best, best_score = other, score
+                best_reason = TEXT if score >= self.threshold else REGISTRO
+        return best, best_reason
+
+    def _save(self, pdf_name, **values):
+        with Session(self.engine) as session, session.begin():
+            row = session.get(Fingerprint, pdf_name)
+            if row is None:
+                row = Fingerprint(pdf_name=pdf_name)
+                session.add(row)
+            for key, value in values.items():
+                setattr(row, key, value)
+
+    def register(self, pdf_name, sha256, tokens, registro):
+        """Registra um documento que segue para o LLM como candidato a original."""
+        self._save(pdf_name, sha256=sha256, tokens=" ".join(sorted(tokens)), registro=registro,
+                   status=PENDING, duplicate_of=None, reason=None)
+        self._index(pdf_name, PENDING, sha256, tokens, registro)
+
+    def mark_structured(self, pdf_name):
+        self._save(pdf_name, status=STRUCTURED)
+        if pdf_name in self.status:
+            self.status[pdf_name] = STRUCTURED
+
+    def mark_failed(self, pdf_name):
+        self._save(pdf_name, status=FAILED)
+        self._forget(pdf_name)
+
+    def link(self, pdf_name, duplicate_of, reason, sha256=None, ocr_skipped=False):
+        """Liga pdf_name ao resultado de duplicate_of; o documento não é estruturado."""
+        self._save(pdf_name, sha256=sha256, status=DUPLICATE, duplicate_of=duplicate_of, reason=reason)
+        self._forget(pdf_name)
+        self.linked[reason] += 1
+        self.llm_avoided += 1
+        if ocr_skipped:
+            self.ocr_avoided += 1
+
+    def links(self):
+        """Lista de (pdf_name, duplicate_of, motivo) de todas as duplicatas ligadas."""
+        with Session(self.engine) as session:
+            rows = session.scalars(select(Fingerprint).where(Fingerprint.status == DUPLICATE)
+                                   .order_by(Fingerprint.pdf_name))
+            return [(row.pdf_name, row.duplicate_of, row.reason) for row in rows]
+
+    def report(self):
+        total = sum(self.linked.values())
+        reasons = ", ".join(f"{reason}={count}" for reason, count in sorted(self.linked.items()))
+        logging.info(
+            f"Dedup: {total} duplicate(s) linked{f' ({reasons})' if reasons else ''}; "
+            f"OCR avoided for {self.ocr_avoided} and LLM structuring for {self.llm_avoided} document(s)"
+        )
@@ -0,0 +1,222 @@
+import csv
+import json
+import logging
+import shutil
+from datetime import datetime
+from pathlib import Path
+import orjson
+from schema import form_columns
+
+SOURCE_COLUMN = "source_file"
+
+_TRUE_STRINGS = {"true", "sim", "s", "yes", "1"}
+_FALSE_STRINGS = {"false", "não", "nao", "n", "no", "0"}
+
+def _lookup(record, path):
+    value = record
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def coerce(value, kind):
+    """
+    Converte um valor do JSON para o tipo declarado no modelo; valores que não podem ser
+    convertidos (ou o texto "null" usado como default em models.py) viram None.
+    """
+    if value is None or value == "null" or value == "":
+        return None
+    try:
+        if kind is bool:
+            if isinstance(value, str):
+                lowered = value.strip().lower()
+                if lowered in _TRUE_STRINGS:
+                    return True
+                if lowered in _FALSE_STRINGS:
+                    return False
+                return None
+            return bool(value)
+        if kind is int:
+            return int(float(value))
+        if kind is float:
+            return float(value)
+        if kind is datetime:
+            if isinstance(value, datetime):
+                return value
+            return datetime.fromisoformat(str(value).strip()[:19])
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+class StreamingExporter:
+    """
+    Exporta os JSONs de scans/json para uma tabela única (CSV ou Parquet) sem carregar
+    tudo em memória: o layout de colunas vem do FormDoc, e as linhas são lidas e escritas
+    em blocos de chunk_size. No modo incremental, apenas os JSONs novos desde a última
+    exportação são acrescentados; se algum JSON já exportado mudou ou sumiu, ou se as
+    colunas do FormDoc mudaram, a tabela é reescrita.
+    """
+
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+        self.columns = form_columns()
+        self.paths = [tuple(name.split(".")) for name, _ in self.columns]
+        self.header = [SOURCE_COLUMN] + [name for name, _ in self.columns]
+
+    def row(self, source_name, record, typed=False):
+        if typed:
+            values = [coerce(_lookup(record, path), kind) for path, (_, kind) in zip(self.paths, self.columns)]
+        else:
+            values = [_lookup(record, path) for path in self.paths]
+        return [source_name] + values
+
+    def iter_records(self, json_files):
+        for json_file in json_files:
+            try:
+                data = orjson.loads(json_file.read_bytes())
+            except (OSError, orjson.JSONDecodeError) as e:
+                logging.warning(f"Skipping {json_file}: {e}")
+                continue
+            if not isinstance(data, dict):
+                logging.warning(f"Skipping {json_file}: no structured data")
+                continue
+            yield json_file.name, data
+
+    def iter_chunks(self, json_files, typed=False):
+        chunk = []
+        for source_name, record in self.iter_records(json_files):
+            chunk.append(self.row(source_name, record, typed))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def export(self, json_dir, output_path, fmt="csv", incremental=False):
+        """
+        :param json_dir: Diretório com os arquivos JSON, ou uma lista de diretórios (ex.: um por shard).
+        :param output_path: Arquivo CSV, ou diretório de partes Parquet quando fmt="parquet".
+        :param fmt: "csv" ou "parquet".
+        :param incremental: Acrescenta somente os JSONs novos desde a última exportação.
+        :return: Número de linhas escritas nesta execução.
+        """
+        json_dirs = [json_dir] if isinstance(json_dir, (str, Path)) else list(json_dir)
+        output_path = Path(output_path)
+        state_path = output_path.with_name(output_path.name + ".state.json")
+
+        current = {}
+        locations = {}
+        for directory in json_dirs:
+            for json_file in Path(directory).glob("*.json"):
+                stat = json_file.stat()
+                # O mesmo documento em vários diretórios (ex.: shards de execuções diferentes): vale o mais recente
+                if json_file.name in current and current[json_file.name][0] >= stat.st_mtime_ns:
+                    continue
+                current[json_file.name] = [stat.st_mtime_ns, stat.st_size]
+                locations[json_file.name] = json_file
+        current = dict(sorted(current.items()))
+
+        # Layout das colunas (cabeçalho do CSV / schema do Parquet): se o FormDoc mudou, as linhas
+        # novas não cabem na saída existente
+        layout = [fmt] + [[name, kind.__name__] for name, kind in self.columns]
+        previous = None
+        if incremental and output_path.exists() and state_path.exists():
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("layout") != layout:
+                logging.info(f"FormDoc columns changed since the last export; rewriting {output_path}")
+            else:
+                previous = state["files"]
+                stale = [name for name, signature in previous.items() if current.get(name) != signature]
+                if stale:
+                    logging.info(f"{len(stale)} exported JSON file(s) changed or were removed; rewriting {output_path}")
+                    previous = None
+
+        append = previous is not None
+        names = [name for name in current if not append or name not in previous]
+        json_files = [locations[name] for name in names]
+
+        if fmt == "csv":
+            written = self._write_csv(json_files, output_path, append)
+        elif fmt == "parquet":
+            written = self._write_parquet(json_files, output_path, append)
+        else:
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(state_path, 'w', encoding='utf-8') as f:
+            json.dump({"layout": layout, "files": current}, f)
+        logging.info(f"Exported {written} record(s) to {output_path} ({'appended' if append else 'full export'})")
+        return written
+
+    def _write_csv(self, json_files, output_path, append):
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        written = 0
+        with open(output_path, 'a' if append else 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if not append:
+                writer.writerow(self.header)
+            for chunk in self.iter_chunks(json_files):
+                writer.writerows(chunk)
+                written += len(chunk)
+        return written
+
+    def arrow_schema(self):
+        import pyarrow as pa
+
+        arrow_types = {bool: pa.bool_(), int: pa.int64(), float: pa.float64(), datetime: pa.timestamp("s")}
+        fields = [pa.field(SOURCE_COLUMN, pa.string())]
+        fields += [pa.field(name, arrow_types.get(kind, pa.string())) for name, kind in self.columns]
+        return pa.schema(fields)
+
+    def _write_parquet(self, json_files, output_dir, append):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow).")
+
+        if not append and output_dir.exists():
+            shutil.rmtree(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        part_path = output_dir / f"part-{len(list(output_dir.glob('part-*.parquet'))):05d}.parquet"
+
+        schema = self.arrow_schema()
+        written = 0
+        writer = None
+        try:
+            for chunk in self.iter_chunks(json_files, typed=True):
+                if writer is None:
+                    writer = pq.ParquetWriter(part_path, schema)
+                table = pa.Table.from_pylist([dict(zip(self.header, row)) for row in chunk], schema=schema)
+                writer.write_table(table)
+                written += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return written
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporta scans/json para uma tabela unificada.")
+    parser.add_argument("--json-dir", default="scans/json")
+    parser.add_argument("--output", help="Padrão: scans/csv/unified.csv ou scans/parquet/unified")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Acrescenta apenas os JSONs novos desde a última exportação")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    output = args.output or ("scans/csv/unified.csv" if args.format == "csv" else "scans/parquet/unified")
+    StreamingExporter(chunk_size=args.chunk_size).export(
+        args.json_dir, output, fmt=args.format, incremental=args.incremental
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,143 @@
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import create_engine, func, select, String, Text
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, Session
+from cache import sha256_file
+
+PENDING = "pending"
+OCR_DONE = "ocr_done"
+STRUCTURED = "structured"
+FAILED = "failed"
+# Cópia de outro documento, ligada ao resultado dele (ver dedup.py)
+DUPLICATE = "duplicate"
+
+class Base(DeclarativeBase):
+    pass
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    pdf_name: Mapped[str] = mapped_column(String, primary_key=True)
+    sha256: Mapped[Optional[str]] = mapped_column(String(64))
+    size: Mapped[Optional[int]]
+    mtime: Mapped[Optional[float]]
+    stage: Mapped[str] = mapped_column(String(16), default=PENDING, index=True)
+    failed_stage: Mapped[Optional[str]] = mapped_column(String(16))
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    attempts: Mapped[int] = mapped_column(default=0)
+    ocr_seconds: Mapped[Optional[float]]
+    llm_seconds: Mapped[Optional[float]]
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
+
+class JobLedger:
+    """
+    Registro persistente (SQLite) do estado de cada PDF no pipeline: pending, ocr_done,
+    structured, duplicate ou failed, com número de tentativas, tempos por estágio e último erro.
+    Permite retomar um lote interrompido processando apenas o que falta ou mudou.
+    """
+
+    def __init__(self, db_path):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(self.engine)
+
+    def plan(self, pdf_files, retry_failed=False):
+        """
+        Registra os PDFs no ledger e retorna os que precisam ser processados: novos,
+        alterados (tamanho/data mudaram e o hash é outro), inacabados e, com
+        retry_failed, os que falharam.
+
+        :param pdf_files: Caminhos (Path) dos PDFs encontrados.
+        :param retry_failed: Se True, recoloca na fila os PDFs com estado failed.
+        """
+        todo = []
+        with Session(self.engine) as session, session.begin():
+            jobs = {job.pdf_name: job for job in session.scalars(select(Job))}
+            for pdf_file in pdf_files:
+                stat = pdf_file.stat()
+                job = jobs.get(pdf_file.name)
+                if job is None:
+                    job = Job(pdf_name=pdf_file.name, sha256=sha256_file(pdf_file),
+                              size=stat.st_size, mtime=stat.st_mtime, stage=PENDING, attempts=0)
+                    session.add(job)
+                elif job.size != stat.st_size or job.mtime != stat.st_mtime:
+                    digest = sha256_file(pdf_file)
+                    if digest != job.sha256:
+                        job.sha256 = digest
+                        job.stage = PENDING
+                        job.failed_stage = None
+                        job.error = None
+                        job.attempts = 0
+                    job.size = stat.st_size
+                    job.mtime = stat.st_mtime
+
+                if job.stage == FAILED and retry_failed:
+                    job.stage = PENDING
+                if job.stage in (PENDING, OCR_DONE):
+                    todo.append(pdf_file)
+        return todo
+
+    def _update(self, pdf_name, **values):
+        with Session(self.engine) as session, session.begin():
+            job = session.get(Job, pdf_name)
+            if job is None:
+                job = Job(pdf_name=pdf_name, attempts=0)
+                session.add(job)
+            for key, value in values.items():
+                setattr(job, key, value)
+
+    def stage_of(self, pdf_name):
+        with Session(self.engine) as session:
+            job = session.get(Job, pdf_name)
+            return job.stage if job is not None else None
+
+    def digest_of(self, pdf_name):
+        """SHA-256 registrado para o PDF no último plan, ou None."""
+        with Session(self.engine) as session:
+            job = session.get(Job, pdf_name)
+            return job.sha256 if job is not None else None
+
+    def known_digest(self, pdf_file):
+        """SHA-256 registrado para o PDF, se o tamanho e a data ainda conferem; senão None."""
+        with Session(self.engine) as session:
+            job = session.get(Job, pdf_file.name)
+            if job is None or not job.sha256:
+                return None
+            stat = pdf_file.stat()
+            return job.sha256 if (job.size, job.mtime) == (stat.st_size, stat.st_mtime) else None
+
+    def start(self, pdf_name):
+        with Session(self.engine) as session, session.begin():
+            job = session.get(Job, pdf_name)
+            if job is None:
+                session.add(Job(pdf_name=pdf_name, stage=PENDING, attempts=1))
+            else:
+                job.attempts += 1
+
+    def mark_ocr_done(self, pdf_name, seconds):
+        self._update(pdf_name, stage=OCR_DONE, ocr_seconds=seconds, failed_stage=None, error=None)
+
+    def mark_structured(self, pdf_name, seconds):
+        self._update(pdf_name, stage=STRUCTURED, llm_seconds=seconds, failed_stage=None, error=None)
+
+    def mark_duplicate(self, pdf_name):
+        self._update(pdf_name, stage=DUPLICATE, failed_stage=None, error=None)
+
+    def mark_failed(self, pdf_name, failed_stage, error):
+        self._update(pdf_name, stage=FAILED, failed_stage=failed_stage, error=str(error))
+
+    def summary(self):
+        with Session(self.engine) as session:
+            rows = session.execute(select(Job.stage, func.count()).group_by(Job.stage)).all()
+        return {stage: count for stage, count in rows}
+
+    def failures(self):
+        with Session(self.engine) as session:
+            jobs = session.scalars(select(Job).where(Job.stage == FAILED).order_by(Job.pdf_name))
+            return [(job.pdf_name, job.failed_stage, job.attempts, job.error) for job in jobs]
+
+    def report(self):
+        summary = self.summary()
+        logging.info("Ledger: " + ", ".join(f"{stage}={count}" for stage, count in sorted(summary.items())))
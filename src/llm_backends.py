@@ -0,0 +1,291 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+from pydantic import PrivateAttr
+from config import get_env_int, load_environment
+from models import FormDoc
+from schema import is_model
+
+BACKENDS = ("openai", "openai-compatible", "fake")
+
+# Esquema embutido pelo PydanticOutputParser nas instruções de formato
+_SCHEMA_RE = re.compile(r"Here is the output schema:\s*```\s*(\{.*?\})\s*```", re.DOTALL)
+# Linha "Section: <descrição>" dos prompts por seção do SectionedExtractor
+_SECTION_RE = re.compile(r"^Section: (.*)$", re.MULTILINE)
+_TEXT_MARKER = "Extracted Text:\n"
+
+class FakeLLMError(RuntimeError):
+    """Falha simulada pelo backend fake, com o status HTTP e o Retry-After que uma API real enviaria."""
+
+    def __init__(self, message, status_code=500, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def fake_completion(prompt_text, seed=0, null_rate=0.1):
+    """
+    Resposta determinística para um prompt: um JSON válido para o schema presente nas
+    instruções de formato (uma seção ou o FormDoc inteiro). O mesmo prompt sempre gera a
+    mesma resposta, o que permite testar os caches.
+    """
+    from synthetic import synthetic_from_schema, synthetic_record
+
+    digest = hashlib.sha256(f"{seed}:{prompt_text}".encode('utf-8')).digest()
+    rng = random.Random(int.from_bytes(digest[:8], 'big'))
+    match = _SCHEMA_RE.search(prompt_text)
+    if match:
+        data = synthetic_from_schema(json.loads(match.group(1)), rng, null_rate)
+    else:
+        data = synthetic_record(FormDoc, rng, null_rate)
+    return "```json\n" + json.dumps(data, ensure_ascii=False) + "\n```"
+
+def _misread(record, rng, rate):
+    """Erra cada valor com probabilidade rate: booleanos são invertidos e os demais somem (null)."""
+    for key, value in record.items():
+        if isinstance(value, dict):
+            _misread(value, rng, rate)
+        elif value is not None and rng.random() < rate:
+            record[key] = (not value) if isinstance(value, bool) else None
+    return record
+
+def reading_completion(prompt_text, seed=0, field_error_rate=0.0):
+    """
+    Resposta de um "modelo perfeito" para formulários no formato de synthetic.render_form_text:
+    lê os pares "campo: valor" do texto extraído no prompt e devolve o FormDoc (ou só a
+    seção pedida, nos prompts por seção), errando cada valor com probabilidade
+    field_error_rate. Permite medir a acurácia por campo do pipeline sem um LLM real.
+    """
+    from synthetic import parse_form_text
+
+    digest = hashlib.sha256(f"{seed}:{prompt_text}".encode('utf-8')).digest()
+    rng = random.Random(int.from_bytes(digest[:8], 'big'))
+    _, _, text = prompt_text.partition(_TEXT_MARKER)
+    record = _misread(parse_form_text(text), rng, field_error_rate)
+    match = _SECTION_RE.search(prompt_text)
+    if match:
+        description = match.group(1).strip()
+        for name, field in FormDoc.model_fields.items():
+            if is_model(field.annotation) and (field.description or name) == description:
+                record = record.get(name) or {}
+                break
+        else:
+            record = {name: record.get(name) for name, field in FormDoc.model_fields.items()
+                      if not is_model(field.annotation)}
+    return "```json\n" + json.dumps(record, ensure_ascii=False) + "\n```"
+
+def estimate_tokens(text):
+    # Aproximação de ~4 caracteres por token, suficiente para o relatório do backend fake
+    return max(1, len(text) // 4)
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model local e determinístico para testes de carga sem rede: devolve JSON válido
+    para o schema pedido após uma latência configurável, e falha ou devolve JSON inválido
+    nas taxas configuradas. Com read_text, lê os valores do próprio texto extraído
+    (reading_completion) em vez de gerá-los ao acaso.
+    """
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    invalid_rate: float = 0.0
+    read_text: bool = False
+    field_error_rate: float = 0.0
+    seed: int = 0
+    _rng: Optional[random.Random] = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self):
+        return "fake-formdoc"
+
+    def _random(self):
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        return self._rng.random()
+
+    def _delay(self):
+        if self.latency_jitter:
+            return max(0.0, self.latency + (self._random() * 2 - 1) * self.latency_jitter)
+        return self.latency
+
+    def _respond(self, messages):
+        draw = self._random()
+        if draw < self.throttle_rate:
+            raise FakeLLMError("Simulated rate limit", status_code=429, retry_after=1)
+        if draw < self.throttle_rate + self.error_rate:
+            raise FakeLLMError("Simulated server error", status_code=500)
+
+        prompt_text = "\n".join(str(message.content) for message in messages)
+        if self._random() < self.invalid_rate:
+            content = '{"identificacao": {"nome": "truncated'
+        elif self.read_text:
+            content = reading_completion(prompt_text, self.seed, self.field_error_rate)
+        else:
+            content = fake_completion(prompt_text, self.seed)
+        input_tokens = estimate_tokens(prompt_text)
+        output_tokens = estimate_tokens(content)
+        message = AIMessage(content=content, usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._delay())
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._respond(messages)
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    try:
+        return float(value) if value not in (None, "") else default
+    except ValueError:
+        logging.warning(f"Invalid number for {name}: {value!r}; using {default}")
+        return default
+
+def llm_backend_name():
+    backend = os.getenv("LLM_BACKEND", "openai")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    return backend
+
+def llm_backend_identity(model_name):
+    """
+    Identifica o backend/modelo que produz as respostas, para compor a impressão digital
+    do cache. Para a OpenAI é apenas o nome do modelo.
+    """
+    backend = llm_backend_name()
+    if backend == "openai":
+        return model_name
+    if backend == "openai-compatible":
+        return f"openai-compatible:{os.getenv('LLM_BASE_URL', '')}:{os.getenv('LLM_MODEL') or model_name}"
+    identity = f"fake:{get_env_int('FAKE_LLM_SEED', 0)}"
+    if get_env_int("FAKE_LLM_READ_TEXT", 0):
+        identity += f":read:{_env_float('FAKE_LLM_FIELD_ERROR_RATE', 0.0)}"
+    return identity
+
+def make_chat_model(model_name, temperature=0.0, max_retries=None):
+    """
+    Cria o chat model configurado por LLM_BACKEND:
+    - openai: ChatOpenAI (OPENAI_API_KEY);
+    - openai-compatible: qualquer servidor com a API da OpenAI em LLM_BASE_URL (LLM_MODEL, LLM_API_KEY);
+    - fake: FakeChatModel (FAKE_LLM_LATENCY, FAKE_LLM_JITTER, FAKE_LLM_ERROR_RATE,
+      FAKE_LLM_THROTTLE_RATE, FAKE_LLM_INVALID_RATE, FAKE_LLM_SEED, FAKE_LLM_READ_TEXT,
+      FAKE_LLM_FIELD_ERROR_RATE).
+
+    :param max_retries: Retentativas internas do cliente OpenAI; use 0 quando as chamadas
+        passam por um RateLimitedScheduler, que faz as retentativas ele mesmo.
+    """
+    backend = llm_backend_name()
+    options = {} if max_retries is None else {"max_retries": max_retries}
+    if backend == "openai":
+        return ChatOpenAI(model=model_name, temperature=temperature, **options)
+    if backend == "openai-compatible":
+        return ChatOpenAI(
+            model=os.getenv("LLM_MODEL") or model_name,
+            temperature=temperature,
+            base_url=os.getenv("LLM_BASE_URL"),
+            api_key=os.getenv("LLM_API_KEY") or "not-needed",
+            **options
+        )
+    return make_fake_chat_model()
+
+def make_fake_chat_model():
+    return FakeChatModel(
+        latency=_env_float("FAKE_LLM_LATENCY", 0.0),
+        latency_jitter=_env_float("FAKE_LLM_JITTER", 0.0),
+        error_rate=_env_float("FAKE_LLM_ERROR_RATE", 0.0),
+        throttle_rate=_env_float("FAKE_LLM_THROTTLE_RATE", 0.0),
+        invalid_rate=_env_float("FAKE_LLM_INVALID_RATE", 0.0),
+        read_text=bool(get_env_int("FAKE_LLM_READ_TEXT", 0)),
+        field_error_rate=_env_float("FAKE_LLM_FIELD_ERROR_RATE", 0.0),
+        seed=get_env_int("FAKE_LLM_SEED", 0)
+    )
+
+def serve(host="127.0.0.1", port=8008, model=None):
+    """
+    Servidor local compatível com POST /v1/chat/completions que responde com o
+    FakeChatModel. Permite exercitar o caminho HTTP real (backend openai-compatible)
+    sem acesso à rede.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from langchain_core.messages import HumanMessage
+
+    model = model or make_fake_chat_model()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            messages = [HumanMessage(content=m.get("content") or "") for m in request.get("messages", [])]
+            try:
+                result = model._generate(messages)
+            except FakeLLMError as e:
+                headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+                self._send(e.status_code, {"error": {"message": str(e), "type": "fake_error"}}, headers)
+                return
+            message = result.generations[0].message
+            usage = message.usage_metadata
+            self._send(200, {
+                "id": f"chatcmpl-fake-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": message.content}}],
+                "usage": {"prompt_tokens": usage["input_tokens"],
+                          "completion_tokens": usage["output_tokens"],
+                          "total_tokens": usage["total_tokens"]},
+            })
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logging.info(f"Fake OpenAI-compatible server listening on http://{host}:{port}/v1")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def main(argv=None):
+    import argparse
+
+    load_environment()
+    parser = argparse.ArgumentParser(description="Servidor local compatível com a OpenAI para testes de carga offline.")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
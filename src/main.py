@@ -1,48 +1,344 @@
-from config import configure_logging, load_environment
-from process import process_medical_information
-from utils import create_directories, save_extracted_text, save_json, extract_text_from_pdf, converter_pdf_para_png_com_preprocessamento
+from config import configure_logging, load_environment, get_env_int
+from shard import parse_shard, select_shard, shard_dir
 from pathlib import Path
+import argparse
+import asyncio
 import logging
+import os
+import sys
 
-def process_single_pdf(pdf_file, txt_dir, json_dir, png_dir):
-    base_name = pdf_file.stem
+# Os módulos pesados (langchain, pdf2image, pandas, sqlalchemy, o cliente do LLMWhisperer)
+# são importados dentro de cada comando, de modo que export e status, e os comandos que
+# não chegam ao LLM, não pagam o tempo de importação do que não usam.
+# Ver benchmarks/bench_import_time.py.
+
+COMMANDS = ("run", "extract", "structure", "export", "status")
+
+def shard_arg(value):
     try:
-        # Diretório para salvar as imagens PNG
-        #pdf_png_dir = png_dir / base_name
-        
-        # Converte o PDF em imagens PNG com pré-processamento
-        #converter_pdf_para_png_com_preprocessamento(pdf_file, pdf_png_dir)
-        
-        # Extrai o texto do PDF
-        extracted_text = extract_text_from_pdf(str(pdf_file))
-        save_extracted_text(extracted_text, txt_dir / f"{base_name}.txt")
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
-        # Processa as informações médicas
-        structured_data = process_medical_information(extracted_text)
-        save_json(structured_data, json_dir / f"{base_name}.json")
+def ocr_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--ocr-concurrency", type=int, default=get_env_int("OCR_CONCURRENCY", 4),
+                        help="Extrações de texto simultâneas (padrão: OCR_CONCURRENCY ou 4)")
+    parser.add_argument("--text-backend", choices=["auto", "llmwhisperer", "native", "tesseract"],
+                        default=os.getenv("TEXT_BACKEND", "auto"),
+                        help="Extração de texto; auto usa a camada de texto do PDF quando existe (padrão: TEXT_BACKEND ou auto)")
+    parser.add_argument("--ocr-fallback", choices=["llmwhisperer", "tesseract"],
+                        default=os.getenv("OCR_FALLBACK", "llmwhisperer"),
+                        help="OCR usado pelo modo auto para PDFs sem camada de texto (padrão: OCR_FALLBACK ou llmwhisperer)")
+    parser.add_argument("--no-ocr-cache", action="store_true",
+                        help="Ignora o cache de OCR e reextrai o texto de todos os PDFs")
+    parser.add_argument("--cpu-workers", type=int, default=get_env_int("CPU_WORKERS", 0) or None,
+                        help="Processos do pool de rasterização do tesseract (padrão: CPU_WORKERS ou número de CPUs)")
+    return parser
 
-    except Exception as e:
-        logging.error(f"Falha ao processar {pdf_file.name}: {e}")
+def llm_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--llm-concurrency", type=int, default=get_env_int("LLM_CONCURRENCY", 4),
+                        help="Chamadas simultâneas ao LLM (padrão: LLM_CONCURRENCY ou 4)")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Ignora o cache de resultados do LLM e reestrutura todos os textos")
+    parser.add_argument("--sectioned", action="store_true",
+                        help="Extrai cada seção do formulário em uma chamada separada e paralela ao LLM")
+    parser.add_argument("--no-repair", action="store_true",
+                        help="Não valida a resposta contra o FormDoc nem repete as seções inválidas")
+    parser.add_argument("--compact-schema", action="store_true",
+                        help="Usa instruções de formato compactas (famílias de campos agrupadas, sem defaults)")
+    parser.add_argument("--no-store", action="store_true",
+                        help="Não grava os registros estruturados na tabela de consulta (STORE_PATH)")
+    return parser
 
+def shard_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--shard", type=shard_arg, metavar="i/N",
+                        help="Processa só os PDFs do shard i de N (hash estável do nome), com ledger e saídas "
+                             "próprios em scans/shards/i-of-N; combine com python src/shard.py merge")
+    return parser
+
+def ledger_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Recoloca na fila os PDFs que falharam em execuções anteriores")
+    parser.add_argument("--ignore-ledger", action="store_true",
+                        help="Reprocessa todos os PDFs, mesmo os já concluídos")
+    return parser
+
+def dedup_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Não procura cópias de documentos já processados (mesmo PDF ou mesmo texto) "
+                             "antes do OCR e do LLM")
+    return parser
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Sem comando, roda o pipeline completo (compatível com `python src/main.py --watch` etc.)
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv.insert(0, "run")
+
+    parser = argparse.ArgumentParser(description="Extrai dados estruturados dos formulários em scans/pdf.")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="{" + ",".join(COMMANDS) + "}")
+
+    run = commands.add_parser("run", parents=[ocr_options(), llm_options(), shard_options(), ledger_options(), dedup_options()],
+                              help="OCR e LLM dos PDFs novos ou alterados (padrão)")
+    run.add_argument("--watch", action="store_true",
+                     help="Modo serviço: continua rodando e processa cada PDF que chegar em scans/pdf")
+    run.add_argument("--debounce", type=float, default=float(os.getenv("WATCH_DEBOUNCE", "2")),
+                     help="Segundos sem mudança antes de processar um PDF no modo watch (padrão: WATCH_DEBOUNCE ou 2)")
+    run.add_argument("--poll-interval", type=float, default=float(os.getenv("WATCH_POLL_INTERVAL", "1")),
+                     help="Intervalo entre varreduras de scans/pdf no modo watch (padrão: WATCH_POLL_INTERVAL ou 1)")
+    run.add_argument("--metrics-port", type=int, default=get_env_int("METRICS_PORT", 9108),
+                     help="Porta do endpoint /metrics (Prometheus) no modo watch; 0 desativa (padrão: METRICS_PORT ou 9108)")
+
+    commands.add_parser("extract", parents=[ocr_options(), shard_options(), ledger_options(), dedup_options()],
+                        help="Só o OCR: grava scans/txt e deixa os PDFs em ocr_done (sem importar o LLM)")
+    commands.add_parser("structure", parents=[llm_options(), shard_options(), dedup_options()],
+                        help="Só o LLM: estrutura os PDFs em ocr_done a partir do texto já extraído")
+
+    export = commands.add_parser("export", help="Exporta os JSONs para a tabela unificada (CSV ou Parquet)")
+    export.add_argument("--json-dir", default="scans/json")
+    export.add_argument("--shards", action="store_true", help="Combina os JSONs de scans/shards/*/json")
+    export.add_argument("--output", help="Padrão: scans/csv/unified.csv ou scans/parquet/unified")
+    export.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    export.add_argument("--incremental", action="store_true",
+                        help="Acrescenta apenas os JSONs novos desde a última exportação")
+    export.add_argument("--chunk-size", type=int, default=1000)
+
+    status = commands.add_parser("status", parents=[shard_options()],
+                                 help="Quantidade de PDFs por estágio no ledger e as falhas")
+    status.add_argument("--failures", action="store_true", help="Lista os PDFs com falha e o último erro")
+    status.add_argument("--duplicates", action="store_true", help="Lista as duplicatas e o documento original de cada uma")
+    return parser.parse_args(argv)
+
+def stage_paths(shard):
+    """Diretórios de texto e JSON, ledger e tabela de registros deste processo (os do shard, com --shard)."""
+    if shard:
+        output_dir = shard_dir(*shard)
+        return output_dir / 'txt', output_dir / 'json', output_dir / 'ledger.db', output_dir / 'records.db'
+    return (Path('scans/txt'), Path('scans/json'), Path(os.getenv("LEDGER_PATH", "scans/ledger.db")),
+            Path(os.getenv("STORE_PATH", "scans/records.db")))
+
+def rate_budget(shard):
+    """Limites de RPM/TPM deste processo: com --shard i/N, 1/N de cada (0 continua desativando o limite)."""
+    share = shard[1] if shard else 1
+
+    def budget(name, default):
+        value = get_env_int(name, default)
+        return max(1, value // share) if value else value
+
+    return budget
+
+def open_text_stage(args, budget):
+    """Scheduler, backend de extração de texto e cache de OCR."""
+    from cache import open_ocr_cache
+    from scheduler import RateLimitedScheduler
+    from text_backends import make_text_backend
+
+    ocr_scheduler = RateLimitedScheduler(
+        "OCR", rpm=budget("OCR_RPM", 0), max_concurrency=args.ocr_concurrency,
+        max_attempts=get_env_int("RETRY_MAX_ATTEMPTS", 6)
+    )
+    text_backend = make_text_backend(
+        args.text_backend, fallback=args.ocr_fallback, tesseract_lang=os.getenv("TESSERACT_LANG", "por"),
+        scheduler=ocr_scheduler, cpu_workers=args.cpu_workers
+    )
+    ocr_cache = None if args.no_ocr_cache else open_ocr_cache()
+    return ocr_scheduler, text_backend, ocr_cache
+
+def open_llm_stage(args, budget):
+    """Scheduler, extrator, impressão digital da estruturação e cache do LLM."""
+    from cache import open_llm_cache
+    from process import MedicalExtractor, structuring_fingerprint
+    from scheduler import RateLimitedScheduler
+
+    calls_per_document = 1
+    if args.sectioned or not args.no_repair:
+        from sections import RepairingExtractor, SectionedExtractor, form_sections
+    if args.sectioned:
+        # Cada documento dispara uma chamada por seção
+        calls_per_document = len(form_sections())
+    llm_scheduler = RateLimitedScheduler(
+        "LLM", rpm=budget("LLM_RPM", 500), tpm=budget("LLM_TPM", 200000),
+        max_concurrency=args.llm_concurrency * calls_per_document,
+        max_attempts=get_env_int("RETRY_MAX_ATTEMPTS", 6),
+        output_tokens=get_env_int("LLM_OUTPUT_TOKENS", 1000)
+    )
+    if args.sectioned:
+        extractor = SectionedExtractor(scheduler=llm_scheduler)
+        mode = "sections"
+    elif args.no_repair:
+        extractor = MedicalExtractor(scheduler=llm_scheduler, compact=args.compact_schema)
+        mode = "full"
+    else:
+        extractor = RepairingExtractor(scheduler=llm_scheduler, compact=args.compact_schema)
+        mode = "repair"
+    if args.compact_schema and not args.sectioned:
+        from compact_schema import instruction_tokens
+        tokens = instruction_tokens(extractor.model_name)
+        logging.info(f"Format instructions: {tokens['compact']} tokens compact vs {tokens['pydantic']} as JSON schema")
+        mode += "+compact"
+    llm_fingerprint = structuring_fingerprint(mode)
+    llm_cache = None if args.no_llm_cache else open_llm_cache(llm_fingerprint)
+    return llm_scheduler, extractor, llm_fingerprint, llm_cache
+
+async def _not_extracted(pdf_path):
+    raise RuntimeError(f"No extracted text for {pdf_path}; run the extract command first")
+
+def run_pipeline(args):
+    """Comandos run, extract e structure: o Pipeline com um ou os dois estágios."""
+    from ledger import OCR_DONE, JobLedger
+    from metrics import configure_tracing, serve_metrics
+    from pipeline import Pipeline, run_batch
+    from utils import create_directories
+
+    shard_suffix = f"_shard-{args.shard[0]}-of-{args.shard[1]}" if args.shard else ""
+    log_filepath = configure_logging(shard_suffix)
+    spans_path = os.getenv("METRICS_SPANS_PATH") or os.path.splitext(log_filepath)[0] + ".spans.jsonl"
+    tracer = configure_tracing(spans_path)
 
-def main():
-    load_environment()
-    configure_logging()
-    
     logging.info("Iniciando a execução do script.")
-    
+
     pdf_dir = Path('scans/pdf')
-    txt_dir = Path('scans/txt')
-    json_dir = Path('scans/json')
     png_dir = Path('scans/png')
-    
+    txt_dir, json_dir, ledger_path, store_path = stage_paths(args.shard)
+    if args.shard:
+        logging.info(f"Shard {args.shard[0]}/{args.shard[1]}: outputs in {txt_dir.parent}")
+
     create_directories([pdf_dir, txt_dir, json_dir, png_dir])
-    
-    for pdf_file in pdf_dir.glob('*.pdf'):
-        process_single_pdf(pdf_file, txt_dir, json_dir, png_dir)
-    
+
+    budget = rate_budget(args.shard)
+    extract = args.command in ("run", "extract")
+    structure = args.command in ("run", "structure")
+    schedulers = []
+    caches = []
+    text_backend = extractor = None
+    pipeline_options = dict(structure=structure)
+    if extract:
+        ocr_scheduler, text_backend, ocr_cache = open_text_stage(args, budget)
+        schedulers.append(ocr_scheduler)
+        caches.append(ocr_cache)
+        pipeline_options.update(ocr_concurrency=args.ocr_concurrency, extract_fn=text_backend.aextract,
+                                ocr_cache=ocr_cache, ocr_cache_params=text_backend.cache_params)
+    else:
+        pipeline_options.update(extract_fn=_not_extracted)
+    if structure:
+        llm_scheduler, extractor, llm_fingerprint, llm_cache = open_llm_stage(args, budget)
+        schedulers.append(llm_scheduler)
+        caches.append(llm_cache)
+        pipeline_options.update(llm_concurrency=args.llm_concurrency, structure_fn=extractor.aextract,
+                                llm_cache=llm_cache, llm_fingerprint=llm_fingerprint)
+        if not args.no_store:
+            from store import RecordStore
+            pipeline_options.update(store=RecordStore(store_path))
+
+    ledger = JobLedger(ledger_path)
+    pipeline_options.update(ledger=ledger)
+    if not args.no_dedup:
+        from dedup import DedupIndex
+        pipeline_options.update(dedup=DedupIndex(ledger_path))
+    select = (lambda pdf_files: select_shard(pdf_files, *args.shard)) if args.shard else None
+    retry_failed = getattr(args, "retry_failed", False)
+    ignore_ledger = getattr(args, "ignore_ledger", False)
+
+    if getattr(args, "watch", False):
+        from watcher import watch
+
+        metrics_server = serve_metrics(port=args.metrics_port) if args.metrics_port else None
+
+        async def serve():
+            pipeline = Pipeline(txt_dir, json_dir, **pipeline_options)
+            pipeline.start()
+            await watch(pipeline, pdf_dir, ledger=ledger, debounce=args.debounce, poll_interval=args.poll_interval,
+                        retry_failed=retry_failed, ignore_ledger=ignore_ledger, select=select)
+            pipeline.report()
+
+        asyncio.run(serve())
+        if metrics_server is not None:
+            metrics_server.shutdown()
+    else:
+        pdf_files = sorted(pdf_dir.glob('*.pdf'))
+        if select is not None:
+            pdf_files = select(pdf_files)
+        if not ignore_ledger:
+            pdf_files = ledger.plan(pdf_files, retry_failed=retry_failed)
+        if not extract:
+            # structure: só os PDFs cujo texto já foi extraído
+            pdf_files = [pdf_file for pdf_file in pdf_files
+                         if ledger.stage_of(pdf_file.name) == OCR_DONE and (txt_dir / f"{pdf_file.stem}.txt").exists()]
+        elif not structure and not ignore_ledger:
+            # extract: os que já passaram pelo OCR ficam para o structure
+            pdf_files = [pdf_file for pdf_file in pdf_files if ledger.stage_of(pdf_file.name) != OCR_DONE]
+        logging.info(f"{len(pdf_files)} PDF(s) a processar.")
+        asyncio.run(run_batch(pdf_files, txt_dir, json_dir, **pipeline_options))
+
+    if text_backend is not None:
+        text_backend.report()
+        text_backend.close()
+    for scheduler in schedulers:
+        scheduler.report()
+    if hasattr(extractor, "parse_stats"):
+        extractor.parse_stats.report()
+    tracer.registry.report()
+    tracer.close()
+    logging.info(f"Per-stage spans written to {spans_path}")
+    for cache in caches:
+        if cache is not None:
+            cache.evict()
+
     logging.info("Execução do script concluída.")
 
+def export_table(args):
+    from export import StreamingExporter
+
+    output = args.output or ("scans/csv/unified.csv" if args.format == "csv" else "scans/parquet/unified")
+    json_dirs = args.json_dir
+    if args.shards:
+        from shard import shard_json_dirs
+        json_dirs = shard_json_dirs()
+        if not json_dirs:
+            raise RuntimeError("No shard outputs found; run with --shard first")
+    StreamingExporter(chunk_size=args.chunk_size).export(
+        json_dirs, output, fmt=args.format, incremental=args.incremental
+    )
+
+def print_status(args):
+    from ledger import JobLedger
+
+    if args.shard:
+        ledger_paths = [stage_paths(args.shard)[2]]
+    else:
+        from shard import shards_root
+        ledger_paths = [stage_paths(None)[2]] + sorted(shards_root().glob("*-of-*/ledger.db"))
+    for ledger_path in ledger_paths:
+        if not Path(ledger_path).exists():
+            continue
+        ledger = JobLedger(ledger_path)
+        summary = ledger.summary()
+        stages = ", ".join(f"{stage}={count}" for stage, count in sorted(summary.items()))
+        print(f"{ledger_path}: {stages or 'empty'}")
+        if args.failures:
+            for pdf_name, failed_stage, attempts, error in ledger.failures():
+                print(f"  {pdf_name}: {failed_stage} after {attempts} attempt(s): {error}")
+        if args.duplicates:
+            from dedup import DedupIndex
+            for pdf_name, original, reason in DedupIndex(ledger_path, load=False).links():
+                print(f"  {pdf_name}: duplicate of {original} ({reason})")
+
+def main(argv=None):
+    load_environment()
+    args = parse_args(argv)
+    if args.command == "export":
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        export_table(args)
+    elif args.command == "status":
+        print_status(args)
+    else:
+        run_pipeline(args)
+
 
 if __name__ == "__main__":
     main()
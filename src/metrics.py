@@ -0,0 +1,207 @@
+import bisect
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from pathlib import Path
+import orjson
+
+# Limites dos buckets do histograma de duração (segundos), no estilo do Prometheus
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120, 300)
+# Durações recentes guardadas por estágio para os percentis do relatório
+RECENT = 10000
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """Um estágio de um documento: duração, resultado e atributos (bytes, páginas, tokens, ...)."""
+    __slots__ = ("stage", "document", "attrs", "start", "duration", "ok", "error")
+
+    def __init__(self, stage, document, attrs):
+        self.stage = stage
+        self.document = document
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = 0.0
+        self.ok = True
+        self.error = None
+
+    def add(self, **values):
+        """Soma valores numéricos aos atributos do span (ex.: tokens de várias chamadas)."""
+        for key, value in values.items():
+            self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def set(self, **values):
+        self.attrs.update(values)
+
+    def record(self):
+        return {
+            "ts": datetime.fromtimestamp(self.start, timezone.utc).isoformat(),
+            "document": self.document,
+            "stage": self.stage,
+            "duration": round(self.duration, 6),
+            "ok": self.ok,
+            **({"error": self.error} if self.error else {}),
+            **self.attrs,
+        }
+
+class MetricsRegistry:
+    """Contadores e histogramas por estágio, renderizados no formato texto do Prometheus."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.recent = defaultdict(lambda: deque(maxlen=RECENT))
+
+    def observe(self, span):
+        with self.lock:
+            outcome = "ok" if span.ok else "error"
+            self.counters[("pipeline_spans_total", (("stage", span.stage), ("outcome", outcome)))] += 1
+            for key, value in span.attrs.items():
+                if isinstance(value, bool):
+                    if value:
+                        self.counters[(f"pipeline_{key}_total", (("stage", span.stage),))] += 1
+                elif isinstance(value, (int, float)):
+                    self.counters[(f"pipeline_{key}_total", (("stage", span.stage),))] += value
+            counts, total = self.histograms.get(span.stage, ([0] * (len(BUCKETS) + 1), 0.0))
+            counts[bisect.bisect_left(BUCKETS, span.duration)] += 1
+            self.histograms[span.stage] = (counts, total + span.duration)
+            self.recent[span.stage].append(span.duration)
+
+    def percentiles(self, stage, quantiles=(0.5, 0.95)):
+        with self.lock:
+            durations = sorted(self.recent.get(stage, ()))
+        if not durations:
+            return [0.0 for _ in quantiles]
+        return [durations[min(len(durations) - 1, int(q * len(durations)))] for q in quantiles]
+
+    def render(self):
+        lines = []
+        with self.lock:
+            described = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in described:
+                    lines.append(f"# TYPE {name} counter")
+                    described.add(name)
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value:g}")
+            lines.append("# TYPE pipeline_stage_seconds histogram")
+            for stage, (counts, total) in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'pipeline_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'pipeline_stage_seconds_sum{{stage="{stage}"}} {total:g}')
+                lines.append(f'pipeline_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        with self.lock:
+            stages = sorted(self.histograms)
+        for stage in stages:
+            p50, p95 = self.percentiles(stage)
+            count = len(self.recent[stage])
+            logging.info(f"Stage {stage}: {count} span(s), p50 {p50 * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+
+class Tracer:
+    """
+    Emite um span por estágio de cada documento: uma linha JSON em spans_path (se
+    configurado) e a agregação no registry, usada pelo relatório e pelo endpoint /metrics.
+    """
+
+    def __init__(self, spans_path=None, registry=None):
+        self.registry = registry or MetricsRegistry()
+        self.spans_file = None
+        if spans_path:
+            Path(spans_path).parent.mkdir(parents=True, exist_ok=True)
+            self.spans_file = open(spans_path, 'ab')
+
+    @contextlib.contextmanager
+    def span(self, stage, document=None, **attrs):
+        parent = _current.get()
+        if document is None and parent is not None:
+            document = parent.document
+        current = Span(stage, document, attrs)
+        token = _current.set(current)
+        start = time.perf_counter()
+        try:
+            yield current
+        except BaseException as e:
+            current.ok = False
+            current.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current.duration = time.perf_counter() - start
+            _current.reset(token)
+            self.emit(current)
+
+    def emit(self, span):
+        self.registry.observe(span)
+        if self.spans_file is not None:
+            self.spans_file.write(orjson.dumps(span.record(), default=str) + b"\n")
+            self.spans_file.flush()
+
+    def close(self):
+        if self.spans_file is not None:
+            self.spans_file.close()
+            self.spans_file = None
+
+_tracer = Tracer()
+
+def configure_tracing(spans_path=None):
+    """Define o arquivo JSON-lines dos spans; retorna o Tracer global."""
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(spans_path)
+    return _tracer
+
+def get_tracer():
+    return _tracer
+
+def span(stage, document=None, **attrs):
+    return _tracer.span(stage, document, **attrs)
+
+def current_span():
+    return _current.get()
+
+def annotate(**values):
+    """Soma valores ao span em andamento (se houver), ex.: annotate(retries=1)."""
+    current = _current.get()
+    if current is not None:
+        current.add(**values)
+
+def serve_metrics(host="127.0.0.1", port=9108, registry=None):
+    """
+    Expõe GET /metrics no formato texto do Prometheus em uma thread daemon.
+
+    :return: O ThreadingHTTPServer (chame shutdown() para parar).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    def current_registry():
+        return registry or _tracer.registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0].rstrip("/") != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = current_registry().render().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,368 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from cache import ocr_cache_key, llm_cache_key, sha256_file
+from dedup import EXACT
+from ledger import OCR_DONE
+from metrics import span
+from text_backends import PAGE_SEPARATOR
+from utils import save_extracted_text, save_json
+
+@dataclass
+class BatchStats:
+    total: int = 0
+    extracted: int = 0
+    structured: int = 0
+    failed: int = 0
+    duplicates: int = 0
+    ocr_seconds: float = 0.0
+    llm_seconds: float = 0.0
+    elapsed: float = 0.0
+
+    def throughput(self):
+        """Documentos estruturados por minuto de relógio."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.structured / self.elapsed * 60
+
+    def report(self, structure=True):
+        duplicates = f", {self.duplicates} duplicate(s)" if self.duplicates else ""
+        if not structure:
+            logging.info(
+                f"Extraction finished: {self.extracted}/{self.total} extracted, {self.failed} failed{duplicates} "
+                f"in {self.elapsed:.1f}s (OCR {self.ocr_seconds:.1f}s cumulative)"
+            )
+            return
+        logging.info(
+            f"Batch finished: {self.structured}/{self.total} structured, {self.failed} failed{duplicates} "
+            f"in {self.elapsed:.1f}s ({self.throughput():.1f} docs/min; "
+            f"OCR {self.ocr_seconds:.1f}s, LLM {self.llm_seconds:.1f}s cumulative)"
+        )
+
+class Pipeline:
+    """
+    Pipeline assíncrono de dois estágios (OCR -> LLM) que aceita PDFs enquanto roda.
+    Cada estágio tem seu próprio limite de concorrência, de modo que a extração do
+    arquivo N+1 acontece enquanto o arquivo N está sendo estruturado. Usado por
+    run_batch (lista fixa) e pelo modo watch (PDFs chegando continuamente).
+
+    :param txt_dir: Diretório onde os textos extraídos serão salvos.
+    :param json_dir: Diretório onde os JSONs estruturados serão salvos.
+    :param ocr_concurrency: Número máximo de extrações de texto simultâneas.
+    :param llm_concurrency: Número máximo de chamadas ao LLM simultâneas.
+    :param extract_fn: Corrotina (caminho -> texto); por padrão usa o LLMWhisperer
+        (ver text_backends para os backends locais).
+    :param structure_fn: Corrotina (texto -> dict); por padrão usa o ChatOpenAI.
+    :param ocr_cache: DiskCache opcional com textos já extraídos, indexado pelo hash do PDF.
+    :param ocr_cache_params: Parâmetros do extrator que entram na chave do ocr_cache.
+    :param llm_cache: DiskCache opcional com JSONs já estruturados, indexado pelo hash do texto.
+    :param llm_fingerprint: Impressão digital do schema/modelo/prompt usada na chave do llm_cache.
+    :param ledger: JobLedger opcional onde o estado de cada PDF é registrado por estágio.
+    :param store: RecordStore opcional que recebe cada JSON salvo (upsert), para consultas de coorte.
+    :param dedup: DedupIndex opcional; cópias de documentos já conhecidos são ligadas ao
+        original antes do OCR (bytes idênticos) ou antes do LLM (texto quase igual).
+    :param structure: Se False, roda só o estágio de OCR (os PDFs param em ocr_done e o
+        LLM nem é importado).
+    """
+
+    def __init__(self, txt_dir, json_dir, ocr_concurrency=4, llm_concurrency=4,
+                 extract_fn=None, structure_fn=None, ocr_cache=None, ocr_cache_params=None,
+                 llm_cache=None, llm_fingerprint=None, ledger=None, store=None, dedup=None,
+                 structure=True):
+        self.txt_dir = txt_dir
+        self.json_dir = json_dir
+        self.ocr_concurrency = max(1, ocr_concurrency)
+        self.llm_concurrency = max(1, llm_concurrency)
+        if extract_fn is None:
+            from utils import extract_text_from_pdf_async as extract_fn
+        if structure_fn is None and structure:
+            from process import aprocess_medical_information as structure_fn
+        self.extract_fn = extract_fn
+        self.structure_fn = structure_fn
+        self.structure = structure
+        self.ocr_cache = ocr_cache
+        self.ocr_cache_params = ocr_cache_params or {}
+        self.llm_cache = llm_cache
+        self.llm_fingerprint = llm_fingerprint
+        self.ledger = ledger
+        self.store = store
+        self.dedup = dedup
+        self.stats = BatchStats()
+        self.ocr_queue = asyncio.Queue()
+        # Fila limitada: o OCR não se adianta indefinidamente em relação ao LLM
+        self.llm_queue = asyncio.Queue(maxsize=self.llm_concurrency * 2)
+        self.ocr_tasks = []
+        self.llm_tasks = []
+        # Documentos a caminho do LLM que podem ser o original de outros (nome -> Future[bool])
+        self.inflight = {}
+        # Duplicatas esperando o original terminar
+        self.deferred = set()
+        # PDFs em OCR por hash (sha256 -> Future[texto ou None]); cópias idênticas esperam o texto
+        self.ocr_inflight = {}
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.ocr_tasks = [asyncio.create_task(self._ocr_worker()) for _ in range(self.ocr_concurrency)]
+        if self.structure:
+            self.llm_tasks = [asyncio.create_task(self._llm_worker()) for _ in range(self.llm_concurrency)]
+
+    def submit(self, pdf_file):
+        self.stats.total += 1
+        self.ocr_queue.put_nowait(pdf_file)
+
+    async def close(self):
+        """Espera os PDFs já enviados terminarem, encerra os workers e retorna as BatchStats."""
+        for _ in self.ocr_tasks:
+            self.ocr_queue.put_nowait(None)
+        await asyncio.gather(*self.ocr_tasks)
+        while self.deferred:
+            await asyncio.gather(*list(self.deferred))
+        for _ in self.llm_tasks:
+            await self.llm_queue.put(None)
+        await asyncio.gather(*self.llm_tasks)
+        self.stats.elapsed = time.perf_counter() - self.started
+        return self.stats
+
+    def report(self):
+        self.stats.report(self.structure)
+        if self.ocr_cache is not None:
+            self.ocr_cache.report("OCR cache")
+        if self.llm_cache is not None:
+            self.llm_cache.report("LLM cache")
+        if self.ledger is not None:
+            self.ledger.report()
+        if self.dedup is not None:
+            self.dedup.report()
+
+    def _link(self, pdf_file, original, reason, sha256, ocr_skipped=False):
+        self.dedup.link(pdf_file.name, original, reason, sha256, ocr_skipped)
+        self.stats.duplicates += 1
+        if self.ledger is not None:
+            self.ledger.mark_duplicate(pdf_file.name)
+        logging.info(f"{pdf_file.name} is a duplicate of {original} ({reason}); "
+                     f"skipping {'OCR and LLM' if ocr_skipped else 'LLM'}")
+
+    def _settle(self, pdf_name, structured):
+        """Registra o resultado de um possível original e libera as duplicatas que o esperam."""
+        if self.dedup is None:
+            return
+        if structured:
+            self.dedup.mark_structured(pdf_name)
+        else:
+            self.dedup.mark_failed(pdf_name)
+        future = self.inflight.pop(pdf_name, None)
+        if future is not None:
+            future.set_result(structured)
+
+    def _admit(self, pdf_file, sha256, tokens, registro):
+        """Registra o documento como candidato a original de outros."""
+        self.dedup.register(pdf_file.name, sha256, tokens, registro)
+        if self.structure:
+            self.inflight[pdf_file.name] = asyncio.get_running_loop().create_future()
+
+    def _deduplicate(self, pdf_file, extracted_text, sha256, ocr_skipped=False):
+        """
+        Procura um original para o texto extraído. Se o original já foi estruturado, liga o
+        documento a ele; se ainda está a caminho do LLM, espera o resultado em uma tarefa à parte
+        (sem ocupar o worker de OCR) e liga ou, se o original falhar, procura de novo.
+
+        :param ocr_skipped: O texto veio do OCR de uma cópia idêntica, não do próprio documento.
+        :return: True se o documento deve seguir para o LLM agora.
+        """
+        dedup = self.dedup
+        with span("dedup", pdf_file.name) as dedup_span:
+            tokens, registro = dedup.fingerprint(extracted_text)
+            original, reason = dedup.find_exact(pdf_file.name, sha256, include_pending=self.structure), EXACT
+            if original is None:
+                original, reason = dedup.find_similar(pdf_file.name, tokens, registro, include_pending=self.structure)
+            dedup_span.set(duplicate=original is not None)
+        if original is None:
+            self._admit(pdf_file, sha256, tokens, registro)
+            return True
+        future = self.inflight.get(original)
+        if future is None:
+            self._link(pdf_file, original, reason, sha256, ocr_skipped)
+            return False
+
+        async def wait_for_original():
+            try:
+                if await future:
+                    self._link(pdf_file, original, reason, sha256, ocr_skipped)
+                    return
+                # O original falhou: procura outro (ex.: outra cópia que já seguiu) ou vai ao LLM
+                send = self._deduplicate(pdf_file, extracted_text, sha256, ocr_skipped)
+            except Exception as e:
+                logging.warning(f"Duplicate check failed for {pdf_file.name}: {e}")
+                send = True
+            if send:
+                await self.llm_queue.put((pdf_file, extracted_text))
+
+        task = asyncio.create_task(wait_for_original())
+        self.deferred.add(task)
+        task.add_done_callback(self.deferred.discard)
+        return False
+
+    def _release_ocr(self, sha256, extracted_text):
+        """Entrega o texto (ou None, se o OCR falhou) às cópias idênticas que esperam este PDF."""
+        future = self.ocr_inflight.pop(sha256, None)
+        if future is not None:
+            future.set_result(extracted_text)
+
+    async def _digest(self, pdf_file):
+        """SHA-256 do PDF, do ledger quando já foi calculado no plan; o arquivo é lido no máximo uma vez."""
+        sha256 = self.ledger.known_digest(pdf_file) if self.ledger is not None else None
+        if sha256 is None:
+            sha256 = await asyncio.to_thread(sha256_file, pdf_file)
+        return sha256
+
+    async def _ocr_worker(self):
+        stats, ledger, ocr_cache = self.stats, self.ledger, self.ocr_cache
+        while True:
+            pdf_file = await self.ocr_queue.get()
+            if pdf_file is None:
+                return
+            start = time.perf_counter()
+            txt_path = self.txt_dir / f"{pdf_file.stem}.txt"
+            sha256 = owned = None
+            extracted_text = None
+            ocr_skipped = False
+            try:
+                if self.dedup is not None or ocr_cache is not None:
+                    sha256 = await self._digest(pdf_file)
+                if self.dedup is not None:
+                    # Cópia byte a byte de um documento já estruturado: nem o OCR é necessário
+                    original = self.dedup.find_exact(pdf_file.name, sha256)
+                    if original is not None:
+                        self._link(pdf_file, original, EXACT, sha256, ocr_skipped=True)
+                        continue
+                    pending = self.ocr_inflight.get(sha256)
+                    if pending is None:
+                        owned = sha256
+                        self.ocr_inflight[sha256] = asyncio.get_running_loop().create_future()
+                    else:
+                        # Cópia de um PDF ainda em OCR neste lote: usa o texto dele em vez de repetir o OCR
+                        extracted_text = await pending
+                        ocr_skipped = extracted_text is not None
+                with span("ocr", pdf_file.name, bytes_in=pdf_file.stat().st_size) as ocr_span:
+                    if ocr_skipped:
+                        ocr_span.set(shared=True)
+                    if ledger is not None:
+                        # Retomada: o texto de um PDF que já passou pelo OCR é reaproveitado
+                        if extracted_text is None and ledger.stage_of(pdf_file.name) == OCR_DONE and txt_path.exists():
+                            extracted_text = txt_path.read_text(encoding='utf-8')
+                            ocr_span.set(resumed=True)
+                        ledger.start(pdf_file.name)
+                    if extracted_text is None and ocr_cache is not None:
+                        cache_key = ocr_cache_key(pdf_file, sha256=sha256, **self.ocr_cache_params)
+                        extracted_text = ocr_cache.get(cache_key)
+                        ocr_span.set(cache_hit=extracted_text is not None)
+                    if extracted_text is None:
+                        extracted_text = await self.extract_fn(str(pdf_file))
+                        if ocr_cache is not None:
+                            ocr_cache.put(cache_key, extracted_text)
+                    ocr_span.set(pages=extracted_text.count(PAGE_SEPARATOR) + 1)
+                with span("save_text", pdf_file.name) as save_span:
+                    save_span.set(bytes_out=save_extracted_text(extracted_text, txt_path))
+            except Exception as e:
+                logging.error(f"Falha ao processar {pdf_file.name}: {e}")
+                stats.failed += 1
+                if ledger is not None:
+                    ledger.mark_failed(pdf_file.name, "ocr", e)
+                if owned is not None:
+                    self._release_ocr(owned, None)
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                stats.ocr_seconds += elapsed
+            stats.extracted += 1
+            if ledger is not None:
+                ledger.mark_ocr_done(pdf_file.name, elapsed)
+            if self.dedup is not None:
+                try:
+                    send = self._deduplicate(pdf_file, extracted_text, sha256, ocr_skipped)
+                except Exception as e:
+                    logging.warning(f"Duplicate check failed for {pdf_file.name}: {e}")
+                    send = True
+                finally:
+                    # O documento já foi registrado (ou ligado): as cópias que esperam o OCR dele o encontram
+                    if owned is not None:
+                        self._release_ocr(owned, extracted_text)
+                if not send:
+                    continue
+            if self.structure:
+                await self.llm_queue.put((pdf_file, extracted_text))
+
+    async def _llm_worker(self):
+        stats, ledger, llm_cache = self.stats, self.ledger, self.llm_cache
+        while True:
+            item = await self.llm_queue.get()
+            if item is None:
+                return
+            pdf_file, extracted_text = item
+            start = time.perf_counter()
+            try:
+                with span("structure", pdf_file.name, bytes_in=len(extracted_text.encode('utf-8'))) as structure_span:
+                    structured_data = None
+                    if llm_cache is not None:
+                        cache_key = llm_cache_key(extracted_text, self.llm_fingerprint)
+                        cached = llm_cache.get(cache_key)
+                        structure_span.set(cache_hit=cached is not None)
+                        if cached is not None:
+                            structured_data = json.loads(cached)
+                    if structured_data is None:
+                        structured_data = await self.structure_fn(extracted_text)
+                        if structured_data is None:
+                            raise RuntimeError("LLM response could not be parsed")
+                        if llm_cache is not None:
+                            llm_cache.put(cache_key, json.dumps(structured_data, ensure_ascii=False))
+                json_path = self.json_dir / f"{pdf_file.stem}.json"
+                with span("save_json", pdf_file.name) as save_span:
+                    save_span.set(bytes_out=save_json(structured_data, json_path))
+            except Exception as e:
+                logging.error(f"Falha ao processar {pdf_file.name}: {e}")
+                stats.failed += 1
+                if ledger is not None:
+                    ledger.mark_failed(pdf_file.name, "llm", e)
+                self._settle(pdf_file.name, False)
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                stats.llm_seconds += elapsed
+            stats.structured += 1
+            if ledger is not None:
+                ledger.mark_structured(pdf_file.name, elapsed)
+            self._settle(pdf_file.name, True)
+            if self.store is not None:
+                try:
+                    with span("store", pdf_file.name):
+                        self.store.upsert(json_path.name, structured_data, json_path.stat().st_mtime_ns)
+                except Exception as e:
+                    # O JSON já está salvo; um sync posterior recupera o registro
+                    logging.warning(f"Could not update the record store for {pdf_file.name}: {e}")
+
+async def run_batch(pdf_files, txt_dir, json_dir, ocr_concurrency=4, llm_concurrency=4,
+                    extract_fn=None, structure_fn=None, ocr_cache=None, ocr_cache_params=None,
+                    llm_cache=None, llm_fingerprint=None, ledger=None, store=None, dedup=None,
+                    structure=True):
+    """
+    Processa um lote de PDFs no Pipeline de dois estágios (OCR -> LLM).
+
+    :param pdf_files: Lista de caminhos (Path) dos PDFs a processar.
+    Os demais parâmetros são os do Pipeline.
+    :return: BatchStats com contagens e tempos do lote.
+    """
+    pipeline = Pipeline(
+        txt_dir, json_dir, ocr_concurrency=ocr_concurrency, llm_concurrency=llm_concurrency,
+        extract_fn=extract_fn, structure_fn=structure_fn, ocr_cache=ocr_cache,
+        ocr_cache_params=ocr_cache_params, llm_cache=llm_cache, llm_fingerprint=llm_fingerprint,
+        ledger=ledger, store=store, dedup=dedup, structure=structure
+    )
+    pipeline.start()
+    for pdf_file in pdf_files:
+        pipeline.submit(pdf_file)
+    stats = await pipeline.close()
+    pipeline.report()
+    return stats
@@ -1,53 +1,187 @@
 from models import FormDoc  # Assuming FormDoc contains all the nested models
 from langchain.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate, ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
+from llm_backends import make_chat_model, llm_backend_identity
+from scheduler import count_message_tokens
+from compact_schema import render_compact_schema
+from metrics import annotate, span
+import hashlib
 import logging
 import json
+import orjson
 import re
 
+def strip_fences(response_text):
+    return re.sub(r"```json|```", "", response_text).strip()
+
 def clean_and_parse_response(response_text):
-    cleaned_text = re.sub(r"```json|```", "", response_text).strip()
-    try:
-        return json.loads(cleaned_text)
-    except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse JSON data: {e}")
-        return None
+    with span("parse", bytes_in=len(response_text)) as parse_span:
+        cleaned_text = strip_fences(response_text)
+        try:
+            return orjson.loads(cleaned_text)
+        except orjson.JSONDecodeError as e:
+            logging.error(f"Failed to parse JSON data: {e}")
+            parse_span.set(invalid=True)
+            return None
+
+MODEL_NAME = "gpt-4o-mini"
+
+PREAMBLE = ("You are provided with text extracted from a medical" +
+            "form, which contains various data fields related to patient" + 
+            "information, diagnoses, treatments, and outcomes." +
+            "Your task is to analyze this text and extract relevant data" +
+            "into a structured JSON format that matches the predefined schema." + 
+            "Ensure that only valid JSON is returned, with all fields populated" +
+            "according to the extracted information. Use null for any missing" + 
+            "data.")
+POSTAMBLE = ("Only return the JSON data in a structured format" +
+             "that matches the schema. Do not include any additional" +
+             "text, comments, or explanations")
+
+SYSTEM_TEMPLATE = "{preamble}"
+HUMAN_TEMPLATE = "{format_instructions}\n\nExtracted Text:\n{extracted_text}\n\n{postamble}"
+
+# Modos de extração; cada um (com ou sem "+compact") tem seu namespace no cache do LLM
+STRUCTURING_MODES = ("full", "repair", "sections")
+
+def format_instructions(compact=False):
+    """Instruções de formato do FormDoc no prompt: as do render_compact_schema ou as do PydanticOutputParser."""
+    if compact:
+        return render_compact_schema(FormDoc)
+    return PydanticOutputParser(pydantic_object=FormDoc).get_format_instructions()
+
+def structuring_fingerprint(mode="full"):
+    """
+    Impressão digital de tudo o que, além do texto, determina a resposta do LLM:
+    o schema do FormDoc, o modelo, os templates do prompt, as instruções de formato
+    como são enviadas (compactas com "+compact"), as instruções por seção dos modos que
+    as usam ("sections" e "repair") e o modo de extração. Qualquer mudança em models.py,
+    nos prompts ou nos renderizadores gera uma nova impressão digital.
+    """
+    base_mode, _, variant = mode.partition("+")
+    fingerprint = {
+        "schema": FormDoc.model_json_schema(),
+        "model": llm_backend_identity(MODEL_NAME),
+        "templates": [PREAMBLE, POSTAMBLE, SYSTEM_TEMPLATE, HUMAN_TEMPLATE],
+        "format_instructions": format_instructions(compact=variant == "compact"),
+    }
+    if base_mode in ("sections", "repair"):
+        from sections import form_sections, section_format_instructions
+
+        fingerprint["section_instructions"] = [section_format_instructions(section) for section in form_sections()]
+    if mode != "full":
+        fingerprint["mode"] = mode
+    payload = json.dumps(fingerprint, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def structuring_fingerprints():
+    """
+    Impressões digitais de todos os modos que main.open_llm_stage pode usar, com e sem
+    instruções compactas. cache.py prune mantém os namespaces delas.
+    """
+    return {structuring_fingerprint(mode + suffix) for mode in STRUCTURING_MODES for suffix in ("", "+compact")}
+
+class MedicalExtractor:
+    """
+    Extrator reutilizável: o parser, as instruções de formato do FormDoc e o prompt são
+    montados uma única vez, e o mesmo cliente de chat (com seu pool de conexões HTTP)
+    atende todas as chamadas. Com um scheduler (RateLimitedScheduler), as chamadas
+    assíncronas respeitam os orçamentos de requisições/tokens e são repetidas em caso de
+    limitação ou falha transitória. Com compact=True, as instruções de formato são as do
+    render_compact_schema em vez do JSON schema completo do PydanticOutputParser.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, temperature=0.0, chat=None, scheduler=None, compact=False):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.scheduler = scheduler
+        self.parser = PydanticOutputParser(pydantic_object=FormDoc)
+        self.format_instructions = format_instructions(compact)
+        self.prompt = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(SYSTEM_TEMPLATE),
+            HumanMessagePromptTemplate.from_template(HUMAN_TEMPLATE)
+        ]).partial(
+            preamble=PREAMBLE,
+            format_instructions=self.format_instructions,
+            postamble=POSTAMBLE
+        )
+        self._chat = chat
+
+    @property
+    def chat(self):
+        # Criado sob demanda para que montar prompts não exija credenciais
+        if self._chat is None:
+            self._chat = make_chat_model(
+                self.model_name, self.temperature, max_retries=0 if self.scheduler is not None else None
+            )
+        return self._chat
+
+    def build_request(self, extracted_text):
+        return self.prompt.format_messages(extracted_text=extracted_text)
+
+    async def ainvoke(self, request):
+        with span("llm") as llm_span:
+            if self.scheduler is None:
+                response = await self.chat.ainvoke(request)
+            else:
+                tokens = count_message_tokens(request, self.model_name) + self.scheduler.output_tokens
+                response = await self.scheduler.run(lambda: self.chat.ainvoke(request), tokens=tokens)
+            usage = getattr(response, "usage_metadata", None) or {}
+            llm_span.set(input_tokens=usage.get("input_tokens", 0), output_tokens=usage.get("output_tokens", 0))
+        # Totais do documento no span do estágio que chamou o LLM
+        annotate(input_tokens=llm_span.attrs["input_tokens"], output_tokens=llm_span.attrs["output_tokens"],
+                 llm_calls=1, retries=llm_span.attrs.get("retries", 0))
+        return response
+
+    def extract(self, extracted_text):
+        try:
+            response = self.chat.invoke(self.build_request(extracted_text))
+            return clean_and_parse_response(response.content)
+        except Exception as e:
+            logging.exception(f"Error processing medical information: {e}")
+            raise RuntimeError("Error processing medical information.")
+
+    async def aextract(self, extracted_text):
+        try:
+            response = await self.ainvoke(self.build_request(extracted_text))
+            return clean_and_parse_response(response.content)
+        except Exception as e:
+            logging.exception(f"Error processing medical information: {e}")
+            raise RuntimeError("Error processing medical information.")
+
+    def extract_many(self, texts, max_concurrency=4):
+        """
+        Estrutura vários textos reutilizando o mesmo cliente. Retorna uma lista na mesma
+        ordem de texts; textos que falharem resultam em None (o erro é registrado no log).
+        """
+        requests = [self.build_request(text) for text in texts]
+        responses = self.chat.batch(
+            requests,
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True
+        )
+        results = []
+        for response in responses:
+            if isinstance(response, Exception):
+                logging.error(f"Error processing medical information: {response}")
+                results.append(None)
+            else:
+                results.append(clean_and_parse_response(response.content))
+        return results
+
+_default_extractor = None
+
+def get_default_extractor():
+    global _default_extractor
+    if _default_extractor is None:
+        _default_extractor = MedicalExtractor()
+    return _default_extractor
+
+def build_request(extracted_text):
+    return get_default_extractor().build_request(extracted_text)
 
 def process_medical_information(extracted_text):
-    preamble = ("You are provided with text extracted from a medical" +
-                "form, which contains various data fields related to patient" + 
-                "information, diagnoses, treatments, and outcomes." +
-                "Your task is to analyze this text and extract relevant data" +
-                "into a structured JSON format that matches the predefined schema." + 
-                "Ensure that only valid JSON is returned, with all fields populated" +
-                "according to the extracted information. Use null for any missing" + 
-                "data.")
-    postamble = ("Only return the JSON data in a structured format" +
-                 "that matches the schema. Do not include any additional" +
-                 "text, comments, or explanations")
-
-    system_template = "{preamble}"
-    human_template = "{format_instructions}\n\nExtracted Text:\n{extracted_text}\n\n{postamble}"
-    
-    system_message_prompt = SystemMessagePromptTemplate.from_template(system_template)
-    human_message_prompt = HumanMessagePromptTemplate.from_template(human_template)
-
-    parser = PydanticOutputParser(pydantic_object=FormDoc)
-    chat_prompt = ChatPromptTemplate.from_messages([system_message_prompt, human_message_prompt])
-    
-    request = chat_prompt.format_prompt(
-        preamble=preamble,
-        format_instructions=parser.get_format_instructions(),
-        extracted_text=extracted_text,
-        postamble=postamble
-    ).to_messages()
-
-    chat = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
-
-    try:
-        response = chat.invoke(request)
-        return clean_and_parse_response(response.content)
-    except Exception as e:
-        logging.exception(f"Error processing medical information: {e}")
-        raise RuntimeError("Error processing medical information.")
+    return get_default_extractor().extract(extracted_text)
+
+async def aprocess_medical_information(extracted_text):
+    return await get_default_extractor().aextract(extracted_text)
@@ -0,0 +1,290 @@
+import asyncio
+import functools
+import logging
+import time
+from metrics import annotate
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+THROTTLE_STATUS = {429}
+TRANSIENT_STATUS = {408, 409, 500, 502, 503, 504}
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model_name):
+    """Vocabulário do tiktoken para o modelo, ou None se não puder ser carregado (tentado uma vez)."""
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logging.warning(f"tiktoken encoding unavailable ({e}); estimating tokens from text length")
+        return None
+
+def count_tokens(text, model_name="gpt-4o-mini"):
+    """
+    Conta os tokens de um texto com o tiktoken. Se o vocabulário não puder ser carregado
+    (ambiente sem rede e sem cache do tiktoken), usa a aproximação de ~4 caracteres por token.
+    """
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages, model_name="gpt-4o-mini"):
+    # ~4 tokens de overhead por mensagem no formato de chat
+    return sum(count_tokens(str(message.content), model_name) + 4 for message in messages) + 3
+
+def _error_chain(exc):
+    while exc is not None:
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+def status_code_of(exc):
+    for error in _error_chain(exc):
+        status = getattr(error, "status_code", None)
+        if status is None and error.args and isinstance(error.args[0], dict):
+            # LLMWhispererClientException guarda o status na mensagem
+            status = error.args[0].get("status_code")
+        if isinstance(status, int) and status > 0:
+            return status
+    return None
+
+def retry_after_of(exc):
+    """Segundos indicados pelo servidor (Retry-After / retry-after-ms), se houver."""
+    for error in _error_chain(exc):
+        value = getattr(error, "retry_after", None)
+        if value is not None:
+            return float(value)
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if headers:
+            if headers.get("retry-after-ms"):
+                try:
+                    return float(headers["retry-after-ms"]) / 1000
+                except ValueError:
+                    pass
+            if headers.get("retry-after"):
+                try:
+                    return float(headers["retry-after"])
+                except ValueError:
+                    pass
+    return None
+
+def is_throttle(exc):
+    return status_code_of(exc) in THROTTLE_STATUS
+
+def is_retryable(exc):
+    status = status_code_of(exc)
+    if status is not None:
+        return status in THROTTLE_STATUS or status in TRANSIENT_STATUS
+    for error in _error_chain(exc):
+        name = type(error).__name__
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)) or \
+                name in ("APITimeoutError", "APIConnectionError", "ReadTimeout", "ConnectTimeout", "ConnectionError"):
+            return True
+    return False
+
+class _PerLoop:
+    """
+    Primitiva do asyncio (Lock, Condition) criada para o event loop em execução. Elas ficam
+    presas ao primeiro loop em que esperam, e os extratores síncronos rodam um asyncio.run
+    por chamada com o mesmo scheduler.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.loop = None
+        self.value = None
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop, self.value = loop, self.factory()
+        return self.value
+
+class TokenBucket:
+    """Balde de fichas reabastecido continuamente: rate fichas por minuto, no máximo rate acumuladas."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = _PerLoop(asyncio.Lock)
+
+    @property
+    def lock(self):
+        return self._lock.get()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(float(amount), self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Esvazia o balde para que nada saia pelos próximos seconds (usado após um 429)."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+class AdaptiveLimiter:
+    """
+    Limite de concorrência que se ajusta à resposta da API (AIMD): cai pela metade a cada
+    limitação (429) e cresce uma unidade após limit sucessos seguidos, até max_limit.
+    """
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.active = 0
+        self.successes = 0
+        self._condition = _PerLoop(asyncio.Condition)
+
+    @property
+    def condition(self):
+        return self._condition.get()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    async def record_success(self):
+        async with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    async def record_throttle(self):
+        async with self.condition:
+            new_limit = max(self.min_limit, self.limit // 2)
+            if new_limit < self.limit:
+                logging.warning(f"Throttled; reducing concurrency from {self.limit} to {new_limit}")
+            self.limit = new_limit
+            self.successes = 0
+
+class _WaitRetryAfter:
+    """
+    Espera de retentativa: o Retry-After do servidor quando informado, limitado a max_backoff
+    (um valor absurdo não prende o worker), senão backoff exponencial com jitter.
+    """
+
+    def __init__(self, fallback, max_backoff):
+        self.fallback = fallback
+        self.max_backoff = max_backoff
+
+    def __call__(self, retry_state):
+        exc = retry_state.outcome.exception()
+        retry_after = retry_after_of(exc) if exc is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return self.fallback(retry_state)
+
+class RateLimitedScheduler:
+    """
+    Agenda chamadas a uma API externa respeitando orçamentos de requisições por minuto
+    (rpm) e tokens por minuto (tpm), com retentativas com backoff exponencial e jitter
+    (tenacity), respeito ao Retry-After e concorrência que encolhe quando a API limita.
+    Uma instância deve ser compartilhada por todas as chamadas à mesma API.
+
+    :param name: Nome usado nos logs e no relatório.
+    :param rpm: Requisições por minuto (None desativa).
+    :param tpm: Tokens por minuto (None desativa).
+    :param max_concurrency: Concorrência máxima; reduzida automaticamente em 429.
+    :param max_attempts: Tentativas por chamada, incluindo a primeira.
+    :param max_backoff: Espera máxima entre tentativas, em segundos.
+    :param output_tokens: Tokens de resposta reservados no orçamento tpm a cada chamada.
+    """
+
+    def __init__(self, name, rpm=None, tpm=None, max_concurrency=8, max_attempts=6, max_backoff=60,
+                 output_tokens=0):
+        self.name = name
+        self.output_tokens = output_tokens
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def _before_sleep(self, retry_state):
+        self.retries += 1
+        annotate(retries=1)
+        exc = retry_state.outcome.exception()
+        logging.warning(
+            f"{self.name}: attempt {retry_state.attempt_number} failed ({exc}); "
+            f"retrying in {retry_state.next_action.sleep:.1f}s"
+        )
+
+    async def run(self, call, tokens=0):
+        """
+        Executa call() (uma função que retorna uma corrotina) sob os orçamentos e a
+        política de retentativa.
+
+        :param call: Função sem argumentos que cria a corrotina a cada tentativa.
+        :param tokens: Tokens estimados da chamada (prompt + resposta esperada).
+        """
+        self.calls += 1
+        retrying = AsyncRetrying(
+            retry=retry_if_exception(is_retryable),
+            wait=_WaitRetryAfter(wait_random_exponential(multiplier=1, max=self.max_backoff), self.max_backoff),
+            stop=stop_after_attempt(self.max_attempts),
+            before_sleep=self._before_sleep,
+            reraise=True
+        )
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    result = await self._attempt(call, tokens)
+        except Exception:
+            self.failures += 1
+            raise
+        return result
+
+    async def _attempt(self, call, tokens):
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None and tokens:
+            await self.tokens.acquire(tokens)
+        async with self.limiter:
+            try:
+                result = await call()
+            except Exception as e:
+                if is_throttle(e):
+                    self.throttled += 1
+                    await self.limiter.record_throttle()
+                    pause = retry_after_of(e)
+                    if pause and self.requests is not None:
+                        self.requests.pause(min(pause, self.max_backoff))
+                raise
+        await self.limiter.record_success()
+        return result
+
+    def report(self):
+        if self.calls:
+            logging.info(
+                f"{self.name} scheduler: {self.calls} calls, {self.retries} retries, "
+                f"{self.throttled} throttled, {self.failures} failed; final concurrency {self.limiter.limit}"
+            )
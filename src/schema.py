@@ -0,0 +1,33 @@
+import typing
+from pydantic import BaseModel
+from models import FormDoc
+
+def base_type(annotation):
+    """Remove o Optional[...] de uma anotação, retornando o tipo concreto."""
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+def is_optional(annotation):
+    return typing.get_origin(annotation) is typing.Union and type(None) in typing.get_args(annotation)
+
+def is_model(annotation):
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+def form_columns(model=FormDoc, prefix=""):
+    """
+    Layout fixo de colunas achatadas do modelo, na ordem de declaração dos campos.
+    Os nomes seguem a convenção do pd.json_normalize ("identificacao.nome").
+
+    :return: Lista de tuplas (nome_da_coluna, tipo_python).
+    """
+    columns = []
+    for name, field in model.model_fields.items():
+        kind = base_type(field.annotation)
+        if is_model(kind):
+            columns.extend(form_columns(kind, f"{prefix}{name}."))
+        else:
+            columns.append((f"{prefix}{name}", kind))
+    return columns
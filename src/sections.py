@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import time
+import orjson
+from dataclasses import dataclass
+from langchain.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate, ChatPromptTemplate
+from langchain.output_parsers import PydanticOutputParser
+from pydantic import ValidationError, create_model
+from models import FormDoc
+from metrics import span
+from schema import is_model
+from process import (MedicalExtractor, clean_and_parse_response, strip_fences,
+                     MODEL_NAME, PREAMBLE, POSTAMBLE, SYSTEM_TEMPLATE, HUMAN_TEMPLATE)
+
+# Campos escalares do FormDoc (fora de qualquer seção) são extraídos juntos nesta seção
+EXTRA_SECTION = "outros_campos"
+
+@dataclass
+class Section:
+    name: str
+    model: type
+    description: str
+    flatten: bool = False
+
+@dataclass
+class SectionReport:
+    name: str
+    attempts: int = 0
+    latency: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    ok: bool = False
+
+@dataclass
+class ParseStats:
+    responses: int = 0
+    valid: int = 0
+    repaired: int = 0
+    unrepaired: int = 0
+    section_calls: int = 0
+    parse_seconds: float = 0.0
+
+    def report(self):
+        if not self.responses:
+            return
+        logging.info(
+            f"Parsing: {self.responses} response(s), {self.valid} valid on first pass "
+            f"({self.valid / self.responses:.0%}), {self.repaired} repaired with {self.section_calls} "
+            f"section call(s), {self.unrepaired} unrepaired; parse+validate "
+            f"{self.parse_seconds / self.responses * 1000:.2f} ms/response"
+        )
+
+def blocking_errors(error):
+    """
+    Erros de validação que tornam a resposta inutilizável. null em um campo obrigatório é
+    tolerado: é o que o prompt pede para dados ausentes no formulário.
+    """
+    return [e for e in error.errors() if not e["loc"] or e["input"] is not None]
+
+def section_format_instructions(section):
+    """Instruções de formato do prompt de uma seção: o título dela e o schema do seu modelo."""
+    parser = PydanticOutputParser(pydantic_object=section.model)
+    return f"Section: {section.description}\n\n{parser.get_format_instructions()}"
+
+def form_sections():
+    """Divide o FormDoc em seções de primeiro nível, cada uma com seu próprio modelo Pydantic."""
+    sections = []
+    extras = {}
+    for name, field in FormDoc.model_fields.items():
+        if is_model(field.annotation):
+            sections.append(Section(name, field.annotation, field.description or name))
+        else:
+            extras[name] = (field.annotation, field)
+    if extras:
+        model = create_model("OutrosCampos", **extras)
+        sections.append(Section(EXTRA_SECTION, model, "OUTROS CAMPOS", flatten=True))
+    return sections
+
+class SectionedExtractor(MedicalExtractor):
+    """
+    Extrai o FormDoc seção por seção: cada seção de primeiro nível vai em uma requisição
+    própria, com apenas as suas instruções de formato, e as requisições rodam em paralelo.
+    Uma seção inválida é repetida sozinha; ao final as seções são reunidas e validadas
+    como um FormDoc completo.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, temperature=0.0, chat=None, max_retries=2, max_concurrency=None,
+                 scheduler=None, compact=False):
+        super().__init__(model_name=model_name, temperature=temperature, chat=chat, scheduler=scheduler,
+                         compact=compact)
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.sections = form_sections()
+        self.section_prompts = {}
+        for section in self.sections:
+            self.section_prompts[section.name] = ChatPromptTemplate.from_messages([
+                SystemMessagePromptTemplate.from_template(SYSTEM_TEMPLATE),
+                HumanMessagePromptTemplate.from_template(HUMAN_TEMPLATE)
+            ]).partial(
+                preamble=PREAMBLE,
+                format_instructions=section_format_instructions(section),
+                postamble=POSTAMBLE
+            )
+
+    def build_section_request(self, section, extracted_text):
+        return self.section_prompts[section.name].format_messages(extracted_text=extracted_text)
+
+    async def _extract_section(self, section, extracted_text, semaphore):
+        report = SectionReport(section.name)
+        request = self.build_section_request(section, extracted_text)
+        last_error = None
+        while report.attempts <= self.max_retries:
+            report.attempts += 1
+            start = time.perf_counter()
+            try:
+                async with semaphore:
+                    response = await self.ainvoke(request)
+            except Exception as e:
+                last_error = e
+                logging.warning(f"Section {section.name} attempt {report.attempts} failed: {e}")
+                continue
+            finally:
+                report.latency += time.perf_counter() - start
+            usage = getattr(response, "usage_metadata", None) or {}
+            report.input_tokens += usage.get("input_tokens", 0)
+            report.output_tokens += usage.get("output_tokens", 0)
+
+            data = clean_and_parse_response(response.content)
+            try:
+                section.model.model_validate(data)
+            except ValidationError as e:
+                errors = blocking_errors(e)
+                if errors:
+                    last_error = e
+                    logging.warning(
+                        f"Section {section.name} attempt {report.attempts} returned invalid data "
+                        f"({len(errors)} validation errors)"
+                    )
+                    continue
+            report.ok = True
+            return data, report
+        logging.error(f"Section {section.name} failed after {report.attempts} attempts: {last_error}")
+        return None, report
+
+    async def aextract(self, extracted_text):
+        semaphore = asyncio.Semaphore(self.max_concurrency or len(self.sections))
+        results = await asyncio.gather(
+            *(self._extract_section(section, extracted_text, semaphore) for section in self.sections)
+        )
+
+        merged = {}
+        reports = []
+        for section, (data, report) in zip(self.sections, results):
+            reports.append(report)
+            if not report.ok:
+                continue
+            if section.flatten:
+                merged.update(data)
+            else:
+                merged[section.name] = data
+        log_section_reports(reports)
+
+        failed = [report.name for report in reports if not report.ok]
+        if failed:
+            raise RuntimeError(f"Error processing medical information: sections {', '.join(failed)} failed.")
+        try:
+            FormDoc.model_validate(merged)
+        except ValidationError as e:
+            if blocking_errors(e):
+                raise
+        return merged
+
+    def extract(self, extracted_text):
+        return asyncio.run(self.aextract(extracted_text))
+
+    def extract_many(self, texts, max_concurrency=4):
+        async def run_all():
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def run_one(text):
+                async with semaphore:
+                    try:
+                        return await self.aextract(text)
+                    except Exception as e:
+                        logging.error(f"Error processing medical information: {e}")
+                        return None
+
+            return await asyncio.gather(*(run_one(text) for text in texts))
+
+        return asyncio.run(run_all())
+
+class RepairingExtractor(SectionedExtractor):
+    """
+    Extrai o FormDoc em uma única chamada e valida a resposta com FormDoc.model_validate_json.
+    Quando a validação falha, só as seções com erros são pedidas de novo (com os prompts
+    por seção do SectionedExtractor); uma resposta que nem é JSON válido é refeita seção
+    por seção. Os tempos de parse/validação e as taxas de reparo ficam em parse_stats.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parse_stats = ParseStats()
+        self.section_of = {section.name: section for section in self.sections}
+        for section in self.sections:
+            if section.flatten:
+                self.section_of.update({name: section for name in section.model.model_fields})
+
+    def invalid_sections(self, response_text):
+        """
+        Valida a resposta contra o FormDoc. Retorna (dados, seções inválidas); dados é
+        None quando a resposta não é um objeto JSON, e então todas as seções são inválidas.
+        """
+        start = time.perf_counter()
+        with span("parse", bytes_in=len(response_text)) as parse_span:
+            cleaned_text = strip_fences(response_text)
+            try:
+                FormDoc.model_validate_json(cleaned_text)
+                errors = []
+            except ValidationError as e:
+                errors = blocking_errors(e)
+            data = None
+            if not any(error["type"] == "json_invalid" for error in errors):
+                data = orjson.loads(cleaned_text)
+            parse_span.set(validation_errors=len(errors))
+        self.parse_stats.parse_seconds += time.perf_counter() - start
+
+        if not isinstance(data, dict):
+            return None, list(self.sections)
+        invalid = []
+        for error in errors:
+            section = self.section_of.get(error["loc"][0]) if error["loc"] else None
+            if section is None:
+                return None, list(self.sections)
+            if section not in invalid:
+                invalid.append(section)
+        return data, invalid
+
+    async def aextract(self, extracted_text):
+        try:
+            response = await self.ainvoke(self.build_request(extracted_text))
+        except Exception as e:
+            logging.exception(f"Error processing medical information: {e}")
+            raise RuntimeError("Error processing medical information.")
+
+        self.parse_stats.responses += 1
+        data, invalid = self.invalid_sections(response.content)
+        if not invalid:
+            self.parse_stats.valid += 1
+            return data
+
+        logging.warning(f"Response failed validation; re-requesting {', '.join(s.name for s in invalid)}")
+        self.parse_stats.section_calls += len(invalid)
+        semaphore = asyncio.Semaphore(self.max_concurrency or len(invalid))
+        results = await asyncio.gather(
+            *(self._extract_section(section, extracted_text, semaphore) for section in invalid)
+        )
+        reports = [report for _, report in results]
+        log_section_reports(reports)
+        failed = [report.name for report in reports if not report.ok]
+        if failed:
+            self.parse_stats.unrepaired += 1
+            raise RuntimeError(f"Error processing medical information: sections {', '.join(failed)} failed.")
+
+        merged = dict(data or {})
+        for section, (section_data, _) in zip(invalid, results):
+            if section.flatten:
+                merged.update(section_data)
+            else:
+                merged[section.name] = section_data
+        # Cada seção passou na validação sozinha; o documento reunido ainda precisa passar
+        try:
+            FormDoc.model_validate(merged)
+        except ValidationError as e:
+            errors = blocking_errors(e)
+            if errors:
+                self.parse_stats.unrepaired += 1
+                raise RuntimeError(
+                    f"Error processing medical information: repaired response still invalid "
+                    f"({len(errors)} validation errors)."
+                )
+        self.parse_stats.repaired += 1
+        return merged
+
+def log_section_reports(reports):
+    for report in reports:
+        status = "ok" if report.ok else "FAILED"
+        logging.info(
+            f"Section {report.name}: {status}, {report.attempts} attempt(s), "
+            f"{report.latency:.2f}s, {report.input_tokens} prompt / {report.output_tokens} completion tokens"
+        )
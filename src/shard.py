@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import subprocess
+import sys
+from pathlib import Path
+from config import load_environment
+
+def shards_root():
+    return Path(os.getenv("SHARDS_DIR", "scans/shards"))
+
+def parse_shard(value):
+    """
+    Converte "i/N" em (i, N), com 0 <= i < N.
+
+    :raises ValueError: Se o formato ou os números forem inválidos.
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}; expected i/N, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}; i must be between 0 and N-1")
+    return index, count
+
+def shard_of(name, count):
+    """
+    Shard de um arquivo pelo hash estável do nome (o hash() do Python muda a cada
+    processo), de modo que processos e máquinas diferentes concordem sem coordenação.
+    """
+    digest = hashlib.sha1(name.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+def select_shard(pdf_files, index, count):
+    """Filtra os caminhos que pertencem ao shard index de count."""
+    return [pdf_file for pdf_file in pdf_files if shard_of(Path(pdf_file).name, count) == index]
+
+def shard_dir(index, count, root=None):
+    """Diretório de um shard, com seus próprios txt/, json/ e ledger.db (raiz: SHARDS_DIR ou scans/shards)."""
+    return Path(root or shards_root()) / f"{index}-of-{count}"
+
+def shard_json_dirs(root=None):
+    return sorted(p for p in Path(root or shards_root()).glob("*-of-*/json") if p.is_dir())
+
+def merge_shards(output_path, root=None, fmt="csv", incremental=False):
+    """
+    Combina os JSONs de todos os shards em root na tabela unificada. Um documento
+    presente em mais de um shard (execuções com N diferentes) entra com o JSON mais recente.
+
+    :return: Número de linhas escritas.
+    """
+    from export import StreamingExporter
+
+    root = root or shards_root()
+    json_dirs = shard_json_dirs(root)
+    if not json_dirs:
+        raise RuntimeError(f"No shard outputs found under {root}")
+    logging.info(f"Merging {len(json_dirs)} shard(s) from {root}")
+    return StreamingExporter().export(json_dirs, output_path, fmt=fmt, incremental=incremental)
+
+def shard_summary(root=None):
+    """Estágios do ledger de cada shard: {nome_do_shard: {estágio: quantidade}}."""
+    from ledger import JobLedger
+
+    summaries = {}
+    for ledger_path in sorted(Path(root or shards_root()).glob("*-of-*/ledger.db")):
+        summaries[ledger_path.parent.name] = JobLedger(ledger_path).summary()
+    return summaries
+
+def run_local(count, main_args=(), cpu_workers=None, root=None):
+    """
+    Roda os count shards nesta máquina, um processo `main.py --shard i/count` por shard,
+    e espera todos terminarem. Os processos de rasterização são divididos entre os shards.
+
+    :return: Lista com o código de saída de cada shard.
+    """
+    cpu_workers = cpu_workers or max(1, (os.cpu_count() or 1) // count)
+    main_path = Path(__file__).resolve().parent / "main.py"
+    env = dict(os.environ, SHARDS_DIR=str(root or shards_root()), CPU_WORKERS=str(cpu_workers))
+    processes = []
+    for index in range(count):
+        command = [sys.executable, str(main_path), *main_args, "--shard", f"{index}/{count}"]
+        processes.append(subprocess.Popen(command, env=env))
+    logging.info(f"Started {count} shard process(es) with {cpu_workers} CPU worker(s) each")
+    codes = [process.wait() for process in processes]
+    for index, code in enumerate(codes):
+        if code != 0:
+            logging.error(f"Shard {index}/{count} exited with code {code}")
+    return codes
+
+def main(argv=None):
+    import argparse
+
+    load_environment()
+    parser = argparse.ArgumentParser(
+        description="Execução em shards: roda main.py em N processos e combina os resultados.",
+        epilog="Argumentos desconhecidos em run são repassados a main.py (ex.: extract --text-backend native)."
+    )
+    parser.add_argument("command", choices=["run", "merge", "status"],
+                        help="run: roda os N shards nesta máquina e combina; merge: só combina; "
+                             "status: estágios do ledger de cada shard")
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1, help="Número de shards (padrão: CPUs)")
+    parser.add_argument("--cpu-workers", type=int, help="Processos de rasterização por shard (padrão: CPUs / N)")
+    parser.add_argument("--shards-dir", default=str(shards_root()), help="Padrão: SHARDS_DIR ou scans/shards")
+    parser.add_argument("--output", help="Padrão: scans/csv/unified.csv ou scans/parquet/unified")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args, main_args = parser.parse_known_args(argv)
+    if main_args and args.command != "run":
+        parser.error(f"unrecognized arguments: {' '.join(main_args)}")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "status":
+        for name, summary in shard_summary(args.shards_dir).items():
+            print(f"{name}: " + ", ".join(f"{stage}={count}" for stage, count in sorted(summary.items())))
+        return 0
+
+    if args.command == "run":
+        codes = run_local(args.shards, main_args, args.cpu_workers, args.shards_dir)
+        if any(codes):
+            return 1
+    output = args.output or ("scans/csv/unified.csv" if args.format == "csv" else "scans/parquet/unified")
+    merge_shards(output, args.shards_dir, fmt=args.format)
+    from store import RecordStore
+    # Sem prune: a tabela principal também guarda os documentos processados sem shards
+    RecordStore().sync(shard_json_dirs(args.shards_dir), prune=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
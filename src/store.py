@@ -0,0 +1,282 @@
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+import orjson
+from sqlalchemy import (Boolean, Column, DateTime, Float, Index, Integer, MetaData, String, Table, Text,
+                        create_engine, delete, func, inspect, select)
+from sqlalchemy.dialects.sqlite import insert
+from export import SOURCE_COLUMN, _lookup, coerce
+from schema import form_columns
+
+MTIME_COLUMN = "json_mtime_ns"
+UPDATED_COLUMN = "updated_at"
+
+# Campos pelos quais as coortes costumam ser filtradas; os desfechos entram todos
+INDEXED_COLUMNS = ["identificacao.registro", "identificacao.local", "identificacao.data_admissao"]
+INDEXED_SECTIONS = ["desfechos"]
+
+_SQL_TYPES = {bool: Boolean, int: Integer, float: Float, datetime: DateTime}
+
+_CONDITION = re.compile(r"^\s*(.+?)\s*(<=|>=|!=|=|<|>| is not null$| is null$| like )\s*(.*?)\s*$", re.IGNORECASE)
+_OPERATORS = {
+    "=": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "like": lambda column, value: column.like(value),
+    "is null": lambda column, value: column.is_(None),
+    "is not null": lambda column, value: column.is_not(None),
+}
+
+def store_path():
+    return Path(os.getenv("STORE_PATH", "scans/records.db"))
+
+def parse_condition(text):
+    """
+    Converte uma condição textual ("lactato_sepse > 4", "choque_septico = true",
+    "local like HC%", "registro is null") em (coluna, operador, valor).
+
+    :raises ValueError: Se a condição não tiver um operador conhecido.
+    """
+    match = _CONDITION.match(text)
+    if match is None:
+        raise ValueError(f"Invalid condition {text!r}; expected e.g. 'lactato_sepse > 4' or 'registro is null'")
+    column, operator, value = match.groups()
+    return column, operator.strip().lower(), value
+
+class RecordStore:
+    """
+    Tabela SQLite com um registro por documento estruturado, nas mesmas colunas achatadas e
+    tipadas da exportação (geradas do FormDoc), com índices nos campos de coorte. É atualizada
+    por upsert à medida que cada JSON é salvo, de modo que consultas de coorte não precisam
+    reler scans/json. Se o FormDoc mudar, a tabela é recriada e sync a repopula.
+
+    :param db_path: Arquivo SQLite (padrão: STORE_PATH ou scans/records.db).
+    """
+
+    def __init__(self, db_path=None):
+        db_path = Path(db_path or store_path())
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.engine = create_engine(f"sqlite:///{db_path}")
+        self.columns = form_columns()
+        self.paths = [tuple(name.split(".")) for name, _ in self.columns]
+
+        metadata = MetaData()
+        self.table = Table(
+            "records", metadata,
+            Column(SOURCE_COLUMN, String, primary_key=True),
+            Column(MTIME_COLUMN, Integer),
+            Column(UPDATED_COLUMN, DateTime),
+            *(Column(name, _SQL_TYPES.get(kind, Text)) for name, kind in self.columns)
+        )
+        indexed = INDEXED_COLUMNS + [name for name, _ in self.columns if name.split(".")[0] in INDEXED_SECTIONS]
+        self.indexes = [Index(f"ix_records_{name.replace('.', '_')}", self.table.c[name]) for name in indexed]
+
+        existing = inspect(self.engine)
+        if existing.has_table("records"):
+            current = {column["name"] for column in existing.get_columns("records")}
+            if current != set(self.table.c.keys()):
+                logging.warning(f"FormDoc columns changed; rebuilding {db_path} (run a sync to repopulate it)")
+                self.table.drop(self.engine)
+        metadata.create_all(self.engine)
+        for index in self.indexes:
+            index.create(self.engine, checkfirst=True)
+
+    def row(self, source_name, record, mtime_ns=None):
+        values = {SOURCE_COLUMN: source_name, MTIME_COLUMN: mtime_ns, UPDATED_COLUMN: datetime.now()}
+        for path, (name, kind) in zip(self.paths, self.columns):
+            values[name] = coerce(_lookup(record, path), kind)
+        return values
+
+    def upsert_many(self, items):
+        """
+        Insere ou substitui documentos.
+
+        :param items: Iterável de (nome_do_json, registro) ou (nome_do_json, registro, mtime_ns).
+        :return: Número de documentos gravados.
+        """
+        rows = [self.row(*item) for item in items]
+        if not rows:
+            return 0
+        statement = insert(self.table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[SOURCE_COLUMN],
+            set_={name: statement.excluded[name] for name in self.table.c.keys() if name != SOURCE_COLUMN}
+        )
+        with self.engine.begin() as connection:
+            connection.execute(statement, rows)
+        return len(rows)
+
+    def upsert(self, source_name, record, mtime_ns=None):
+        self.upsert_many([(source_name, record, mtime_ns)])
+
+    def upsert_file(self, json_path):
+        """Grava o documento a partir do JSON salvo (o nome e o mtime do arquivo vão junto)."""
+        json_path = Path(json_path)
+        record = orjson.loads(json_path.read_bytes())
+        self.upsert(json_path.name, record if isinstance(record, dict) else {}, json_path.stat().st_mtime_ns)
+
+    def delete(self, source_names):
+        with self.engine.begin() as connection:
+            connection.execute(delete(self.table).where(self.table.c[SOURCE_COLUMN].in_(list(source_names))))
+
+    def sync(self, json_dir, prune=True, chunk_size=500):
+        """
+        Alinha a tabela com os JSONs em disco: grava os novos ou alterados (pelo mtime) e,
+        com prune, remove os que sumiram. Serve para popular a tabela a partir de um
+        scans/json existente ou de JSONs gravados fora do pipeline (ex.: batch.py).
+
+        :param json_dir: Diretório com os arquivos JSON, ou uma lista de diretórios (ex.: um por shard).
+        :return: (gravados, removidos)
+        """
+        json_dirs = [json_dir] if isinstance(json_dir, (str, Path)) else list(json_dir)
+        current = {}
+        for directory in json_dirs:
+            for json_file in Path(directory).glob("*.json"):
+                mtime_ns = json_file.stat().st_mtime_ns
+                # O mesmo documento em vários diretórios: vale o mais recente, como em export
+                if json_file.name not in current or current[json_file.name][0] < mtime_ns:
+                    current[json_file.name] = (mtime_ns, json_file)
+        with self.engine.connect() as connection:
+            stored = dict(connection.execute(select(self.table.c[SOURCE_COLUMN], self.table.c[MTIME_COLUMN])).all())
+
+        changed = [(name, json_file, mtime_ns) for name, (mtime_ns, json_file) in sorted(current.items())
+                   if stored.get(name) != mtime_ns]
+        written = 0
+        for start in range(0, len(changed), chunk_size):
+            items = []
+            for name, json_file, mtime_ns in changed[start:start + chunk_size]:
+                try:
+                    record = orjson.loads(json_file.read_bytes())
+                except (OSError, orjson.JSONDecodeError) as e:
+                    logging.warning(f"Skipping {json_file}: {e}")
+                    continue
+                items.append((name, record if isinstance(record, dict) else {}, mtime_ns))
+            written += self.upsert_many(items)
+
+        removed = [name for name in stored if name not in current] if prune else []
+        if removed:
+            self.delete(removed)
+        logging.info(f"Record store: {written} document(s) written, {len(removed)} removed, {len(current)} on disk")
+        return written, len(removed)
+
+    def column(self, name):
+        """
+        Coluna pelo nome completo ("parametros_clinicos.lactato_sepse") ou pelo nome do campo,
+        quando ele existe em uma única seção ("lactato_sepse").
+
+        :raises ValueError: Se o nome não existir ou for ambíguo.
+        """
+        if name in self.table.c:
+            return self.table.c[name]
+        matches = [key for key in self.table.c.keys() if key.rsplit(".", 1)[-1] == name]
+        if len(matches) == 1:
+            return self.table.c[matches[0]]
+        if matches:
+            raise ValueError(f"Ambiguous column {name!r}: {', '.join(matches)}")
+        raise ValueError(f"Unknown column {name!r}")
+
+    def _where(self, conditions):
+        clauses = []
+        kinds = dict(self.columns)
+        for condition in conditions:
+            name, operator, value = parse_condition(condition) if isinstance(condition, str) else condition
+            column = self.column(name)
+            if operator not in _OPERATORS:
+                raise ValueError(f"Unknown operator {operator!r}")
+            if isinstance(value, str) and operator != "like":
+                kind = kinds.get(column.key, str)
+                converted = coerce(value, kind)
+                if converted is None and value.strip().lower() not in ("", "null"):
+                    raise ValueError(f"Invalid {kind.__name__} value for {column.key}: {value!r}")
+                value = converted
+            clauses.append(_OPERATORS[operator](column, value))
+        return clauses
+
+    def query(self, *conditions, columns=None, order_by=None, limit=None):
+        """
+        Documentos que satisfazem todas as condições.
+
+            store.query("choque_septico = true", ("lactato_sepse", ">", 4), columns=["registro", "local"])
+
+        :param conditions: Textos ("lactato_sepse > 4") ou tuplas (coluna, operador, valor); os
+            operadores são =, !=, <, <=, >, >=, like, "is null" e "is not null".
+        :param columns: Colunas a retornar (padrão: todas); source_file vem sempre primeiro.
+        :param order_by: Coluna de ordenação; com "-" na frente, decrescente.
+        :param limit: Número máximo de documentos.
+        :return: Lista de dicts {coluna: valor} com os valores já tipados.
+        """
+        selected = [self.table.c[SOURCE_COLUMN]]
+        if columns:
+            selected += [self.column(name) for name in columns if name != SOURCE_COLUMN]
+        else:
+            selected += [self.table.c[name] for name, _ in self.columns]
+        statement = select(*selected).where(*self._where(conditions))
+        if order_by:
+            column = self.column(order_by.lstrip("-"))
+            statement = statement.order_by(column.desc() if order_by.startswith("-") else column)
+        if limit:
+            statement = statement.limit(limit)
+        with self.engine.connect() as connection:
+            return [dict(row._mapping) for row in connection.execute(statement)]
+
+    def count(self, *conditions):
+        statement = select(func.count()).select_from(self.table).where(*self._where(conditions))
+        with self.engine.connect() as connection:
+            return connection.execute(statement).scalar_one()
+
+def main(argv=None):
+    import argparse
+    import csv
+    import json
+    from config import load_environment
+
+    load_environment()
+    parser = argparse.ArgumentParser(description="Consulta a tabela de registros estruturados (SQLite).")
+    parser.add_argument("command", choices=["sync", "query"],
+                        help="sync: alinha a tabela com os JSONs em disco; query: filtra os registros")
+    parser.add_argument("conditions", nargs="*", metavar="CONDITION",
+                        help="Condições de query, ex.: 'choque_septico = true' 'lactato_sepse > 4'")
+    parser.add_argument("--store", default=str(store_path()), help="Padrão: STORE_PATH ou scans/records.db")
+    parser.add_argument("--json-dir", action="append", help="Diretório de JSONs para sync (padrão: scans/json)")
+    parser.add_argument("--columns", help="Colunas separadas por vírgula (padrão: todas)")
+    parser.add_argument("--order-by", help="Coluna de ordenação; -coluna para decrescente")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--count", action="store_true", help="Imprime só a quantidade de registros")
+    parser.add_argument("--json", action="store_true", help="Uma linha JSON por registro em vez de CSV")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    store = RecordStore(args.store)
+    if args.command == "sync":
+        store.sync(args.json_dir or ["scans/json"])
+        return 0
+
+    start = time.perf_counter()
+    try:
+        if args.count:
+            print(store.count(*args.conditions))
+            return 0
+        columns = args.columns.split(",") if args.columns else None
+        rows = store.query(*args.conditions, columns=columns, order_by=args.order_by, limit=args.limit)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.json:
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False, default=str))
+    elif rows:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    logging.info(f"{len(rows)} record(s) in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
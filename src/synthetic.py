@@ -0,0 +1,175 @@
+import functools
+import random
+import re
+from datetime import datetime, timedelta
+from export import _lookup, coerce
+from models import FormDoc
+from schema import base_type, form_columns, is_model
+
+_STRINGS = ["IMIP", "ISEA", "MDER", "sim", "não", "outros"]
+
+@functools.lru_cache(maxsize=None)
+def _model_schema(model):
+    return model.model_json_schema()
+
+def synthetic_from_schema(schema, rng, null_rate=0.1, defs=None):
+    """
+    Gera um valor aleatório que valida contra um JSON schema no formato produzido pelo
+    Pydantic (com $defs/$ref, allOf de um elemento e anyOf com null para Optional).
+
+    :param schema: JSON schema (dict).
+    :param rng: random.Random usado na geração.
+    :param null_rate: Probabilidade de um campo anulável vir como null.
+    """
+    defs = schema.get("$defs", {}) if defs is None else defs
+    if "$ref" in schema:
+        return synthetic_from_schema(defs[schema["$ref"].split("/")[-1]], rng, null_rate, defs)
+    if len(schema.get("allOf", [])) == 1:
+        return synthetic_from_schema(schema["allOf"][0], rng, null_rate, defs)
+    if "anyOf" in schema:
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        if len(options) < len(schema["anyOf"]) and rng.random() < null_rate:
+            return None
+        return synthetic_from_schema(options[0], rng, null_rate, defs)
+
+    kind = schema.get("type")
+    if "properties" in schema or kind == "object":
+        return {
+            name: synthetic_from_schema(prop, rng, null_rate, defs)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "boolean":
+        return rng.random() < 0.3
+    if kind == "integer":
+        return rng.randint(0, 200)
+    if kind == "number":
+        return round(rng.uniform(0, 200), 2)
+    if kind == "string" and schema.get("format") in ("date-time", "date"):
+        return (datetime(1970, 1, 1) + timedelta(days=rng.randint(0, 20000))).strftime("%Y-%m-%d")
+    if kind == "null":
+        return None
+    return rng.choice(_STRINGS) + f" {rng.randint(1, 9999)}"
+
+def synthetic_record(model=FormDoc, rng=None, null_rate=0.1):
+    """
+    Gera um dicionário com valores aleatórios que valida contra o modelo (por padrão o FormDoc).
+
+    :param model: Modelo Pydantic a preencher.
+    :param rng: random.Random usado na geração; permite gerar registros reprodutíveis.
+    :param null_rate: Probabilidade de um campo Optional vir como null.
+    """
+    return synthetic_from_schema(_model_schema(model), rng or random.Random(), null_rate)
+
+def render_form_text(record, prefix=""):
+    """Texto no estilo "campo: valor" de um registro, como o OCR de um formulário preenchido."""
+    lines = []
+    for key, value in record.items():
+        if isinstance(value, dict):
+            lines.append(f"\n{key.upper().replace('_', ' ')}")
+            lines.extend(render_form_text(value, f"{prefix}{key}."))
+        elif isinstance(value, bool):
+            lines.append(f"{key.replace('_', ' ')}: {'SIM' if value else 'NÃO'}")
+        else:
+            lines.append(f"{key.replace('_', ' ')}: {'' if value is None else value}")
+    return lines if prefix else "\n".join(lines)
+
+def parse_form_text(text, model=FormDoc):
+    """
+    Inverso de render_form_text: reconstrói o registro (valores como texto, SIM/NÃO como
+    bool, vazio como None) a partir das linhas "campo: valor" e dos títulos de seção.
+    Linhas de campos que não existem no modelo são ignoradas.
+    """
+    sections = {}
+    top_level = {}
+    for name, field in model.model_fields.items():
+        kind = base_type(field.annotation)
+        if is_model(kind):
+            sections[name.upper().replace('_', ' ')] = (name, {f.replace('_', ' '): f for f in kind.model_fields})
+        else:
+            top_level[name.replace('_', ' ')] = name
+
+    record = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line in sections:
+            name, fields = sections[line]
+            current = (record.setdefault(name, {}), fields)
+            continue
+        label, separator, value = line.partition(":")
+        if not separator:
+            continue
+        value = value.strip()
+        value = {"": None, "SIM": True, "NÃO": False}.get(value, value)
+        if current is not None and label in current[1]:
+            current[0][current[1][label]] = value
+        elif label in top_level:
+            record[top_level[label]] = value
+    return record
+
+def field_accuracy(predicted, truth):
+    """Fração das colunas do FormDoc em que predicted e truth coincidem depois da conversão de tipos."""
+    columns = form_columns()
+    hits = 0
+    for column, kind in columns:
+        path = column.split(".")
+        if coerce(_lookup(predicted, path), kind) == coerce(_lookup(truth, path), kind):
+            hits += 1
+    return hits / len(columns)
+
+def _pdf_string(line):
+    escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return escaped.encode('latin-1', errors='replace')
+
+def write_text_pdf(path, text, lines_per_page=60):
+    """
+    Grava um PDF mínimo (Helvetica, sem compressão) com uma linha de texto por linha de
+    text, quebrando as páginas a cada lines_per_page linhas. O PDF tem camada de texto
+    (lido pelo pdftotext) e pode ser lido de volta por read_text_pdf.
+
+    :return: Número de páginas.
+    """
+    lines = text.split("\n")
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for page_lines in pages:
+        content = b"BT /F1 9 Tf 40 800 Td 12 TL\n" + b"".join(
+            b"(" + _pdf_string(line) + b") Tj T*\n" for line in page_lines
+        ) + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(pages)
+
+_PDF_LINE = re.compile(rb"\(((?:\\.|[^\\)])*)\) Tj")
+_PDF_ESCAPE = re.compile(rb"\\(.)")
+
+def read_text_pdf(path):
+    """Páginas de texto de um PDF gravado por write_text_pdf (não serve para PDFs em geral)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    pages = []
+    for stream in re.findall(rb"stream\n(.*?)\nendstream", data, re.DOTALL):
+        lines = [_PDF_ESCAPE.sub(rb"\1", match).decode('latin-1') for match in _PDF_LINE.findall(stream)]
+        pages.append("\n".join(lines))
+    return pages
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from utils import extract_text_from_pdf_async, rasterizar_pdfs
+
+# Separador de páginas, o mesmo usado pelo LLMWhisperer
+PAGE_SEPARATOR = "\n<<<\n"
+
+class TextBackend:
+    """
+    Interface dos extratores de texto: cada backend transforma um PDF em texto de forma
+    assíncrona e acumula o número de documentos e o tempo gasto, para o relatório por backend.
+    """
+    name = "base"
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    @property
+    def cache_params(self):
+        """Parâmetros que diferenciam este backend na chave do cache de OCR."""
+        return {"mode": self.name}
+
+    async def _extract(self, pdf_path):
+        raise NotImplementedError
+
+    async def aextract(self, pdf_path):
+        start = time.perf_counter()
+        try:
+            return await self._extract(pdf_path)
+        finally:
+            self.calls += 1
+            self.seconds += time.perf_counter() - start
+
+    def backends(self):
+        return [self]
+
+    def close(self):
+        """Libera os recursos (ex.: pools de processos) dos backends internos."""
+        for backend in self.backends():
+            if backend is not self:
+                backend.close()
+
+    def report(self):
+        for backend in self.backends():
+            if backend.calls:
+                logging.info(
+                    f"Text backend {backend.name}: {backend.calls} document(s), "
+                    f"{backend.seconds:.1f}s total, {backend.seconds / backend.calls:.2f}s/doc"
+                )
+
+class WhispererBackend(TextBackend):
+    """
+    Extração remota pelo LLMWhisperer (modo form). Com um scheduler, as submissões
+    respeitam o limite de requisições por minuto e são repetidas em caso de limitação.
+    """
+    name = "llmwhisperer"
+
+    def __init__(self, scheduler=None):
+        super().__init__()
+        self.scheduler = scheduler
+
+    @property
+    def cache_params(self):
+        return {"mode": "form"}
+
+    async def _extract(self, pdf_path):
+        if self.scheduler is None:
+            return await extract_text_from_pdf_async(str(pdf_path))
+        return await self.scheduler.run(lambda: extract_text_from_pdf_async(str(pdf_path)))
+
+class NativeTextBackend(TextBackend):
+    """
+    Lê a camada de texto embutida no PDF com o pdftotext (poppler, o mesmo usado pelo
+    pdf2image). Não serve para digitalizações, que não têm camada de texto.
+    """
+    name = "native"
+
+    def __init__(self, min_chars_per_page=100):
+        super().__init__()
+        self.min_chars_per_page = min_chars_per_page
+
+    async def read_text_layer(self, pdf_path):
+        if shutil.which("pdftotext") is None:
+            raise RuntimeError("pdftotext executable not found (install poppler-utils)")
+        process = await asyncio.create_subprocess_exec(
+            "pdftotext", "-layout", "-enc", "UTF-8", str(pdf_path), "-",
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"pdftotext failed for {pdf_path}: {stderr.decode(errors='replace').strip()}")
+        pages = stdout.decode('utf-8', errors='replace').split("\f")
+        if pages and not pages[-1].strip():
+            pages = pages[:-1]
+        return pages
+
+    def has_text_layer(self, pages):
+        if not pages:
+            return False
+        chars = sum(len("".join(page.split())) for page in pages)
+        return chars / len(pages) >= self.min_chars_per_page
+
+    async def _extract(self, pdf_path):
+        pages = await self.read_text_layer(pdf_path)
+        if not self.has_text_layer(pages):
+            raise RuntimeError(f"{pdf_path} has no usable text layer")
+        return PAGE_SEPARATOR.join(pages)
+
+class TesseractBackend(TextBackend):
+    """
+    OCR local: rasteriza e pré-processa as páginas (rasterizar_pdfs) e roda o tesseract
+    em cada PNG. Requer o executável tesseract com o idioma configurado. As páginas de
+    todos os documentos em andamento dividem um único pool de max_workers processos,
+    criado no primeiro uso e encerrado por close().
+    """
+    name = "tesseract"
+
+    def __init__(self, lang="por", dpi=400, max_workers=None):
+        super().__init__()
+        self.lang = lang
+        self.dpi = dpi
+        self.max_workers = max_workers
+        self.executor = None
+
+    @property
+    def cache_params(self):
+        return {"mode": f"{self.name}:{self.lang}:{self.dpi}"}
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    async def _ocr_page(self, png_path):
+        process = await asyncio.create_subprocess_exec(
+            "tesseract", str(png_path), "stdout", "-l", self.lang,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"tesseract failed for {png_path}: {stderr.decode(errors='replace').strip()}")
+        return stdout.decode('utf-8', errors='replace')
+
+    async def _extract(self, pdf_path):
+        if shutil.which("tesseract") is None:
+            raise RuntimeError("tesseract executable not found")
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        with tempfile.TemporaryDirectory() as tmp:
+            pngs = await asyncio.to_thread(
+                rasterizar_pdfs, [(pdf_path, Path(tmp))], dpi=self.dpi, executor=self.executor
+            )
+            pages = pngs.get(pdf_path, [])
+            if not pages:
+                raise RuntimeError(f"No pages rendered for {pdf_path}")
+            texts = await asyncio.gather(*(self._ocr_page(png_path) for png_path in pages))
+        return PAGE_SEPARATOR.join(texts)
+
+class AutoBackend(TextBackend):
+    """
+    Seleção por documento: usa a camada de texto nativa quando o PDF tem uma (documentos
+    gerados digitalmente nunca saem da máquina) e recorre ao backend de OCR caso contrário.
+    """
+    name = "auto"
+
+    def __init__(self, fallback, native=None):
+        super().__init__()
+        self.native = native or NativeTextBackend()
+        self.fallback = fallback
+
+    @property
+    def cache_params(self):
+        return {"mode": f"auto:{self.fallback.cache_params['mode']}"}
+
+    async def _extract(self, pdf_path):
+        start = time.perf_counter()
+        try:
+            pages = await self.native.read_text_layer(pdf_path)
+        except Exception as e:
+            logging.warning(f"Could not read text layer of {pdf_path}: {e}")
+            pages = []
+        if self.native.has_text_layer(pages):
+            self.native.calls += 1
+            self.native.seconds += time.perf_counter() - start
+            logging.info(f"Using native text layer for {pdf_path}")
+            return PAGE_SEPARATOR.join(pages)
+        return await self.fallback.aextract(pdf_path)
+
+    def backends(self):
+        return [self, self.native, self.fallback]
+
+def make_text_backend(name="auto", fallback="llmwhisperer", tesseract_lang="por", scheduler=None, cpu_workers=None):
+    """
+    Cria o backend de extração de texto.
+
+    :param name: "auto", "llmwhisperer", "native" ou "tesseract".
+    :param fallback: Backend de OCR usado pelo "auto" quando o PDF não tem camada de texto.
+    :param tesseract_lang: Idioma(s) do tesseract.
+    :param scheduler: RateLimitedScheduler opcional para as chamadas ao LLMWhisperer.
+    :param cpu_workers: Processos do pool de rasterização do tesseract (padrão: número de CPUs).
+    """
+    def simple(backend_name):
+        if backend_name == "llmwhisperer":
+            return WhispererBackend(scheduler=scheduler)
+        if backend_name == "native":
+            return NativeTextBackend()
+        if backend_name == "tesseract":
+            return TesseractBackend(lang=tesseract_lang, max_workers=cpu_workers)
+        raise ValueError(f"Unknown text backend: {backend_name}")
+
+    if name == "auto":
+        return AutoBackend(simple(fallback))
+    return simple(name)
@@ -1,27 +1,52 @@
+import asyncio
+import contextlib
 import json
 import logging
-from pdf2image import convert_from_path
-from PIL import Image, ImageEnhance, ImageFilter
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-import pandas as pd
-from unstract.llmwhisperer.client_v2 import LLMWhispererClientException
-from unstract.llmwhisperer import LLMWhispererClientV2
+
+# pdf2image, PIL, pandas, o cliente do LLMWhisperer e o exportador são importados só pelas funções que
+# os usam: os comandos que não rasterizam nem chamam o OCR (ex.: export, status) iniciam
+# sem carregá-los.
+
+def write_atomic(file_path, text):
+    """
+    Grava o arquivo em um temporário no mesmo diretório e o renomeia por cima do destino,
+    para que quem lê o diretório nunca veja um arquivo pela metade.
+
+    :return: Número de bytes gravados.
+    """
+    file_path = Path(file_path)
+    tmp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.tmp")
+    data = text.encode('utf-8')
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return len(data)
 
 def save_extracted_text(text, file_path):
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(text)
+    size = write_atomic(file_path, text)
     logging.info(f"Saved extracted text to {file_path}")
+    return size
 
 def save_json(data, file_path):
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    size = write_atomic(file_path, json.dumps(data, ensure_ascii=False, indent=4))
     logging.info(f"Saved structured data to {file_path}")
+    return size
 
 def create_directories(paths):
     for path in paths:
         path.mkdir(parents=True, exist_ok=True)
 
 def extract_text_from_pdf(file_path, pages_list=None):
+    from unstract.llmwhisperer import LLMWhispererClientV2
+    from unstract.llmwhisperer.client_v2 import LLMWhispererClientException
+
     llmw = LLMWhispererClientV2()
     try:
         result = llmw.whisper(
@@ -40,42 +65,167 @@ def extract_text_from_pdf(file_path, pages_list=None):
         logging.exception(f"Unexpected error extracting text from PDF {file_path}: {e}")
         raise RuntimeError(f"Unexpected error extracting text from PDF {file_path}: {e}")
 
-def converter_pdf_para_png_com_preprocessamento(pdf_path, output_dir):
+# Estados do LLMWhisperer que encerram a consulta; os demais (processing, accepted, queued...) seguem em espera
+WHISPER_DONE = {"processed", "delivered"}
+WHISPER_FAILED = {"failed", "unknown"}
+
+async def extract_text_from_pdf_async(file_path, pages_list=None, wait_timeout=200, poll_interval=5):
+    """
+    Versão assíncrona de extract_text_from_pdf. Submete o documento ao LLMWhisperer sem
+    bloquear, consulta o status com asyncio.sleep e recupera o texto ao final, permitindo
+    que várias extrações fiquem em andamento ao mesmo tempo.
+
+    :param file_path: Caminho para o arquivo PDF.
+    :param pages_list: Páginas a extrair (ex.: "1-3"); None extrai todas.
+    :param wait_timeout: Tempo máximo de espera pelo processamento, em segundos.
+    :param poll_interval: Intervalo entre consultas de status, em segundos.
+    """
+    from unstract.llmwhisperer import LLMWhispererClientV2
+    from unstract.llmwhisperer.client_v2 import LLMWhispererClientException
+
+    llmw = LLMWhispererClientV2()
+    try:
+        submitted = await asyncio.to_thread(
+            llmw.whisper,
+            wait_for_completion=False,
+            wait_timeout=wait_timeout,
+            file_path=file_path,
+            pages_to_extract=pages_list
+        )
+        if submitted["status_code"] == 200:
+            extracted_text = submitted["extraction"]["result_text"]
+        else:
+            whisper_hash = submitted["whisper_hash"]
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + wait_timeout
+            while True:
+                status = await asyncio.to_thread(llmw.whisper_status, whisper_hash=whisper_hash)
+                state = status.get("status")
+                # Como no whisper() do cliente: só estados terminais encerram a espera
+                if state in WHISPER_DONE:
+                    break
+                if state in WHISPER_FAILED:
+                    raise LLMWhispererClientException(
+                        {"status_code": -1, "message": f"Whisper operation {state}"}
+                    )
+                if loop.time() >= deadline:
+                    raise LLMWhispererClientException(
+                        {"status_code": -1, "message": "Whisper client operation timed out"}
+                    )
+                await asyncio.sleep(poll_interval)
+            result = await asyncio.to_thread(llmw.whisper_retrieve, whisper_hash=whisper_hash)
+            extraction = {}
+            if result.get("status_code", 200) == 200:
+                extraction = result.get("extraction") or {}
+            if "result_text" not in extraction:
+                # "delivered": o resultado já foi entregue e não pode ser recuperado de novo
+                raise LLMWhispererClientException(
+                    {"status_code": -1, "message": f"Whisper operation {state} without a result"}
+                )
+            extracted_text = extraction["result_text"]
+        logging.info(f"Extracted text from PDF: {file_path}")
+        return extracted_text
+    except LLMWhispererClientException as e:
+        logging.error(f"Failed to extract text from PDF {file_path}: {e}")
+        raise RuntimeError(f"Error extracting text from PDF {file_path}: {e}")
+    except Exception as e:
+        logging.exception(f"Unexpected error extracting text from PDF {file_path}: {e}")
+        raise RuntimeError(f"Unexpected error extracting text from PDF {file_path}: {e}")
+
+# Tabela de binarização (limiar 128) aplicada pelo Image.point em C, sem lambda por chamada
+LIMIAR_BINARIZACAO = [0 if x < 128 else 255 for x in range(256)]
+
+def preprocessar_pagina(pagina, nitidez=1.0):
+    """
+    Aplica o pré-processamento para OCR a uma página: escala de cinza, nitidez,
+    filtro DETAIL e binarização.
+
+    :param pagina: Imagem PIL da página.
+    :param nitidez: Fator do ImageEnhance.Sharpness (1.0 mantém a imagem inalterada).
+    """
+    from PIL import ImageEnhance, ImageFilter
+
+    # Converte para escala de cinza
+    imagem = pagina.convert('L')
+
+    # Aumenta o contraste (fator 1.0 é a identidade e dispensa o processamento)
+    if nitidez != 1.0:
+        imagem = ImageEnhance.Sharpness(imagem).enhance(nitidez)
+
+    # Aplica filtro de nitidez
+    imagem = imagem.filter(ImageFilter.DETAIL)
+
+    # Binariza a imagem
+    return imagem.point(LIMIAR_BINARIZACAO, '1')
+
+def contar_paginas(pdf_path):
+    from pdf2image import pdfinfo_from_path
+
+    return pdfinfo_from_path(str(pdf_path))["Pages"]
+
+def _rasterizar_pagina(pdf_path, numero_pagina, output_dir, dpi):
+    from pdf2image import convert_from_path
+
+    # Renderiza somente esta página, mantendo uma única imagem em memória por processo
+    pagina = convert_from_path(str(pdf_path), dpi=dpi, first_page=numero_pagina, last_page=numero_pagina)[0]
+    imagem_path = Path(output_dir) / f"pagina_{numero_pagina}.png"
+    preprocessar_pagina(pagina).save(imagem_path, 'PNG')
+    pagina.close()
+    return imagem_path
+
+def rasterizar_pdfs(pdfs, dpi=400, max_workers=None, executor=None):
+    """
+    Converte as páginas de vários PDFs em PNGs pré-processados, distribuindo as páginas
+    de todos os documentos em um pool de processos. Cada página é renderizada
+    isoladamente, então o pico de memória é de uma página por processo.
+
+    :param pdfs: Lista de tuplas (caminho_do_pdf, diretório_de_saída).
+    :param dpi: Resolução da renderização.
+    :param max_workers: Número de processos (padrão: número de CPUs).
+    :param executor: ProcessPoolExecutor já aberto a reutilizar (max_workers é ignorado);
+        evita criar um pool novo a cada documento.
+    :return: Dicionário {caminho_do_pdf: lista de PNGs salvos, em ordem de página}.
+    """
+    resultados = {}
+    pool = contextlib.nullcontext(executor) if executor is not None else ProcessPoolExecutor(max_workers=max_workers)
+    with pool as executor:
+        tarefas = {}
+        for pdf_path, output_dir in pdfs:
+            try:
+                total = contar_paginas(pdf_path)
+            except Exception as e:
+                logging.error(f"Erro ao converter {pdf_path} para imagens PNG: {e}")
+                continue
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            resultados[pdf_path] = [None] * total
+            for numero_pagina in range(1, total + 1):
+                futuro = executor.submit(_rasterizar_pagina, pdf_path, numero_pagina, output_dir, dpi)
+                tarefas[futuro] = (pdf_path, numero_pagina)
+
+        for futuro in as_completed(tarefas):
+            pdf_path, numero_pagina = tarefas[futuro]
+            try:
+                imagem_path = futuro.result()
+            except Exception as e:
+                logging.error(f"Erro ao converter a página {numero_pagina} de {pdf_path} para PNG: {e}")
+                continue
+            resultados[pdf_path][numero_pagina - 1] = imagem_path
+            logging.info(f"Página {numero_pagina} salva como {imagem_path}")
+
+    return {pdf_path: [p for p in paginas if p is not None] for pdf_path, paginas in resultados.items()}
+
+def converter_pdf_para_png_com_preprocessamento(pdf_path, output_dir, dpi=400, max_workers=None):
     """
     Converte cada página de um PDF em imagens PNG, aplica pré-processamento para melhorar a qualidade do OCR
-    e salva as imagens em um diretório específico.
+    e salva as imagens em um diretório específico. As páginas são renderizadas uma a uma e
+    processadas em paralelo (ver rasterizar_pdfs).
 
     :param pdf_path: Caminho para o arquivo PDF.
     :param output_dir: Diretório onde as imagens PNG serão salvas.
+    :param dpi: Resolução da renderização.
+    :param max_workers: Número de processos (padrão: número de CPUs).
     """
-    try:
-        # Converte o PDF em uma lista de imagens
-        paginas = convert_from_path(pdf_path, dpi=400)
-        
-        # Cria o diretório de saída se não existir
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        for i, pagina in enumerate(paginas):
-            # Converte para escala de cinza
-            imagem = pagina.convert('L')
-            
-            # Aumenta o contraste
-            enhancer = ImageEnhance.Sharpness(imagem)
-            imagem = enhancer.enhance(1.0)  # Ajuste o fator conforme necessário
-            
-            # Aplica filtro de nitidez
-            imagem = imagem.filter(ImageFilter.DETAIL)
-            
-            # Binariza a imagem
-            imagem = imagem.point(lambda x: 0 if x < 128 else 255, '1')
-            
-            # Salva a imagem processada como PNG
-            imagem_path = output_dir / f"pagina_{i + 1}.png"
-            imagem.save(imagem_path, 'PNG')
-            logging.info(f"Página {i + 1} salva como {imagem_path}")
-    
-    except Exception as e:
-        logging.error(f"Erro ao converter {pdf_path} para imagens PNG: {e}")
+    return rasterizar_pdfs([(pdf_path, output_dir)], dpi=dpi, max_workers=max_workers).get(pdf_path, [])
 
 def json_to_csv(json_file_path, csv_file_path):
     """
@@ -84,6 +234,8 @@ def json_to_csv(json_file_path, csv_file_path):
     :param json_file_path: Caminho para o arquivo JSON.
     :param csv_file_path: Caminho onde o arquivo CSV será salvo.
     """
+    import pandas as pd
+
     try:
         # Carrega os dados do JSON
         with open(json_file_path, 'r', encoding='utf-8') as f:
@@ -103,28 +255,16 @@ def json_to_csv(json_file_path, csv_file_path):
 def json_to_unified_csv(json_dir, unified_csv_path):
     """
     Combina múltiplos arquivos JSON em um diretório em um único arquivo CSV.
+    As colunas seguem o layout fixo do FormDoc e as linhas são escritas em blocos,
+    sem manter todos os registros em memória.
 
     :param json_dir: Diretório contendo os arquivos JSON.
     :param unified_csv_path: Caminho onde o arquivo CSV unificado será salvo.
     """
-    try:
-        # Lista para armazenar cada DataFrame
-        dataframes = []
-
-        # Itera por todos os arquivos .json no diretório especificado
-        for json_file in Path(json_dir).glob("*.json"):
-            with open(json_file, 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
+    from export import StreamingExporter
 
-            # Converte os dados JSON para um DataFrame
-            df = pd.json_normalize(json_data)
-            dataframes.append(df)
-
-        # Concatena todos os DataFrames em um único DataFrame
-        unified_df = pd.concat(dataframes, ignore_index=True)
-
-        # Salva o DataFrame unificado em um arquivo CSV
-        unified_df.to_csv(unified_csv_path, index=False, encoding='utf-8')
+    try:
+        StreamingExporter().export(json_dir, unified_csv_path, fmt="csv")
         logging.info(f"Unified CSV file created at {unified_csv_path}")
 
     except Exception as e:
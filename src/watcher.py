@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from pathlib import Path
+
+def _looks_complete(path):
+    """Um PDF completo termina com o marcador %%EOF (seguido no máximo de espaços/lixo curto)."""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 1024))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+class FolderWatcher:
+    """
+    Observa um diretório por polling (os.scandir, sem ler os arquivos) e informa os PDFs
+    novos ou modificados depois que param de mudar: um arquivo só é entregue quando seu
+    tamanho e mtime ficam iguais por debounce segundos e ele termina com %%EOF, o que
+    evita pegar cópias ou digitalizações ainda em andamento.
+
+    :param directory: Diretório observado.
+    :param debounce: Segundos sem mudança antes de entregar um arquivo.
+    :param pattern: Sufixo dos arquivos observados.
+    """
+
+    def __init__(self, directory, debounce=2.0, pattern=".pdf"):
+        self.directory = Path(directory)
+        self.debounce = debounce
+        self.pattern = pattern
+        self.delivered = {}
+        self.pending = {}
+        self.incomplete = set()
+
+    def _scan(self):
+        signatures = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.name.lower().endswith(self.pattern):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.is_file():
+                    signatures[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def seed(self):
+        """
+        Marca como já entregues os arquivos atuais que parecem completos (sem mudança há
+        debounce segundos e com %%EOF); eles são tratados pelo plano inicial. Os demais, como
+        uma cópia ainda em andamento na partida, seguem pelo poll com a verificação normal.
+
+        :return: Caminhos (Path) dos arquivos marcados.
+        """
+        now = time.time()
+        self.delivered = {}
+        for name, signature in self._scan().items():
+            if now - signature[1] / 1e9 >= self.debounce and _looks_complete(self.directory / name):
+                self.delivered[name] = signature
+        return sorted(self.directory / name for name in self.delivered)
+
+    def poll(self):
+        """Uma varredura; retorna os caminhos (Path) que ficaram estáveis desde a última."""
+        now = time.monotonic()
+        signatures = self._scan()
+        ready = []
+        for name, signature in signatures.items():
+            if self.delivered.get(name) == signature:
+                continue
+            first_seen = self.pending.get(name)
+            if first_seen is None or first_seen[0] != signature:
+                self.pending[name] = (signature, now)
+                continue
+            if now - first_seen[1] < self.debounce:
+                continue
+            path = self.directory / name
+            if not _looks_complete(path):
+                if name not in self.incomplete:
+                    logging.warning(f"{name} is stable but has no %%EOF marker; waiting for it to change")
+                    self.incomplete.add(name)
+                continue
+            del self.pending[name]
+            self.incomplete.discard(name)
+            self.delivered[name] = signature
+            ready.append(path)
+        for name in set(self.delivered) - set(signatures):
+            del self.delivered[name]
+        for name in set(self.pending) - set(signatures):
+            del self.pending[name]
+        return sorted(ready)
+
+async def watch(pipeline, pdf_dir, ledger=None, debounce=2.0, poll_interval=1.0, retry_failed=False,
+                ignore_ledger=False, select=None):
+    """
+    Modo serviço: processa o que estiver pendente em pdf_dir e depois envia ao pipeline
+    (já iniciado) cada PDF novo ou modificado assim que ele termina de ser gravado.
+    Roda até receber SIGINT/SIGTERM; então espera os PDFs em andamento e retorna.
+
+    :param pipeline: Pipeline já iniciado.
+    :param ledger: JobLedger opcional; decide o que é novo, alterado ou já concluído.
+    :param debounce: Segundos sem mudança antes de considerar um PDF completo.
+    :param poll_interval: Intervalo entre varreduras do diretório, em segundos.
+    :param retry_failed: Recoloca na fila inicial os PDFs que falharam antes.
+    :param ignore_ledger: Processa todos os PDFs já presentes, mesmo os concluídos.
+    :param select: Função opcional (lista de Paths -> lista de Paths) que restringe os PDFs
+        tratados por este processo, ex.: os do seu shard.
+    """
+    select = select or (lambda pdf_files: pdf_files)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    watcher = FolderWatcher(pdf_dir, debounce=debounce)
+    # Só os PDFs estáveis entram no plano inicial; os que ainda estão sendo gravados ficam para o poll
+    backlog = select(await asyncio.to_thread(watcher.seed))
+    if ledger is not None and not ignore_ledger:
+        backlog = await asyncio.to_thread(ledger.plan, backlog, retry_failed)
+    for pdf_file in backlog:
+        pipeline.submit(pdf_file)
+    logging.info(f"Watching {pdf_dir} ({len(backlog)} PDF(s) pending at start)")
+
+    while not stop.is_set():
+        ready = select(await asyncio.to_thread(watcher.poll))
+        if ready and ledger is not None:
+            ready = await asyncio.to_thread(ledger.plan, ready)
+        for pdf_file in ready:
+            logging.info(f"Queued {pdf_file.name}")
+            pipeline.submit(pdf_file)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    logging.info("Stopping: waiting for in-flight PDFs")
+    return await pipeline.close()
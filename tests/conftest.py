@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+import pytest
+
+# Os módulos de src/ se importam pelo nome (python src/main.py), como no próprio app
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Diretório de trabalho temporário com o LLM fake e os caches dentro dele."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LLM_BACKEND", "fake")
+    monkeypatch.setenv("OCR_CACHE_DIR", str(tmp_path / "cache" / "ocr"))
+    monkeypatch.setenv("LLM_CACHE_DIR", str(tmp_path / "cache" / "llm"))
+    monkeypatch.setenv("LEDGER_PATH", str(tmp_path / "ledger.db"))
+    monkeypatch.setenv("STORE_PATH", str(tmp_path / "records.db"))
+    return tmp_path
@@ -0,0 +1,48 @@
+import random
+import batch
+import main
+from cache import llm_cache_key
+from dedup import DedupIndex, TEXT
+from ledger import JobLedger, OCR_DONE, STRUCTURED
+from synthetic import render_form_text, synthetic_record
+
+def test_collect_updates_ledger_and_llm_cache(workdir):
+    rng = random.Random(7)
+    (workdir / "scans" / "txt").mkdir(parents=True)
+    texts = {}
+    for name in ("form-1", "form-2"):
+        (workdir / f"{name}.pdf").write_bytes(f"%PDF-1.4 {name}\n%%EOF\n".encode())
+        texts[name] = render_form_text(synthetic_record(rng=rng))
+        (workdir / "scans" / "txt" / f"{name}.txt").write_text(texts[name], encoding="utf-8")
+    ledger = JobLedger(workdir / "ledger.db")
+    ledger.plan(sorted(workdir.glob("*.pdf")))
+    for name in texts:
+        ledger.mark_ocr_done(f"{name}.pdf", 0.0)
+
+    batch.main(["run", "--poll-interval", "0"])
+
+    assert {ledger.stage_of(f"{name}.pdf") for name in texts} == {STRUCTURED}
+    assert OCR_DONE not in ledger.summary()
+    # Uma execução interativa (modo repair, o padrão) encontra as respostas no cache
+    _, _, fingerprint, llm_cache = main.open_llm_stage(main.parse_args(["run"]), main.rate_budget(None))
+    for name, text in texts.items():
+        assert llm_cache.get(llm_cache_key(text, fingerprint)) is not None
+
+def test_batch_structured_pdf_is_an_original_for_duplicates(workdir):
+    rng = random.Random(11)
+    (workdir / "scans" / "txt").mkdir(parents=True)
+    pdf = workdir / "form-1.pdf"
+    pdf.write_bytes(b"%PDF-1.4 form-1\n%%EOF\n")
+    text = render_form_text(synthetic_record(rng=rng))
+    (workdir / "scans" / "txt" / "form-1.txt").write_text(text, encoding="utf-8")
+    ledger = JobLedger(workdir / "ledger.db")
+    ledger.plan([pdf])
+    ledger.mark_ocr_done("form-1.pdf", 0.0)
+
+    batch.main(["run", "--poll-interval", "0", "--no-llm-cache"])
+
+    # Um novo índice, como o da próxima execução de main.py, carrega o documento como original
+    index = DedupIndex(workdir / "ledger.db")
+    assert index.find_exact("copia.pdf", ledger.digest_of("form-1.pdf")) == "form-1.pdf"
+    tokens, registro = index.fingerprint(text)
+    assert index.find_similar("reescaneado.pdf", tokens, registro) == ("form-1.pdf", TEXT)
@@ -0,0 +1,33 @@
+import pytest
+import cache
+import main
+
+@pytest.mark.parametrize("options", [
+    [], ["--no-repair"], ["--sectioned"], ["--compact-schema"], ["--no-repair", "--compact-schema"]
+])
+def test_prune_keeps_the_cache_of_a_run(workdir, options):
+    args = main.parse_args(["run", *options])
+    _, _, fingerprint, llm_cache = main.open_llm_stage(args, main.rate_budget(None))
+    llm_cache.put("key", "{}")
+    stale = cache.open_llm_cache("0" * 64)
+    stale.put("key", "{}")
+
+    cache.main(["prune", "--cache", "llm"])
+
+    assert llm_cache.get("key") == "{}"
+    assert not stale.cache_dir.exists()
+    # prune não cria namespaces vazios para os outros modos
+    assert [p.name for p in cache.llm_cache_root().iterdir()] == [fingerprint[:16]]
+
+def test_fingerprint_covers_rendered_instructions(workdir, monkeypatch):
+    import process
+    import sections
+
+    modes = ["full", "full+compact", "repair", "repair+compact", "sections"]
+    before = {mode: process.structuring_fingerprint(mode) for mode in modes}
+    monkeypatch.setattr(process, "render_compact_schema", lambda model: "outro renderizador")
+    monkeypatch.setattr(sections, "section_format_instructions", lambda section: f"Section: {section.name}")
+    after = {mode: process.structuring_fingerprint(mode) for mode in modes}
+
+    # Compacto muda com o renderizador; repair e sections, com as instruções por seção
+    assert [mode for mode in modes if before[mode] != after[mode]] == modes[1:]
@@ -0,0 +1,42 @@
+import random
+from dedup import DedupIndex, TEXT, value_tokens
+from synthetic import render_form_text, synthetic_record
+
+def readmission(record, rng):
+    """Outra internação da mesma paciente: mesma identificação e dados gerais, outra ficha clínica."""
+    other = synthetic_record(rng=rng)
+    other["identificacao"] = {**record["identificacao"], "data_admissao": other["identificacao"]["data_admissao"]}
+    other["dados_gerais"] = dict(record["dados_gerais"])
+    return other
+
+def rescan(text, rng, noise=0.01):
+    """O mesmo texto com erros de OCR em uma fração dos caracteres."""
+    return "".join(rng.choice("0123456789abcxyz") if c.isalnum() and rng.random() < noise else c for c in text)
+
+def index_with(tmp_path, name, text):
+    index = DedupIndex(tmp_path / "ledger.db")
+    tokens, registro = index.fingerprint(text)
+    index.register(name, "0" * 64, tokens, registro)
+    index.mark_structured(name)
+    return index
+
+def test_label_tokens_are_not_values():
+    text = "telefone1: 81 99999-0000\npeso nascimento menor 1500g: SIM\nsaps3: 42\n(OU PRIMEIRAS 24 HORAS)"
+    assert value_tokens(text) == {"81", "99999", "0000", "42"}
+
+def test_second_admission_is_not_linked(tmp_path):
+    rng = random.Random(3)
+    for i in range(20):
+        first = synthetic_record(rng=rng)
+        second = render_form_text(readmission(first, rng))
+        index = index_with(tmp_path / str(i), "first.pdf", render_form_text(first))
+        tokens, registro = index.fingerprint(second)
+        assert registro == index.registros["first.pdf"]
+        assert index.find_similar("second.pdf", tokens, registro) == (None, None)
+
+def test_rescan_is_linked(tmp_path):
+    rng = random.Random(3)
+    text = render_form_text(synthetic_record(rng=rng))
+    index = index_with(tmp_path, "first.pdf", text)
+    tokens, registro = index.fingerprint(rescan(text, rng))
+    assert index.find_similar("copy.pdf", tokens, registro) == ("first.pdf", TEXT)
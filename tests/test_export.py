@@ -0,0 +1,55 @@
+import csv
+import json
+import pytest
+from export import StreamingExporter
+
+def write_json(json_dir, name, registro):
+    (json_dir / name).write_text(json.dumps({"identificacao": {"registro": registro}}), encoding="utf-8")
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+def renamed_layout(exporter):
+    """Simula um campo renomeado no FormDoc."""
+    exporter.columns = [("identificacao.prontuario" if name == "identificacao.registro" else name, kind)
+                        for name, kind in exporter.columns]
+    exporter.paths = [tuple(name.split(".")) for name, _ in exporter.columns]
+    exporter.header = ["source_file"] + [name for name, _ in exporter.columns]
+    return exporter
+
+def test_incremental_csv_appends_only_new_files(tmp_path):
+    json_dir, output = tmp_path / "json", tmp_path / "unified.csv"
+    json_dir.mkdir()
+    write_json(json_dir, "a.json", "1")
+    assert StreamingExporter().export(json_dir, output, incremental=True) == 1
+    write_json(json_dir, "b.json", "2")
+    assert StreamingExporter().export(json_dir, output, incremental=True) == 1
+    assert [row[0] for row in read_csv(output)[1:]] == ["a.json", "b.json"]
+
+def test_incremental_csv_rewrites_when_columns_change(tmp_path):
+    json_dir, output = tmp_path / "json", tmp_path / "unified.csv"
+    json_dir.mkdir()
+    write_json(json_dir, "a.json", "1")
+    StreamingExporter().export(json_dir, output, incremental=True)
+    write_json(json_dir, "b.json", "2")
+
+    exporter = renamed_layout(StreamingExporter())
+    assert exporter.export(json_dir, output, incremental=True) == 2
+    rows = read_csv(output)
+    assert rows[0] == exporter.header
+    assert [row[0] for row in rows[1:]] == ["a.json", "b.json"]
+
+def test_incremental_parquet_rewrites_when_columns_change(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    json_dir, output = tmp_path / "json", tmp_path / "unified"
+    json_dir.mkdir()
+    write_json(json_dir, "a.json", "1")
+    StreamingExporter().export(json_dir, output, fmt="parquet", incremental=True)
+    write_json(json_dir, "b.json", "2")
+
+    exporter = renamed_layout(StreamingExporter())
+    exporter.export(json_dir, output, fmt="parquet", incremental=True)
+    table = pq.read_table(output)
+    assert table.schema.names == exporter.header
+    assert sorted(table.column("source_file").to_pylist()) == ["a.json", "b.json"]
@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+from bench_import_time import COMMANDS, LLM_MODULES, import_times
+
+# Comandos leves e as dependências pesadas que não podem importar (as mesmas do benchmark)
+@pytest.mark.parametrize("label", ["--help", "status", "export", "extract"])
+def test_command_skips_heavy_imports(tmp_path, label):
+    (tmp_path / "json").mkdir()
+    command, forbidden = COMMANDS[label]
+    modules = import_times(command, tmp_path)
+    assert not {name.split(".")[0] for name in modules} & forbidden
+
+def test_forbidden_sets_cover_the_heavy_stacks():
+    for label in ("status", "export"):
+        assert {"langchain", "pandas", "pdf2image", "PIL", "unstract"} <= COMMANDS[label][1]
+    assert LLM_MODULES <= COMMANDS["extract"][1]
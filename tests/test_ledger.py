@@ -0,0 +1,42 @@
+import os
+from ledger import FAILED, JobLedger, OCR_DONE, PENDING, STRUCTURED
+
+def test_plan_skips_finished_and_requeues_changed(tmp_path):
+    pdfs = []
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        pdf = tmp_path / name
+        pdf.write_bytes(f"%PDF {name}\n%%EOF\n".encode())
+        pdfs.append(pdf)
+    ledger = JobLedger(tmp_path / "ledger.db")
+    assert ledger.plan(pdfs) == pdfs
+    assert ledger.stage_of("a.pdf") == PENDING
+
+    ledger.mark_structured("a.pdf", 1.0)
+    ledger.mark_ocr_done("b.pdf", 1.0)
+    ledger.mark_failed("c.pdf", "ocr", RuntimeError("timeout"))
+    assert ledger.plan(pdfs) == [pdfs[1]]
+    assert ledger.plan(pdfs, retry_failed=True) == pdfs[1:]
+    assert ledger.summary() == {STRUCTURED: 1, OCR_DONE: 1, PENDING: 1}
+
+    # Conteúdo novo recoloca o PDF na fila; só a data nova, não
+    pdfs[0].write_bytes(b"%PDF outra ficha\n%%EOF\n")
+    os.utime(pdfs[1], (1, 1))
+    assert ledger.plan(pdfs) == pdfs
+    assert ledger.stage_of("a.pdf") == PENDING
+    assert ledger.stage_of("b.pdf") == OCR_DONE
+
+def test_known_digest_follows_the_file(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF a\n%%EOF\n")
+    ledger = JobLedger(tmp_path / "ledger.db")
+    ledger.plan([pdf])
+    assert len(ledger.known_digest(pdf)) == 64
+    pdf.write_bytes(b"%PDF a, alterado\n%%EOF\n")
+    assert ledger.known_digest(pdf) is None
+
+def test_failures_keep_stage_and_error(tmp_path):
+    ledger = JobLedger(tmp_path / "ledger.db")
+    ledger.start("a.pdf")
+    ledger.mark_failed("a.pdf", "llm", ValueError("invalid JSON"))
+    assert ledger.stage_of("a.pdf") == FAILED
+    assert ledger.failures() == [("a.pdf", "llm", 1, "invalid JSON")]
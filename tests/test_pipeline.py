@@ -0,0 +1,51 @@
+import asyncio
+import cache
+import ledger as ledger_module
+import pipeline
+from cache import open_ocr_cache
+from dedup import DedupIndex
+from ledger import DUPLICATE, JobLedger, STRUCTURED
+
+def fake_stages(calls):
+    async def extract(path):
+        calls.append(path)
+        await asyncio.sleep(0.05)
+        return f"texto de {path}"
+
+    async def structure(text):
+        return {"texto": text}
+
+    return extract, structure
+
+def test_in_batch_copy_waits_for_the_original_ocr(workdir, monkeypatch):
+    hashed = []
+    sha256_file = cache.sha256_file
+
+    def counting_sha256_file(path, *args, **kwargs):
+        hashed.append(path.name)
+        return sha256_file(path, *args, **kwargs)
+
+    monkeypatch.setattr(ledger_module, "sha256_file", counting_sha256_file)
+    monkeypatch.setattr(pipeline, "sha256_file", counting_sha256_file)
+    monkeypatch.setattr(cache, "sha256_file", counting_sha256_file)
+    for name in ("a.pdf", "b.pdf"):
+        (workdir / name).write_bytes(b"%PDF-1.4 mesma ficha\n%%EOF\n")
+    (workdir / "txt").mkdir()
+    (workdir / "json").mkdir()
+    ledger = JobLedger(workdir / "ledger.db")
+    pdf_files = ledger.plan(sorted(workdir.glob("*.pdf")))
+    dedup = DedupIndex(workdir / "ledger.db")
+    calls = []
+    extract, structure = fake_stages(calls)
+
+    stats = asyncio.run(pipeline.run_batch(
+        pdf_files, workdir / "txt", workdir / "json", extract_fn=extract, structure_fn=structure,
+        ocr_cache=open_ocr_cache(), ledger=ledger, dedup=dedup
+    ))
+
+    assert len(calls) == 1
+    assert (stats.structured, stats.duplicates) == (1, 1)
+    assert sorted(ledger.stage_of(name) for name in ("a.pdf", "b.pdf")) == [DUPLICATE, STRUCTURED]
+    assert dedup.ocr_avoided == 1
+    # Cada PDF é lido para o hash uma única vez (no plan), e não de novo no dedup e no cache de OCR
+    assert sorted(hashed) == ["a.pdf", "b.pdf"]
@@ -0,0 +1,43 @@
+import asyncio
+import time
+from llm_backends import make_fake_chat_model
+from scheduler import RateLimitedScheduler, TokenBucket
+from sections import SectionedExtractor
+
+def test_scheduler_survives_one_event_loop_per_call(workdir):
+    # extract() roda cada documento em um asyncio.run próprio; com concorrência 2 as seções
+    # disputam o limitador e o balde, que não podem ficar presos ao primeiro loop
+    scheduler = RateLimitedScheduler("LLM", rpm=6000, tpm=10_000_000, max_concurrency=2)
+    extractor = SectionedExtractor(chat=make_fake_chat_model(), scheduler=scheduler)
+    for text in ("registro: 1", "registro: 2"):
+        assert isinstance(extractor.extract(text), dict)
+    assert scheduler.calls == 2 * len(extractor.sections)
+
+def test_token_bucket_in_successive_loops():
+    bucket = TokenBucket(per_minute=6000)
+
+    async def drain():
+        # Com o balde vazio, uma espera segura o lock enquanto a outra aguarda por ele
+        bucket.tokens = 0
+        await asyncio.gather(bucket.acquire(1), bucket.acquire(1))
+
+    asyncio.run(drain())
+    asyncio.run(drain())
+
+def test_retry_after_is_capped_by_max_backoff():
+    from llm_backends import FakeLLMError
+
+    scheduler = RateLimitedScheduler("LLM", rpm=60000, max_backoff=0.05)
+    attempts = []
+
+    async def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise FakeLLMError("Simulated rate limit", status_code=429, retry_after=3600)
+        return "ok"
+
+    start = time.monotonic()
+    assert asyncio.run(scheduler.run(call)) == "ok"
+    # Nem a espera da retentativa nem a pausa do balde seguem o Retry-After de uma hora
+    assert time.monotonic() - start < 5
+    assert scheduler.throttled == 1 and scheduler.retries == 1
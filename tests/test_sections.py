@@ -0,0 +1,44 @@
+import asyncio
+import json
+import random
+import pytest
+from langchain_core.messages import AIMessage
+from models import FormDoc
+from sections import EXTRA_SECTION, RepairingExtractor
+from synthetic import synthetic_record
+
+class ScriptedChat:
+    """Chat que devolve as respostas dadas, na ordem das chamadas."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def ainvoke(self, request):
+        self.requests.append(request)
+        return AIMessage(content=json.dumps(self.responses.pop(0), ensure_ascii=False, default=str))
+
+def test_repaired_response_is_returned_when_valid(workdir):
+    record = synthetic_record(FormDoc, random.Random(1))
+    broken = {**record, "oliguria_infeccao": "talvez"}
+    chat = ScriptedChat([broken, {"oliguria_infeccao": True}])
+    extractor = RepairingExtractor(chat=chat)
+
+    result = asyncio.run(extractor.aextract("texto"))
+
+    assert result["oliguria_infeccao"] is True
+    assert len(chat.requests) == 2
+    assert extractor.parse_stats.repaired == 1
+
+def test_repair_that_leaves_the_form_invalid_raises(workdir):
+    # A seção reparada passa na validação dela, mas traz uma chave que sobrescreve outra seção
+    record = synthetic_record(FormDoc, random.Random(1))
+    broken = {**record, "oliguria_infeccao": "talvez"}
+    chat = ScriptedChat([broken, {"oliguria_infeccao": True, "dados_gerais": "ilegível"}])
+    extractor = RepairingExtractor(chat=chat)
+    assert [section.name for section in extractor.invalid_sections(json.dumps(broken, default=str))[1]] == [EXTRA_SECTION]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(extractor.aextract("texto"))
+    assert extractor.parse_stats.unrepaired == 1
+    assert extractor.parse_stats.repaired == 0
@@ -0,0 +1,20 @@
+import pytest
+from shard import parse_shard, select_shard, shard_dir, shard_of
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for value in ("4/4", "-1/4", "0/0", "1", "a/b"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+def test_shards_partition_the_files():
+    names = [f"ficha-{i:04d}.pdf" for i in range(400)]
+    shards = [select_shard(names, index, 4) for index in range(4)]
+    assert sorted(sum(shards, [])) == names
+    # Estável entre processos (não usa o hash() do Python) e razoavelmente equilibrado
+    assert shard_of("ficha-0000.pdf", 4) == shard_of("ficha-0000.pdf", 4)
+    assert all(60 < len(shard) < 140 for shard in shards)
+
+def test_shard_dir_follows_shards_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("SHARDS_DIR", str(tmp_path))
+    assert shard_dir(1, 4) == tmp_path / "1-of-4"
@@ -0,0 +1,54 @@
+import json
+import os
+import pytest
+from store import RecordStore, parse_condition
+
+def record(registro, lactato, choque, idade=None):
+    return {
+        "identificacao": {"registro": registro, "local": "IMIP", "data_admissao": "2024-03-01"},
+        "dados_gerais": {"idade": idade},
+        "parametros_clinicos": {"lactato_sepse": lactato},
+        "complicacoes_clinicas": {"choque_septico": choque},
+    }
+
+def test_parse_condition():
+    assert parse_condition("lactato_sepse > 4") == ("lactato_sepse", ">", "4")
+    assert parse_condition("registro is null") == ("registro", "is null", "")
+    assert parse_condition("local like IM%") == ("local", "like", "IM%")
+    with pytest.raises(ValueError):
+        parse_condition("lactato_sepse")
+
+def test_upsert_and_query(tmp_path):
+    store = RecordStore(tmp_path / "records.db")
+    store.upsert("a.json", record("1", 5.2, "sim", "31"))
+    store.upsert("b.json", record("2", 2.0, False))
+    store.upsert("c.json", record("3", 7.5, True))
+
+    rows = store.query("choque_septico = true", ("lactato_sepse", ">", 4), columns=["registro", "idade"],
+                       order_by="-lactato_sepse")
+    assert rows == [{"source_file": "c.json", "identificacao.registro": "3", "dados_gerais.idade": None},
+                    {"source_file": "a.json", "identificacao.registro": "1", "dados_gerais.idade": 31}]
+    assert store.count("idade is null") == 2
+
+    # upsert substitui o documento
+    store.upsert("a.json", record("1", 1.0, False))
+    assert store.count("lactato_sepse > 4") == 1
+    with pytest.raises(ValueError):
+        store.query("lactato_sepse > muito")
+    with pytest.raises(ValueError):
+        store.query("campo_inexistente = 1")
+
+def test_sync_writes_changed_and_prunes_removed(tmp_path):
+    json_dir = tmp_path / "json"
+    json_dir.mkdir()
+    for name, registro in (("a.json", "1"), ("b.json", "2")):
+        (json_dir / name).write_text(json.dumps(record(registro, 3.0, False)), encoding="utf-8")
+    store = RecordStore(tmp_path / "records.db")
+    assert store.sync(json_dir) == (2, 0)
+    assert store.sync(json_dir) == (0, 0)
+
+    (json_dir / "a.json").write_text(json.dumps(record("1", 9.0, True)), encoding="utf-8")
+    os.utime(json_dir / "a.json", ns=(1, 1))
+    (json_dir / "b.json").unlink()
+    assert store.sync(json_dir) == (1, 1)
+    assert [row["source_file"] for row in store.query("lactato_sepse > 4", columns=["registro"])] == ["a.json"]
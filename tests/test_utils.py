@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+import utils
+
+pytest.importorskip("unstract.llmwhisperer")
+
+class FakeWhisperer:
+    """Cliente que passa pelos estados dados em whisper_status e devolve o texto no fim."""
+
+    def __init__(self, states, result=None):
+        self.states = list(states)
+        self.result = result if result is not None else {"status_code": 200, "extraction": {"result_text": "texto"}}
+        self.polls = 0
+
+    def whisper(self, **kwargs):
+        return {"status_code": 202, "whisper_hash": "abc"}
+
+    def whisper_status(self, whisper_hash):
+        self.polls += 1
+        return {"status_code": 200, "status": self.states.pop(0)}
+
+    def whisper_retrieve(self, whisper_hash):
+        return self.result
+
+def extract_with(monkeypatch, client, wait_timeout=5):
+    import unstract.llmwhisperer
+
+    monkeypatch.setattr(unstract.llmwhisperer, "LLMWhispererClientV2", lambda: client)
+    return asyncio.run(utils.extract_text_from_pdf_async("ficha.pdf", wait_timeout=wait_timeout, poll_interval=0))
+
+def test_keeps_polling_non_terminal_statuses(monkeypatch):
+    client = FakeWhisperer(["accepted", "queued", "processing", "processed"])
+    assert extract_with(monkeypatch, client) == "texto"
+    assert client.polls == 4
+
+@pytest.mark.parametrize("client", [
+    FakeWhisperer(["queued", "failed"]),
+    FakeWhisperer(["unknown"]),
+    FakeWhisperer(["delivered"], result={"status_code": 400, "message": "already delivered"}),
+])
+def test_fails_on_terminal_statuses(monkeypatch, client):
+    with pytest.raises(RuntimeError):
+        extract_with(monkeypatch, client)
+
+def test_deadline_still_applies(monkeypatch):
+    client = FakeWhisperer(["queued"] * 1000)
+    with pytest.raises(RuntimeError, match="timed out"):
+        extract_with(monkeypatch, client, wait_timeout=0)
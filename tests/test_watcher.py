@@ -0,0 +1,23 @@
+import os
+import time
+from watcher import FolderWatcher
+
+def write(path, data, age=None):
+    path.write_bytes(data)
+    if age is not None:
+        when = time.time() - age
+        os.utime(path, (when, when))
+
+def test_seed_leaves_files_still_being_copied_to_poll(tmp_path):
+    write(tmp_path / "pronto.pdf", b"%PDF-1.4\n%%EOF\n", age=60)
+    write(tmp_path / "copiando.pdf", b"%PDF-1.4\nmetade", age=60)
+    write(tmp_path / "recente.pdf", b"%PDF-1.4\n%%EOF\n")
+    watcher = FolderWatcher(tmp_path, debounce=5)
+
+    assert watcher.seed() == [tmp_path / "pronto.pdf"]
+
+    # A cópia termina: o arquivo passa pelo debounce e pela verificação do %%EOF como qualquer outro
+    write(tmp_path / "copiando.pdf", b"%PDF-1.4\nmetade e o resto\n%%EOF\n")
+    watcher.debounce = 0
+    assert watcher.poll() == []
+    assert watcher.poll() == [tmp_path / "copiando.pdf", tmp_path / "recente.pdf"]